@@ -0,0 +1,79 @@
+"""Compare request parsing throughput of the buffered RESP parser against
+the original readline/readexactly loop.
+
+Each run feeds the same pipelined stream of SET/GET commands through
+RemoteDict._handle_request with an in-memory reader and writer, so the
+numbers measure parsing and dispatch only, not the network.
+
+    python benchmarks/parser_benchmark.py --commands 200000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from remotedict import RemoteDict
+
+
+class NullWriter:
+    def write(self, data):
+        pass
+
+    def writelines(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+def build_stream(count, value_size):
+    value = b'x' * value_size
+    chunks = []
+    for i in range(count // 2):
+        key = b'key:%d' % i
+        chunks.append(b'*3\r\n$3\r\nSET\r\n$%d\r\n%s\r\n$%d\r\n%s\r\n' % (len(key), key, len(value), value))
+        chunks.append(b'*2\r\n$3\r\nGET\r\n$%d\r\n%s\r\n' % (len(key), key))
+    return b''.join(chunks)
+
+
+async def run_once(buffered, stream, count):
+    server = RemoteDict(buffered_parser=buffered)
+    reader = asyncio.StreamReader(limit=2 ** 20)
+    reader.feed_data(stream)
+    reader.feed_eof()
+    start = time.perf_counter()
+    await server._handle_request(reader, NullWriter())
+    elapsed = time.perf_counter() - start
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--commands', type=int, default=100000)
+    parser.add_argument('--value-size', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    stream = build_stream(args.commands, args.value_size)
+    results = {}
+    for name, buffered in (('readline loop', False), ('buffered parser', True)):
+        rates = [asyncio.run(run_once(buffered, stream, args.commands)) for _ in range(args.repeat)]
+        results[name] = max(rates)
+        print(f"{name:16s} {results[name]:12,.0f} commands/sec")
+    print(f"speedup          {results['buffered parser'] / results['readline loop']:12.2f}x")
+
+
+if __name__ == '__main__':
+    main()
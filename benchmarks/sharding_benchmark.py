@@ -0,0 +1,94 @@
+"""Measure how GET/SET throughput of ShardedRemoteDict scales with the
+number of worker processes.
+
+For every worker count a fresh sharded server is started and driven by the
+same number of client processes, each sending pipelined batches of random
+GET/SET commands over its own connection for a fixed duration.
+
+    python benchmarks/sharding_benchmark.py --workers 1,2,4,8 --clients 16
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from remotedict import RemoteDict, ShardedRemoteDict
+from remotedict.resp import ReplyParser, encode_command
+
+
+def run_client(port, duration, pipeline, keyspace, value_size, set_ratio, results):
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    rnd = random.Random()
+    value = b'x' * value_size
+    parser = ReplyParser()
+    ops = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        batch = []
+        for _ in range(pipeline):
+            key = b'key:%d' % rnd.randrange(keyspace)
+            if rnd.random() < set_ratio:
+                batch.append(encode_command([b'SET', key, value]))
+            else:
+                batch.append(encode_command([b'GET', key]))
+        sock.sendall(b''.join(batch))
+        received = 0
+        while received < pipeline:
+            data = sock.recv(262144)
+            if not data:
+                raise ConnectionError('server closed the connection')
+            parser.feed(data)
+            received += len(parser.parse(raw=True))
+        ops += pipeline
+    sock.close()
+    results.put(ops)
+
+
+def measure(workers, args):
+    server = ShardedRemoteDict(port=args.port, workers=workers, dict_class=RemoteDict, binary=True)
+    server.start_workers()
+    try:
+        ctx = multiprocessing.get_context('spawn')
+        results = ctx.Queue()
+        clients = [ctx.Process(target=run_client, args=(args.port, args.duration, args.pipeline, args.keyspace,
+                                                         args.value_size, args.set_ratio, results))
+                   for _ in range(args.clients)]
+        for client in clients:
+            client.start()
+        total = sum(results.get(timeout=args.duration + 60) for _ in clients)
+        for client in clients:
+            client.join()
+    finally:
+        server.stop_workers()
+    return total / args.duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4,8', help='comma separated worker counts')
+    parser.add_argument('--clients', type=int, default=16, help='client processes per run')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per run')
+    parser.add_argument('--pipeline', type=int, default=16)
+    parser.add_argument('--keyspace', type=int, default=100000)
+    parser.add_argument('--value-size', type=int, default=64)
+    parser.add_argument('--set-ratio', type=float, default=0.2)
+    parser.add_argument('--port', type=int, default=8400)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.clients} clients, pipeline {args.pipeline}, "
+          f"{int(args.set_ratio * 100)}% SET")
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(',')]:
+        rate = measure(workers, args)
+        baseline = baseline or rate
+        print(f"workers={workers:<3d} {rate:12,.0f} ops/sec   scaling {rate / baseline:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,10 @@ setup(
     package_dir={"": "src"},
     python_requires=">=3.7",
     install_requires=[],
+    extras_require={"uvloop": ["uvloop"]},
+    entry_points={
+        "console_scripts": ["remotedict-benchmark=remotedict.benchmark:main"],
+    },
     license="MIT",
     classifiers=[
         "Programming Language :: Python :: 3",
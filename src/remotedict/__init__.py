@@ -3,6 +3,7 @@ from .remotedict import RemoteDict
 from .expiring_remotedict import ExpiringRemoteDict
 from .persistent_remotedict import PersistentExpiringRemoteDict
 from .persistent_remotedict import PersistentRemoteDict
+from .sharded_remotedict import ShardedRemoteDict
 
 
 version = "0.1.0"
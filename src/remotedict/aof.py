@@ -0,0 +1,213 @@
+import asyncio
+import os
+from .resp import RequestParser, encode_command
+
+FSYNC_POLICIES = ('always', 'everysec', 'no')
+
+
+class AppendOnlyFile:
+    """Append-only log of write commands, stored as RESP arrays.
+
+    fsync selects the durability policy:
+      'always'   - write and fsync before append() returns
+      'everysec' - group commit: appends are written once per loop
+                   iteration and fsync'd together every fsync_interval_ms
+      'no'       - appends are written once per loop iteration and the OS
+                   decides when to flush them
+
+    snapshot() must return an iterable of commands that recreates the
+    current dataset; it is called on the event loop and consumed on a
+    worker thread when the log is rewritten.
+    """
+
+    def __init__(self, filename, snapshot, fsync='everysec', fsync_interval_ms=1000,
+                 rewrite_min_size=64 * 1024 * 1024, rewrite_percentage=100):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {', '.join(FSYNC_POLICIES)}")
+        self._filename = filename
+        self._snapshot = snapshot
+        self._fsync = fsync
+        self._fsync_interval = fsync_interval_ms / 1000
+        self._rewrite_min_size = rewrite_min_size
+        self._rewrite_percentage = rewrite_percentage
+        self._file = None
+        self._size = 0
+        self._base_size = 0  # Size right after the last rewrite
+        self._valid_size = None  # Length of the intact prefix found by replay()
+        self._pending = []  # Encoded commands not yet written to the file
+        self._write_scheduled = False
+        self._unsynced = False
+        self._rewrite_buf = None  # Commands appended while a rewrite is running
+        self._rewrite_task = None
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def base_size(self):
+        return self._base_size
+
+    @property
+    def fsync(self):
+        return self._fsync
+
+    @property
+    def rewrite_in_progress(self):
+        return self._rewrite_task is not None
+
+    def exists(self):
+        return os.path.exists(self._filename)
+
+    def replay(self):
+        """Yield the commands stored in the log, oldest first.
+
+        A partial command at the end of the file (a crash in the middle of
+        a write) is skipped and cut off when the log is next opened.
+        """
+        parser = RequestParser()
+        total = 0
+        with open(self._filename, 'rb') as f:
+            while True:
+                chunk = f.read(1024 * 1024)
+                if not chunk:
+                    break
+                total += len(chunk)
+                parser.feed(chunk)
+                for args in parser.parse():
+                    yield args
+        self._valid_size = total - len(parser)
+
+    def open(self):
+        self._file = open(self._filename, 'ab')
+        if self._valid_size is not None and self._valid_size < self._file.tell():
+            self._file.truncate(self._valid_size)
+            self._file.seek(self._valid_size)
+        self._size = self._base_size = self._file.tell()
+
+    def append(self, args):
+        data = encode_command(args)
+        if self._rewrite_buf is not None:
+            self._rewrite_buf.append(data)
+        self._pending.append(data)
+        if self._fsync == 'always':
+            self._write()
+            os.fsync(self._file.fileno())
+            return
+        if not self._write_scheduled:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self._write()
+                return
+            # Everything appended during this loop iteration goes out in one write
+            self._write_scheduled = True
+            loop.call_soon(self._write)
+
+    def _write(self):
+        self._write_scheduled = False
+        if self._pending:
+            data = b''.join(self._pending)
+            self._pending = []
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+            self._unsynced = True
+
+    def needs_rewrite(self):
+        return (self._rewrite_task is None and self._size >= self._rewrite_min_size and
+                self._size >= self._base_size * (1 + self._rewrite_percentage / 100))
+
+    async def run(self):
+        """Periodic group commit and automatic rewrite; runs until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self._fsync_interval)
+            self._write()
+            if self._fsync == 'everysec' and self._unsynced:
+                self._unsynced = False
+                # fsync a duplicate descriptor so a concurrent rewrite can
+                # swap files without closing the one being synced
+                fd = os.dup(self._file.fileno())
+                await loop.run_in_executor(None, _fsync_and_close, fd)
+            if self.needs_rewrite():
+                self.start_rewrite()
+
+    def start_rewrite(self):
+        if self._rewrite_task is None:
+            self._rewrite_task = asyncio.ensure_future(self.rewrite())
+        return self._rewrite_task
+
+    async def rewrite(self):
+        """Rewrite the log from a snapshot on a worker thread.
+
+        Commands appended while the snapshot is written are buffered and
+        added to the new file before it atomically replaces the old one.
+        """
+        loop = asyncio.get_running_loop()
+        temp = self._filename + '.rewrite'
+        self._write()
+        commands = self._snapshot()
+        self._rewrite_buf = []
+        try:
+            await loop.run_in_executor(None, _write_commands, temp, commands)
+            # Back on the loop: no command can run until the swap is done.
+            # Flush what is pending to the old file first, or the commands
+            # in both it and the rewrite buffer would reach the new one twice
+            self._write()
+            with open(temp, 'ab') as f:
+                f.write(b''.join(self._rewrite_buf))
+                f.flush()
+                os.fsync(f.fileno())
+            self._swap(temp)
+        finally:
+            self._rewrite_buf = None
+            self._rewrite_task = None
+
+    def rewrite_now(self):
+        """Synchronous rewrite, used before the server starts."""
+        if self._file is not None:
+            self._write()
+        temp = self._filename + '.rewrite'
+        _write_commands(temp, self._snapshot())
+        self._swap(temp)
+
+    def _swap(self, temp):
+        os.replace(temp, self._filename)
+        old = self._file
+        self._valid_size = None
+        self.open()
+        if old is not None:
+            old.close()
+
+    def close(self):
+        if self._file is not None:
+            self._write()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+
+def _fsync_and_close(fd):
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_commands(filename, commands):
+    with open(filename, 'wb') as f:
+        batch = []
+        for args in commands:
+            batch.append(encode_command(args))
+            if len(batch) >= 1000:
+                f.write(b''.join(batch))
+                batch = []
+        f.write(b''.join(batch))
+        f.flush()
+        os.fsync(f.fileno())
@@ -0,0 +1,444 @@
+"""Load generator for RemoteDict servers, in the spirit of redis-benchmark.
+
+Starts the selected server class in its own process (or targets a running
+server with --server none), drives it from several client processes, each
+holding a share of the connections and sending pipelined batches drawn
+from the command mix, and reports throughput and latency percentiles.
+
+    remotedict-benchmark --server expiring --clients 50 --pipeline 16 --mix get=80,set=20
+    remotedict-benchmark --server persistent -o appendonly=true --tests get,set,mset --json
+    remotedict-benchmark --json > new.json && remotedict-benchmark --baseline old.json
+    remotedict-benchmark -o event_loop=uvloop --unix-socket /tmp/remotedict.sock
+    remotedict-benchmark --compare-clients
+
+Latency is measured per command, from the moment its batch is written to
+the moment its reply is read, so it includes the time spent waiting behind
+the rest of the pipeline.
+
+--compare-clients measures clients rather than the server: the CPU time
+the benchmark process spends per GET and SET with remotedict.client and,
+if it is installed, redis-py, one command at a time and (asyncio) in
+batches of concurrent awaits.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+from .netconfig import EVENT_LOOPS, new_event_loop
+from .resp import ReplyParser, encode_command
+
+SERVERS = {
+    'remotedict': 'RemoteDict',
+    'expiring': 'ExpiringRemoteDict',
+    'persistent': 'PersistentRemoteDict',
+    'persistent-expiring': 'PersistentExpiringRemoteDict',
+}
+
+# Keys sent by MGET/MSET
+_MULTI_KEYS = 10
+
+
+def _key(rnd, keyspace):
+    return b'key:%012d' % rnd.randrange(keyspace)
+
+
+def _get(rnd, keyspace, value):
+    return [b'GET', _key(rnd, keyspace)]
+
+
+def _set(rnd, keyspace, value):
+    return [b'SET', _key(rnd, keyspace), value]
+
+
+def _mget(rnd, keyspace, value):
+    return [b'MGET'] + [_key(rnd, keyspace) for _ in range(_MULTI_KEYS)]
+
+
+def _mset(rnd, keyspace, value):
+    args = [b'MSET']
+    for _ in range(_MULTI_KEYS):
+        args += [_key(rnd, keyspace), value]
+    return args
+
+
+def _exists(rnd, keyspace, value):
+    return [b'EXISTS', _key(rnd, keyspace)]
+
+
+def _del(rnd, keyspace, value):
+    return [b'DEL', _key(rnd, keyspace)]
+
+
+def _incr(rnd, keyspace, value):
+    # Own keyspace: the prefilled string values are not integers
+    return [b'INCR', b'counter:%012d' % rnd.randrange(keyspace)]
+
+
+COMMANDS = {
+    'get': _get,
+    'set': _set,
+    'mget': _mget,
+    'mset': _mset,
+    'exists': _exists,
+    'del': _del,
+    'incr': _incr,
+}
+
+
+def parse_mix(text):
+    """'get=80,set=20' -> {'get': 80.0, 'set': 20.0}; a bare name weighs 1."""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.strip().partition('=')
+        name = name.lower()
+        if name not in COMMANDS:
+            raise argparse.ArgumentTypeError(f"unknown command {name!r}, choose from {', '.join(COMMANDS)}")
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+def parse_options(pairs):
+    """['appendonly=true', 'save=[[60, 1000]]'] -> constructor keyword arguments.
+    Values are read as JSON where possible, and as strings otherwise."""
+    options = {}
+    for pair in pairs:
+        name, sep, value = pair.partition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError(f'server option {pair!r} must look like name=value')
+        try:
+            options[name] = json.loads(value)
+        except ValueError:
+            options[name] = value
+    return options
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def _run_server(class_name, host, port, options, ready, stop):
+    import remotedict
+    sys.stdout = sys.stderr  # Keep the server's messages out of a JSON report
+    server = getattr(remotedict, class_name)(host, port, **options)
+    server.start_thread()
+    ready.set()
+    stop.wait()
+    server.stop_thread()
+
+
+async def _connection(endpoint, start_at, stop_at, pipeline, mix, keyspace, value, result):
+    # endpoint is a (host, port) pair or the path of a Unix socket
+    if isinstance(endpoint, str):
+        reader, writer = await asyncio.open_unix_connection(endpoint)
+    else:
+        reader, writer = await asyncio.open_connection(*endpoint)
+    rnd = random.Random()
+    generators = [COMMANDS[name] for name in mix]
+    weights = list(mix.values())
+    parser = ReplyParser()
+    latencies = result['latencies']
+    await asyncio.sleep(max(0.0, start_at - time.time()))
+    try:
+        while time.time() < stop_at:
+            commands = rnd.choices(generators, weights, k=pipeline)
+            writer.write(b''.join(encode_command(make(rnd, keyspace, value)) for make in commands))
+            sent = time.perf_counter_ns()
+            received = 0
+            while received < pipeline:
+                data = await reader.read(262144)
+                if not data:
+                    raise ConnectionError('server closed the connection')
+                parser.feed(data)
+                replies = parser.parse(raw=True)
+                elapsed = (time.perf_counter_ns() - sent) // 1000
+                latencies.extend([elapsed] * len(replies))
+                result['errors'] += sum(1 for reply in replies if reply[:1] == b'-')
+                received += len(replies)
+            result['ops'] += pipeline
+    finally:
+        writer.close()
+
+
+def _run_clients(endpoint, event_loop, connections, start_at, stop_at, pipeline, mix, keyspace, value_size,
+                 results):
+    result = {'ops': 0, 'errors': 0, 'latencies': []}
+    value = b'x' * value_size
+
+    async def main():
+        await asyncio.gather(*[_connection(endpoint, start_at, stop_at, pipeline, mix, keyspace, value, result)
+                               for _ in range(connections)])
+
+    loop = new_event_loop(event_loop)
+    try:
+        loop.run_until_complete(main())
+    finally:
+        loop.close()
+    results.put(result)
+
+
+def prefill(endpoint, keyspace, value_size, batch=1000):
+    """SET every key of the keyspace so GETs hit."""
+    value = b'x' * value_size
+    if isinstance(endpoint, str):
+        sock = socket.socket(socket.AF_UNIX)
+        sock.connect(endpoint)
+    else:
+        sock = socket.create_connection(endpoint)
+    parser = ReplyParser()
+    try:
+        for start in range(0, keyspace, batch):
+            count = min(batch, keyspace - start)
+            args = [b'MSET']
+            for i in range(start, start + count):
+                args += [b'key:%012d' % i, value]
+            sock.sendall(encode_command(args))
+            while not parser.parse(raw=True):
+                data = sock.recv(65536)
+                if not data:
+                    raise ConnectionError('server closed the connection')
+                parser.feed(data)
+    finally:
+        sock.close()
+
+
+def _measure(requests, func):
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    func()
+    return {
+        'cpu_usec': (time.process_time() - cpu) / requests * 1e6,
+        'wall_usec': (time.perf_counter() - wall) / requests * 1e6,
+    }
+
+
+def compare_clients(endpoint, requests, keyspace, value_size, batch=100):
+    """CPU and wall time per request of each client library, as rows of
+    (client, mode, command, measurements)."""
+    from . import client as native
+    try:
+        import redis
+        import redis.asyncio
+    except ImportError:
+        redis = None
+    rnd = random.Random(0)
+    keys = [b'key:%012d' % rnd.randrange(keyspace) for _ in range(requests)]
+    value = b'x' * value_size
+    if isinstance(endpoint, str):
+        native_kwargs = {'unix_socket': endpoint}
+        redis_kwargs = {'unix_socket_path': endpoint}
+    else:
+        native_kwargs = redis_kwargs = {'host': endpoint[0], 'port': endpoint[1]}
+    sync_clients = [('remotedict', native.Client(**native_kwargs))]
+    async_clients = [('remotedict', lambda: native.AsyncClient(**native_kwargs))]
+    if redis is not None:
+        sync_clients.append(('redis-py', redis.Redis(**redis_kwargs)))
+        async_clients.append(('redis-py', lambda: redis.asyncio.Redis(max_connections=batch, **redis_kwargs)))
+    rows = []
+    for name, sync_client in sync_clients:
+        sync_client.get(keys[0])  # Connect
+        rows.append((name, 'sync', 'get', _measure(requests, lambda: [sync_client.get(key) for key in keys])))
+        rows.append((name, 'sync', 'set', _measure(requests, lambda: [sync_client.set(key, value) for key in keys])))
+        sync_client.close()
+
+    async def gather(async_client, command):
+        for start in range(0, requests, batch):
+            chunk = keys[start:start + batch]
+            if command == 'get':
+                await asyncio.gather(*[async_client.get(key) for key in chunk])
+            else:
+                await asyncio.gather(*[async_client.set(key, value) for key in chunk])
+
+    for name, make in async_clients:
+        loop = asyncio.new_event_loop()
+        try:
+            async_client = make()
+            loop.run_until_complete(async_client.get(keys[0]))
+            for command in ('get', 'set'):
+                rows.append((name, f'asyncio x{batch}', command,
+                             _measure(requests, lambda: loop.run_until_complete(gather(async_client, command)))))
+            loop.run_until_complete(async_client.aclose() if hasattr(async_client, 'aclose')
+                                    else async_client.close())
+        finally:
+            loop.close()
+    return rows
+
+
+def run(args, mix, ctx):
+    """One measurement: returns the result dict reported for it."""
+    processes = max(1, min(args.processes, args.clients))
+    shares = [args.clients // processes + (1 if i < args.clients % processes else 0) for i in range(processes)]
+    start_at = time.time() + 0.5 + 0.1 * processes
+    stop_at = start_at + args.duration
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_run_clients, daemon=True,
+                           args=(_endpoint(args), args.client_event_loop, share, start_at, stop_at, args.pipeline,
+                                 mix, args.keyspace, args.data_size, results))
+               for share in shares]
+    for worker in workers:
+        worker.start()
+    collected = [results.get(timeout=args.duration + 60) for _ in workers]
+    for worker in workers:
+        worker.join()
+    ops = sum(result['ops'] for result in collected)
+    latencies = sorted(latency for result in collected for latency in result['latencies'])
+    return {
+        'mix': mix,
+        'ops': ops,
+        'errors': sum(result['errors'] for result in collected),
+        'ops_per_sec': ops / args.duration,
+        'latency_usec': {
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+            'p999': percentile(latencies, 0.999),
+            'max': latencies[-1] if latencies else 0,
+            'mean': sum(latencies) / len(latencies) if latencies else 0,
+        },
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Regressions of report against a baseline report, as messages; runs
+    are matched by their command mix."""
+    problems = []
+    previous = {json.dumps(run['mix'], sort_keys=True): run for run in baseline['runs']}
+    for run in report['runs']:
+        old = previous.get(json.dumps(run['mix'], sort_keys=True))
+        if old is None:
+            continue
+        name = _mix_name(run['mix'])
+        if run['ops_per_sec'] < old['ops_per_sec'] * (1 - tolerance / 100):
+            problems.append(f"{name}: {run['ops_per_sec']:,.0f} ops/sec, baseline {old['ops_per_sec']:,.0f}")
+        if run['latency_usec']['p99'] > old['latency_usec']['p99'] * (1 + tolerance / 100):
+            problems.append(f"{name}: p99 {run['latency_usec']['p99']} usec, baseline {old['latency_usec']['p99']}")
+    return problems
+
+
+def _endpoint(args):
+    return args.unix_socket or (args.host, args.port)
+
+
+def _mix_name(mix):
+    return ','.join(name if len(mix) == 1 else f'{name}={weight:g}' for name, weight in mix.items())
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='remotedict-benchmark', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=list(SERVERS) + ['none'], default='remotedict',
+                        help="server class to start, or 'none' to use a server already running on --host/--port")
+    parser.add_argument('-o', '--server-option', action='append', default=[], metavar='NAME=VALUE',
+                        help='constructor argument for the server, e.g. binary=true or appendonly=true')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8500)
+    parser.add_argument('-s', '--unix-socket', metavar='PATH',
+                        help='connect over this Unix socket instead of TCP (the started server listens on both)')
+    parser.add_argument('--client-event-loop', choices=EVENT_LOOPS, default='asyncio',
+                        help="event loop of the client processes; the server's is set with -o event_loop=...")
+    parser.add_argument('-c', '--clients', type=int, default=50, help='connections in total')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help='client processes the connections are spread over')
+    parser.add_argument('-P', '--pipeline', type=int, default=1, help='commands sent per batch')
+    parser.add_argument('-d', '--data-size', type=int, default=64, help='value size in bytes')
+    parser.add_argument('-r', '--keyspace', type=int, default=10000, help='number of distinct keys')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per run')
+    parser.add_argument('--mix', type=parse_mix, default='get=80,set=20',
+                        help=f"weighted command mix out of {', '.join(COMMANDS)}")
+    parser.add_argument('-t', '--tests', help='comma separated commands to benchmark one at a time, instead of --mix')
+    parser.add_argument('--no-prefill', action='store_true', help='do not SET the whole keyspace before running')
+    parser.add_argument('--compare-clients', action='store_true',
+                        help='measure the CPU time per request of remotedict.client and redis-py instead')
+    parser.add_argument('-n', '--requests', type=int, default=20000, help='requests per --compare-clients run')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--baseline', help='JSON report to compare with; exits with status 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=10.0,
+                        help='allowed regression against --baseline, in percent')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    mixes = [parse_mix(name) for name in args.tests.split(',')] if args.tests else [args.mix]
+    ctx = multiprocessing.get_context('spawn')
+    options = parse_options(args.server_option)
+    workdir = None
+    server = stop = None
+    if args.server != 'none':
+        if args.server.startswith('persistent') and 'filename' not in options:
+            workdir = tempfile.mkdtemp(prefix='remotedict-benchmark-')
+            options['filename'] = os.path.join(workdir, 'benchmark.json')
+        if args.unix_socket:
+            options.setdefault('unix_socket', args.unix_socket)
+        ready, stop = ctx.Event(), ctx.Event()
+        server = ctx.Process(target=_run_server, daemon=True,
+                             args=(SERVERS[args.server], args.host, args.port, options, ready, stop))
+        server.start()
+        if not ready.wait(30):
+            raise RuntimeError('benchmark server failed to start')
+    try:
+        if not args.no_prefill:
+            prefill(_endpoint(args), args.keyspace, args.data_size)
+        runs = []
+        client_runs = []
+        if args.compare_clients:
+            mixes = []
+            for name, mode, command, result in compare_clients(_endpoint(args), args.requests, args.keyspace,
+                                                               args.data_size):
+                client_runs.append({'client': name, 'mode': mode, 'command': command, **result})
+                if not args.json:
+                    print(f"{name:<12} {mode:<12} {command:<4} {result['cpu_usec']:8.1f} usec CPU/request   "
+                          f"{result['wall_usec']:8.1f} usec/request")
+        for mix in mixes:
+            result = run(args, mix, ctx)
+            runs.append(result)
+            if not args.json:
+                latency = result['latency_usec']
+                print(f"{_mix_name(mix):<20} {result['ops_per_sec']:12,.0f} ops/sec   "
+                      f"p50 {latency['p50'] / 1000:7.3f} ms   p99 {latency['p99'] / 1000:7.3f} ms   "
+                      f"p999 {latency['p999'] / 1000:7.3f} ms   errors {result['errors']}")
+    finally:
+        if server is not None:
+            stop.set()
+            server.join(10)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    report = {
+        'server': args.server,
+        'server_options': options if workdir is None else {k: v for k, v in options.items() if k != 'filename'},
+        'transport': 'unix' if args.unix_socket else 'tcp',
+        'client_event_loop': args.client_event_loop,
+        'clients': args.clients,
+        'processes': max(1, min(args.processes, args.clients)),
+        'pipeline': args.pipeline,
+        'data_size': args.data_size,
+        'keyspace': args.keyspace,
+        'duration': args.duration,
+        'python_version': sys.version.split()[0],
+        'cpu_count': os.cpu_count(),
+        'timestamp': int(time.time()),
+        'runs': runs,
+    }
+    if client_runs:
+        report['client_runs'] = client_runs
+    if args.json:
+        print(json.dumps(report, indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(report, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f'regression: {problem}', file=sys.stderr)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
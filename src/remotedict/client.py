@@ -0,0 +1,633 @@
+"""Native clients for RemoteDict servers, without redis-py.
+
+Client is for threads: each command borrows a connection from a pool,
+sends the command and reads its reply. AsyncClient is for asyncio: the
+commands of every task that are issued in the same iteration of the event
+loop are written to one connection with a single write, so awaiting many
+commands concurrently (e.g. with asyncio.gather) pipelines them without an
+explicit pipeline.
+
+    client = Client(port=6379)
+    client.mset({'a': 1, 'b': 2})
+    client.mget(['a', 'b'])                      # [b'1', b'2']
+
+    client = AsyncClient(port=6379)
+    await asyncio.gather(*[client.get(key) for key in keys])  # One write
+
+Replies are bytes for strings (str with decode=True), int for integers,
+lists for arrays and None for nulls; error replies raise resp.ReplyError.
+
+With cache_size=N, either client keeps the replies to its last N distinct
+GETs in an LRU cache and answers repeated GETs from it. The server is asked
+for invalidations (CLIENT TRACKING ON) and pushes one whenever a key this
+client read changes, which drops the key from the cache; the client also
+drops the keys of its own writes as their replies arrive. Replies read
+before a change and served after it are possible only for as long as the
+invalidation takes to arrive.
+"""
+import asyncio
+import collections
+import functools
+import select
+import socket
+import threading
+from .resp import CRLF, Push, ReplyError, ReplyParser, bulk_header, encode_arg
+
+_MISSING = object()
+
+# Commands that change no key, for which a caching client drops nothing
+_READ_COMMANDS = frozenset([b'GET', b'MGET', b'EXISTS', b'TTL', b'PTTL', b'STRLEN', b'TYPE', b'HGET', b'HMGET',
+                            b'HGETALL', b'HLEN', b'HEXISTS', b'HKEYS', b'HVALS', b'KEYS', b'SCAN', b'DBSIZE',
+                            b'INFO', b'CLIENT', b'COMMAND', b'CONFIG', b'SLOWLOG', b'LATENCY', b'MEMORY'])
+
+
+def pack_command(args):
+    """Encode a command whose arguments may be bytes, str or numbers."""
+    out = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if type(arg) is not bytes:
+            arg = encode_arg(arg)
+        out += (bulk_header(len(arg)), arg, CRLF)
+    return b''.join(out)
+
+
+def _ok(reply):
+    return reply == b'OK'
+
+
+def _ok_or_none(reply):
+    # SET NX/XX replies with a null when the condition fails
+    return True if reply == b'OK' else None
+
+
+def _pairs(reply):
+    return dict(zip(reply[::2], reply[1::2]))
+
+
+def _written_keys(args):
+    """Keys that a command may change, as bytes; None for all of them."""
+    name = encode_arg(args[0]).upper()
+    if name in (b'FLUSHDB', b'FLUSHALL'):
+        return None
+    if name in (b'MSET', b'MSETNX'):
+        keys = args[1::2]
+    elif name in (b'DEL', b'UNLINK'):
+        keys = args[1:]
+    elif name in _READ_COMMANDS:
+        return ()
+    else:
+        keys = args[1:2]
+    return [key if type(key) is bytes else encode_arg(key) for key in keys]
+
+
+def _decode(reply):
+    if type(reply) is bytes:
+        return reply.decode('utf-8', 'surrogateescape')
+    if type(reply) is list:
+        return [_decode(item) for item in reply]
+    return reply
+
+
+class _Commands:
+    """Helpers for the common commands, shared by Client and AsyncClient.
+    Each builds the arguments and hands them to _command() with the
+    function that turns the reply into the value returned, if any."""
+
+    def get(self, key):
+        return self._command(('GET', key))
+
+    def set(self, key, value, ex=None, px=None, nx=False, xx=False):
+        """SET key value; True, or None if NX/XX stopped it."""
+        args = ['SET', key, value]
+        if ex is not None:
+            args += ['EX', ex]
+        if px is not None:
+            args += ['PX', px]
+        if nx:
+            args.append('NX')
+        if xx:
+            args.append('XX')
+        return self._command(args, _ok_or_none)
+
+    def mget(self, keys):
+        return self._command(['MGET'] + list(keys))
+
+    def mset(self, mapping):
+        args = ['MSET']
+        for key, value in mapping.items():
+            args += (key, value)
+        return self._command(args, _ok)
+
+    def delete(self, *keys):
+        return self._command(('DEL',) + keys)
+
+    def exists(self, *keys):
+        return self._command(('EXISTS',) + keys)
+
+    def incr(self, key, amount=1):
+        return self._command(('INCRBY', key, amount))
+
+    def expire(self, key, seconds):
+        return self._command(('EXPIRE', key, seconds), bool)
+
+    def ttl(self, key):
+        return self._command(('TTL', key))
+
+    def hget(self, key, field):
+        return self._command(('HGET', key, field))
+
+    def hset(self, key, mapping):
+        args = ['HSET', key]
+        for field, value in mapping.items():
+            args += (field, value)
+        return self._command(args)
+
+    def hgetall(self, key):
+        return self._command(('HGETALL', key), _pairs)
+
+
+class _LocalCache:
+    """LRU cache of GET replies, keyed by the key as bytes."""
+
+    def __init__(self, size):
+        self._size = size
+        self._replies = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._replies)
+
+    def get(self, key):
+        """Cached reply for key, or _MISSING."""
+        with self._lock:
+            reply = self._replies.get(key, _MISSING)
+            if reply is not _MISSING:
+                self._replies.move_to_end(key)
+            return reply
+
+    def store(self, key, reply):
+        if type(reply) is ReplyError:
+            return
+        with self._lock:
+            self._replies[key] = reply
+            self._replies.move_to_end(key)
+            if len(self._replies) > self._size:
+                self._replies.popitem(last=False)
+
+    def forget(self, keys):
+        """Drop keys, or everything for None."""
+        with self._lock:
+            if keys is None:
+                self._replies.clear()
+                return
+            for key in keys:
+                self._replies.pop(key, None)
+
+    def invalidate(self, push):
+        # ['invalidate', [key, ...]], or ['invalidate', None] after a flush
+        if len(push) == 2 and push[0] == b'invalidate':
+            self.forget(push[1])
+
+    def clear(self):
+        self.forget(None)
+
+
+class Connection:
+    """A blocking connection, used by one thread at a time."""
+
+    def __init__(self, host='127.0.0.1', port=6379, unix_socket=None, timeout=None):
+        if unix_socket:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            sock.connect(unix_socket)
+        else:
+            sock = socket.create_connection((host, port), timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._parser = ReplyParser()
+
+    def request(self, data, count=1):
+        """Send data, the encoding of count commands, and return their replies."""
+        self._sock.sendall(data)
+        parser = self._parser
+        replies = []
+        while True:
+            chunk = self._sock.recv(262144)
+            if not chunk:
+                raise ConnectionError('server closed the connection')
+            parser.feed(chunk)
+            replies += parser.parse()
+            if len(replies) >= count:
+                return replies
+
+    def close(self):
+        self._sock.close()
+
+
+class _TrackingConnection(Connection):
+    """The connection a caching Client reads through. Invalidations pushed
+    by the server are set aside in pushes, for the client to apply once the
+    replies read with them are cached."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.pushes = []
+        if self.request(pack_command(('CLIENT', 'TRACKING', 'ON'))) != [b'OK']:
+            self.close()
+            raise ConnectionError('the server does not support CLIENT TRACKING')
+
+    def request(self, data, count=1):
+        self._sock.sendall(data)
+        replies = []
+        while len(replies) < count:
+            self._receive(replies)
+        return replies
+
+    def poll(self):
+        """Read, without waiting, whatever the server has sent."""
+        replies = []
+        while select.select([self._sock], [], [], 0)[0]:
+            self._receive(replies)
+
+    def _receive(self, replies):
+        chunk = self._sock.recv(262144)
+        if not chunk:
+            raise ConnectionError('server closed the connection')
+        self._parser.feed(chunk)
+        for reply in self._parser.parse():
+            if type(reply) is Push:
+                self.pushes.append(reply)
+            else:
+                replies.append(reply)
+
+
+class ConnectionPool:
+    """Idle connections shared by the threads of a Client.
+
+    A thread takes an idle connection, or opens one, for each command or
+    pipeline and puts it back afterwards; max_connections (None for no
+    limit) makes threads wait for one once that many are open. A connection
+    that fails is closed rather than put back.
+    """
+
+    def __init__(self, max_connections=None, **connection_kwargs):
+        self._connection_kwargs = connection_kwargs
+        self._idle = collections.deque()  # append() and pop() are atomic: no lock
+        self._slots = threading.BoundedSemaphore(max_connections) if max_connections else None
+
+    def acquire(self):
+        if self._slots is not None:
+            self._slots.acquire()
+        try:
+            return self._idle.pop()
+        except IndexError:
+            pass
+        try:
+            return Connection(**self._connection_kwargs)
+        except BaseException:
+            if self._slots is not None:
+                self._slots.release()
+            raise
+
+    def release(self, connection, failed=False):
+        if failed:
+            connection.close()
+        else:
+            self._idle.append(connection)
+        if self._slots is not None:
+            self._slots.release()
+
+    def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+class Client(_Commands):
+    """Thread-safe client; see the module docstring."""
+
+    def __init__(self, host='127.0.0.1', port=6379, unix_socket=None, timeout=None, max_connections=None,
+                 decode=False, cache_size=None):
+        self._pool = ConnectionPool(max_connections, host=host, port=port, unix_socket=unix_socket, timeout=timeout)
+        self._decode = decode
+        # GETs that miss the cache go through one tracking connection, which
+        # cached GETs check for invalidations before answering
+        self._cache = _LocalCache(cache_size) if cache_size else None
+        self._tracking = None
+        self._tracking_lock = threading.Lock()
+
+    def _request(self, data, count):
+        pool = self._pool
+        connection = pool.acquire()
+        try:
+            replies = connection.request(data, count)
+        except BaseException:
+            pool.release(connection, failed=True)
+            raise
+        pool.release(connection)
+        return replies
+
+    def _command(self, args, callback=None):
+        reply, = self._request(pack_command(args), 1)
+        if self._cache is not None:
+            self._cache.forget(_written_keys(args))
+        if type(reply) is ReplyError:
+            raise reply
+        if self._decode:
+            reply = _decode(reply)
+        return reply if callback is None else callback(reply)
+
+    def get(self, key):
+        if self._cache is None:
+            return self._command(('GET', key))
+        if type(key) is not bytes:
+            key = encode_arg(key)
+        self._poll_invalidations()
+        reply = self._cache.get(key)
+        if reply is _MISSING:
+            reply = self._tracked_get(key)
+        if type(reply) is ReplyError:
+            raise reply
+        return _decode(reply) if self._decode else reply
+
+    def _tracked_get(self, key):
+        with self._tracking_lock:
+            try:
+                if self._tracking is None:
+                    self._tracking = _TrackingConnection(**self._pool._connection_kwargs)
+                reply, = self._tracking.request(pack_command(('GET', key)))
+                self._cache.store(key, reply)
+                self._apply_pushes()
+            except BaseException:
+                self._drop_tracking()
+                raise
+            return reply
+
+    def _poll_invalidations(self):
+        if self._tracking is None or not self._tracking_lock.acquire(blocking=False):
+            return  # The thread holding the lock applies them
+        try:
+            self._tracking.poll()
+            self._apply_pushes()
+        except OSError:
+            self._drop_tracking()
+        finally:
+            self._tracking_lock.release()
+
+    def _apply_pushes(self):
+        pushes = self._tracking.pushes
+        while pushes:
+            self._cache.invalidate(pushes.pop(0))
+
+    def _drop_tracking(self):
+        # Invalidations may have been missed: nothing cached can be trusted
+        if self._tracking is not None:
+            self._tracking.close()
+            self._tracking = None
+        self._cache.clear()
+
+    def execute_command(self, *args):
+        return self._command(args)
+
+    def pipeline(self):
+        """Commands queued on the pipeline are sent with one write by
+        execute(), which returns their replies."""
+        return Pipeline(self)
+
+    def close(self):
+        self._pool.close()
+        if self._tracking is not None:
+            with self._tracking_lock:
+                self._drop_tracking()
+
+
+class Pipeline(_Commands):
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+        self._callbacks = []
+        self._written = []
+
+    def _command(self, args, callback=None):
+        self._commands.append(pack_command(args))
+        self._callbacks.append(callback)
+        if self._client._cache is not None:
+            self._written.append(_written_keys(args))
+        return self
+
+    def execute_command(self, *args):
+        return self._command(args)
+
+    def execute(self, raise_on_error=True):
+        """Replies of the queued commands, in order. Error replies are
+        raised (the first of them), or returned with raise_on_error=False."""
+        if not self._commands:
+            return []
+        replies = self._client._request(b''.join(self._commands), len(self._commands))
+        callbacks = self._callbacks
+        self._commands = []
+        self._callbacks = []
+        for keys in self._written:
+            self._client._cache.forget(keys)
+        self._written = []
+        results = []
+        for reply, callback in zip(replies, callbacks):
+            if type(reply) is ReplyError:
+                if raise_on_error:
+                    raise reply
+            else:
+                if self._client._decode:
+                    reply = _decode(reply)
+                if callback is not None:
+                    reply = callback(reply)
+            results.append(reply)
+        return results
+
+
+class _ReplyProtocol(asyncio.Protocol):
+    """One connection of an AsyncClient. Replies are parsed as soon as they
+    arrive, in data_received(), and complete the futures of the commands
+    in the order the commands were written. A waiter may be a (future,
+    action) pair, action being called with the reply before the future
+    completes; pushes from the server are passed to on_push."""
+
+    def __init__(self, on_lost, on_push):
+        self.transport = None
+        self.closed = False
+        self._on_lost = on_lost
+        self._on_push = on_push
+        self._parser = ReplyParser()
+        self._waiters = collections.deque()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        sock = transport.get_extra_info('socket')
+        if sock is not None and sock.family != socket.AF_UNIX:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def data_received(self, data):
+        parser = self._parser
+        parser.feed(data)
+        waiters = self._waiters
+        for reply in parser.parse():
+            if type(reply) is Push:
+                self._on_push(reply)
+                continue
+            future = waiters.popleft()
+            if type(future) is tuple:
+                future, action = future
+                action(reply)
+            if not future.done():
+                if type(reply) is ReplyError:
+                    future.set_exception(reply)
+                else:
+                    future.set_result(reply)
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self._on_lost(self)
+        while self._waiters:
+            future = self._waiters.popleft()
+            if type(future) is tuple:
+                future = future[0]
+            if not future.done():
+                future.set_exception(ConnectionError('connection to the server lost'))
+
+    def send(self, data, futures):
+        self._waiters += futures
+        self.transport.write(data)
+
+
+class AsyncClient(_Commands):
+    """asyncio client with automatic pipelining; see the module docstring.
+
+    Commands are queued until the event loop next runs its callbacks, then
+    written with one write to one of max_connections connections, taken in
+    turn. Since replies come back in order on each connection, a single
+    connection is enough for most uses: more only spread very large batches.
+    Connections are opened by connect() or on the first command; once all
+    of them are lost, the next command opens new ones. Commands waiting for
+    a reply on a lost connection raise ConnectionError, and the cache, if
+    any, is cleared.
+    """
+
+    def __init__(self, host='127.0.0.1', port=6379, unix_socket=None, max_connections=1, decode=False,
+                 cache_size=None):
+        self._host = host
+        self._port = port
+        self._unix_socket = unix_socket
+        self._max_connections = max_connections
+        self._decode = decode
+        self._connections = []
+        self._next = 0
+        self._connecting = None
+        self._batch = []
+        self._batch_futures = []
+        self._loop = None
+        self._cache = _LocalCache(cache_size) if cache_size else None
+
+    async def connect(self):
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future(self._open())
+        connecting = self._connecting
+        try:
+            # Shielded: one caller being cancelled must not fail the others
+            await asyncio.shield(connecting)
+        finally:
+            if self._connecting is connecting and connecting.done():
+                self._connecting = None
+
+    async def _open(self):
+        loop = self._loop = asyncio.get_running_loop()
+        while len(self._connections) < self._max_connections:
+            if self._unix_socket:
+                _, protocol = await loop.create_unix_connection(self._new_protocol, self._unix_socket)
+            else:
+                _, protocol = await loop.create_connection(self._new_protocol, self._host, self._port)
+            if self._cache is not None:
+                # Before any command can be sent on it
+                tracking = loop.create_future()
+                protocol.send(pack_command(('CLIENT', 'TRACKING', 'ON')), [tracking])
+                try:
+                    await tracking
+                except BaseException:
+                    protocol.transport.close()
+                    raise
+            self._connections.append(protocol)
+
+    def _new_protocol(self):
+        return _ReplyProtocol(self._lost, self._pushed)
+
+    def _lost(self, connection):
+        if connection in self._connections:
+            self._connections.remove(connection)
+        if self._cache is not None:
+            self._cache.clear()
+
+    def _pushed(self, push):
+        if self._cache is not None:
+            self._cache.invalidate(push)
+
+    def _queue(self, data, action=None):
+        future = self._loop.create_future()
+        if not self._batch:
+            self._loop.call_soon(self._flush)
+        self._batch.append(data)
+        self._batch_futures.append(future if action is None else (future, action))
+        return future
+
+    def _flush(self):
+        batch, futures = self._batch, self._batch_futures
+        self._batch = []
+        self._batch_futures = []
+        connections = self._connections
+        if connections:
+            self._next = (self._next + 1) % len(connections)
+            connections[self._next].send(b''.join(batch), futures)
+            return
+        for future in futures:
+            if type(future) is tuple:
+                future = future[0]
+            if not future.done():
+                future.set_exception(ConnectionError('connection to the server lost'))
+
+    def _command(self, args, callback=None):
+        if self._connections and callback is None and not self._decode and self._cache is None:
+            # The future itself: no coroutine to create and run per command
+            return self._queue(pack_command(args))
+        return self._command_async(args, callback)
+
+    async def _command_async(self, args, callback, action=None):
+        if not self._connections:
+            await self.connect()
+        if action is None and self._cache is not None:
+            action = functools.partial(_forget_written, self._cache, _written_keys(args))
+        reply = await self._queue(pack_command(args), action)
+        if self._decode:
+            reply = _decode(reply)
+        return reply if callback is None else callback(reply)
+
+    def get(self, key):
+        if self._cache is None:
+            return self._command(('GET', key))
+        return self._cached_get(encode_arg(key) if type(key) is not bytes else key)
+
+    async def _cached_get(self, key):
+        reply = self._cache.get(key)
+        if reply is _MISSING:
+            # Cached in data_received(), ahead of any invalidation read after it
+            return await self._command_async(('GET', key), None, functools.partial(self._cache.store, key))
+        return _decode(reply) if self._decode else reply
+
+    def execute_command(self, *args):
+        return self._command(args)
+
+    async def close(self):
+        for connection in self._connections:
+            connection.transport.close()
+        self._connections = []
+        if self._cache is not None:
+            self._cache.clear()
+
+
+def _forget_written(cache, keys, reply):
+    cache.forget(keys)
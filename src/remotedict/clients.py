@@ -0,0 +1,74 @@
+import time
+
+
+def _format_addr(addr):
+    if isinstance(addr, tuple):
+        return f'{addr[0]}:{addr[1]}'
+    # Unix socket: the path (empty on the connecting side), as Redis shows it
+    return f'{addr or ""}:0'
+
+
+class Client:
+    """A client connection, as shown by CLIENT LIST.
+
+    last_interaction is time.monotonic() of the last read from the client;
+    soft_limit_since is when its output buffer went over the soft limit
+    (None while it is under). replica is set (to a replication.Replica) once
+    the client announces itself as a replica. tracking is set by CLIENT
+    TRACKING ON. channels and patterns hold what it is subscribed to, as
+    bytes.
+    """
+    __slots__ = ('id', 'writer', 'addr', 'laddr', 'fd', 'name', 'lib_name', 'lib_ver', 'created',
+                 'last_interaction', 'last_command', 'soft_limit_since', 'killed', 'replica', 'tracking',
+                 'channels', 'patterns')
+
+    def __init__(self, client_id, writer):
+        self.id = client_id
+        self.writer = writer
+        self.addr = _format_addr(writer.get_extra_info('peername'))
+        self.laddr = _format_addr(writer.get_extra_info('sockname'))
+        sock = writer.get_extra_info('socket')
+        self.fd = sock.fileno() if sock is not None else -1
+        self.name = ''
+        self.lib_name = ''
+        self.lib_ver = ''
+        self.created = self.last_interaction = time.monotonic()
+        self.last_command = 'NULL'
+        self.soft_limit_since = None
+        self.killed = False
+        self.replica = None
+        self.tracking = False
+        self.channels = set()
+        self.patterns = set()
+
+    def output_buffer_size(self):
+        """Bytes of replies written but not yet sent to the client."""
+        transport = getattr(self.writer, 'transport', None)
+        return transport.get_write_buffer_size() if transport is not None else 0
+
+    def kill(self, abort=False):
+        """Disconnect the client: close() sends what is buffered first,
+        abort() drops it and frees the memory at once."""
+        self.killed = True
+        transport = getattr(self.writer, 'transport', None)
+        if transport is not None:
+            if abort:
+                transport.abort()
+            else:
+                transport.close()
+
+    def info(self, now):
+        """The CLIENT LIST line, with Redis' fields; those for features this
+        server does not have (MULTI, sharded pub/sub, ...) are constant."""
+        command = self.last_command
+        if isinstance(command, bytes):
+            command = command.decode(errors='replace')
+        omem = self.output_buffer_size()
+        flags = ''.join(flag for flag, on in (('S', self.replica is not None), ('P', self.channels or self.patterns),
+                                              ('t', self.tracking)) if on) or 'N'
+        return (f'id={self.id} addr={self.addr} laddr={self.laddr} fd={self.fd} name={self.name} '
+                f'age={int(now - self.created)} idle={int(now - self.last_interaction)} '
+                f'flags={flags} db=0 sub={len(self.channels)} psub={len(self.patterns)} '
+                f'ssub=0 multi=-1 watch=0 qbuf=0 qbuf-free=0 argv-mem=0 multi-mem=0 '
+                f'rbs=0 rbp=0 obl=0 oll=0 omem={omem} tot-mem={omem} events=r cmd={command.lower()} '
+                f'user=default redir=-1 resp=2 lib-name={self.lib_name} lib-ver={self.lib_ver}')
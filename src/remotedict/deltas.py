@@ -0,0 +1,95 @@
+import glob
+import json
+import os
+
+
+class DeltaFiles:
+    """Numbered files of changes made since the base snapshot was written.
+
+    Each flush appends one record, a line of JSON, to the newest file
+    (prefix.1, prefix.2, ...). Records hold the state keys were left in
+    (their value and deadline, or their deletion), not the commands that
+    got them there, so a key written many times between two flushes is
+    written once, and replaying a record that the base snapshot already
+    includes changes nothing.
+
+    Compaction rotate()s to a new file, writes the base snapshot, then
+    remove()s the files before the rotation, whose changes the snapshot
+    now holds. A server that is restarted opens a new file rather than
+    appending to one that may end with a partial record.
+    """
+
+    def __init__(self, prefix):
+        self._prefix = prefix
+        self._file = None
+        self._number = 0
+        self._size = 0  # Bytes in all the files, since the last compaction
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def count(self):
+        return len(self._paths())
+
+    def _paths(self, last=None):
+        """Paths of the files, oldest first; with last, only up to that number."""
+        numbered = []
+        for path in glob.glob(glob.escape(self._prefix) + '.*'):
+            suffix = path[len(self._prefix) + 1:]
+            if suffix.isdigit() and (last is None or int(suffix) <= last):
+                numbered.append((int(suffix), path))
+        return [path for _, path in sorted(numbered)]
+
+    def replay(self):
+        """Yield the records of all the files, oldest first. A partial
+        record at the end of a file (a crash in the middle of a write) is
+        skipped."""
+        for path in self._paths():
+            with open(path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    yield json.loads(line)
+
+    def open(self):
+        paths = self._paths()
+        self._number = int(paths[-1][len(self._prefix) + 1:]) if paths else 0
+        self._size = sum(os.path.getsize(path) for path in paths)
+        self._open_next()
+
+    def _open_next(self):
+        self._number += 1
+        self._file = open(f'{self._prefix}.{self._number}', 'ab')
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def append(self, line):
+        """Write one record (bytes ending with a newline). The caller
+        fsyncs, off the event loop."""
+        self._file.write(line)
+        self._file.flush()
+        self._size += len(line)
+
+    def rotate(self):
+        """Start a new file; returns the paths of the older ones."""
+        old = self._paths(self._number)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._open_next()
+        return old
+
+    def remove(self, paths):
+        for path in paths:
+            self._size -= os.path.getsize(path)
+            os.remove(path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
@@ -0,0 +1,111 @@
+import random
+from collections import OrderedDict
+
+POLICIES = ('noeviction', 'allkeys-lru', 'allkeys-lfu', 'volatile-ttl')
+
+# LFU counters are logarithmic, as in Redis: they saturate at LFU_MAX and new
+# keys start at LFU_INIT so they are not evicted before they can be read.
+LFU_MAX = 255
+LFU_INIT = 5
+
+
+class LRUPolicy:
+    """Keys in access order; the least recently used one is evicted first.
+
+    touch(), remove() and victim() are all O(1).
+    """
+
+    def __init__(self):
+        self._order = OrderedDict()
+
+    def touch(self, key):
+        try:
+            self._order.move_to_end(key)
+        except KeyError:
+            self._order[key] = None
+
+    def remove(self, key):
+        self._order.pop(key, None)
+
+    def clear(self):
+        self._order.clear()
+
+    def victim(self):
+        return next(iter(self._order), None)
+
+
+class LFUPolicy:
+    """Keys bucketed by an approximate access counter; the least frequently
+    used one is evicted first, the least recently used one among equals.
+
+    touch() and remove() are O(1); victim() is O(1) unless the lowest bucket
+    emptied since the last call, then it scans the (at most LFU_MAX) buckets.
+    """
+
+    def __init__(self, log_factor=10):
+        self._log_factor = log_factor
+        self._counts = {}
+        self._buckets = {}  # counter -> keys with that counter, oldest access first
+        self._min = LFU_INIT
+
+    def _increment(self, count):
+        if count >= LFU_MAX:
+            return count
+        base = max(count - LFU_INIT, 0)
+        if random.random() < 1.0 / (base * self._log_factor + 1):
+            return count + 1
+        return count
+
+    def _unlink(self, key, count):
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+
+    def touch(self, key):
+        count = self._counts.get(key)
+        if count is None:
+            new = LFU_INIT
+        else:
+            new = self._increment(count)
+            if new == count:
+                self._buckets[count].move_to_end(key)
+                return
+            self._unlink(key, count)
+        self._counts[key] = new
+        bucket = self._buckets.get(new)
+        if bucket is None:
+            bucket = self._buckets[new] = OrderedDict()
+        bucket[key] = None
+        if new < self._min:
+            self._min = new
+
+    def remove(self, key):
+        count = self._counts.pop(key, None)
+        if count is not None:
+            self._unlink(key, count)
+
+    def clear(self):
+        self._counts.clear()
+        self._buckets.clear()
+        self._min = LFU_INIT
+
+    def victim(self):
+        if not self._counts:
+            return None
+        bucket = self._buckets.get(self._min)
+        if bucket is None:
+            self._min = min(self._buckets)
+            bucket = self._buckets[self._min]
+        return next(iter(bucket))
+
+
+def make_policy(name):
+    """Tracking structure for an allkeys-* policy, None for the others."""
+    if name not in POLICIES:
+        raise ValueError(f"maxmemory_policy must be one of {', '.join(POLICIES)}")
+    if name == 'allkeys-lru':
+        return LRUPolicy()
+    if name == 'allkeys-lfu':
+        return LFUPolicy()
+    return None
@@ -1,29 +1,217 @@
-from .remotedict import RemoteDict
+from .remotedict import RemoteDict, _MISSING, _expire_deadline, _token, command
+from .resp import integer
+from .snapshot import _to_bytes
+import asyncio
+import heapq
 import time
 
 class ExpiringRemoteDict(RemoteDict):
-    def __init__(self, address="127.0.0.1", port=6379, expiry_seconds=3600):
-        super().__init__(address, port)
+    def __init__(self, address="127.0.0.1", port=6379, expiry_seconds=3600, active_expire=True, expire_hz=10,
+                 expire_budget_ms=25, **kwargs):
+        super().__init__(address, port, **kwargs)
         self._expiry_seconds = expiry_seconds # Default expiry time in seconds
         self._expiry = {}  # key: expiry_timestamp
+        # Active expiration: a min-heap of (deadline, key) is drained expire_hz
+        # times a second for at most expire_budget_ms, so keys that are never
+        # read again are still reclaimed. Entries whose deadline no longer
+        # matches _expiry are stale and skipped.
+        self._active_expire = active_expire
+        # volatile-ttl eviction picks the nearest deadline from the heap too
+        self._index_deadlines = active_expire or self._maxmemory_policy == 'volatile-ttl'
+        self._expire_interval = 1 / expire_hz
+        self._expire_budget = expire_budget_ms / 1000
+        self._expiry_heap = []
+        self._expire_task = None
+        self._expired_keys = 0
+        self._expire_cycles = 0
+        self._expire_cycle_time = 0.0
+
+    async def start(self):
+        await super().start()
+        if self._index_deadlines:
+            # Keys loaded from disk are not in the heap yet
+            self._rebuild_expiry_heap()
+        if self._active_expire:
+            self._expire_task = asyncio.create_task(self._run_active_expire())
+
+    async def stop(self):
+        if self._expire_task:
+            self._expire_task.cancel()
+            self._expire_task = None
+        await super().stop()
+
+    @command('expire', 3, ('write', 'fast'), 1, 1, 1)
+    @command('pexpire', 3, ('write', 'fast'), 1, 1, 1)
+    @command('expireat', 3, ('write', 'fast'), 1, 1, 1)
+    @command('pexpireat', 3, ('write', 'fast'), 1, 1, 1)
+    def _cmd_expire(self, args, out):
+        name = _token(args[0])
+        deadline = _expire_deadline(args[2], name.startswith('P'), not name.endswith('AT'), name.lower())
+        out.append(integer(self._expire(args[1], deadline)))
+
+    @command('ttl', 2, ('readonly', 'fast'), 1, 1, 1)
+    @command('pttl', 2, ('readonly', 'fast'), 1, 1, 1)
+    def _cmd_ttl(self, args, out):
+        ttl = self._pttl(args[1])
+        if _token(args[0]) == 'TTL' and ttl > 0:
+            ttl = (ttl + 500) // 1000
+        out.append(integer(ttl))
+
+    @command('persist', 2, ('write', 'fast'), 1, 1, 1)
+    def _cmd_persist(self, args, out):
+        out.append(integer(self._persist(args[1])))
 
     def _set(self, key, value):
-        super()._set(key, value)
+        # Keys set without an explicit expiry fall back to the global default
         if self._expiry_seconds == 0:
-            self._expiry[key] = None  # None means no expiry
+            self._set_with_expiry(key, value, None)  # None means no expiry
         else:
-            self._expiry[key] = time.time() + self._expiry_seconds
+            self._set_with_expiry(key, value, time.time() + self._expiry_seconds)
 
-    def _get(self, key):
+    def _set_with_expiry(self, key, value, expire_at):
+        super()._set(key, value)
+        if self._expiry.get(key, _MISSING) == expire_at:
+            # Same deadline (a counter being incremented): already in the heap
+            return
+        self._expiry[key] = expire_at
+        if expire_at is not None and self._index_deadlines:
+            heapq.heappush(self._expiry_heap, (expire_at, key))
+
+    def _replace(self, key, value):
+        # Callers have just read key, so if it is present it has not expired
+        if key in self._data:
+            self._set_with_expiry(key, value, self._expiry.get(key))
+        else:
+            self._set(key, value)
+
+    def _set_expiry(self, key, expire_at):
+        self._expiry[key] = expire_at
+        if expire_at is not None and self._index_deadlines:
+            heapq.heappush(self._expiry_heap, (expire_at, key))
+
+    def _expire_if_needed(self, key):
+        """Remove key if its deadline has passed. Returns True if it expired."""
+        expiry = self._expiry.get(key)
+        if expiry is not None and time.time() > expiry:
+            self._remove_expired(key)
+            return True
+        return False
+
+    def _remove_expired(self, key):
+        self._discard(key)
+        self._expiry.pop(key, None)
+        self._expired_keys += 1
+        if self._notify_kinds:
+            self._notify('x', b'expired', key)
+        if self._replicas:
+            # Replicas drop the key when the primary does
+            self._propagate([b'DEL', _to_bytes(key)])
+
+    def _rebuild_expiry_heap(self):
+        self._expiry_heap = [(deadline, key) for key, deadline in self._expiry.items() if deadline is not None]
+        heapq.heapify(self._expiry_heap)
+
+    async def _run_active_expire(self):
+        while True:
+            await asyncio.sleep(self._expire_interval)
+            self._expire_cycle()
+
+    def _expire_cycle(self):
+        """Remove keys whose deadline has passed, oldest first, until none
+        are left or the time budget is spent."""
+        start = time.perf_counter()
+        stop_at = start + self._expire_budget
         now = time.time()
+        heap = self._expiry_heap
+        expiry = self._expiry
+        popped = 0
+        while heap and heap[0][0] < now:
+            deadline, key = heapq.heappop(heap)
+            if expiry.get(key) == deadline:
+                self._remove_expired(key)
+            popped += 1
+            if popped % 64 == 0 and time.perf_counter() >= stop_at:
+                break
+        if len(heap) > 2 * len(expiry) + 1024:
+            # Mostly stale entries left behind by overwritten deadlines
+            self._rebuild_expiry_heap()
+        self._expire_cycles += 1
+        self._expire_cycle_time += time.perf_counter() - start
+
+    def _eviction_victim(self):
+        if self._maxmemory_policy != 'volatile-ttl':
+            return super()._eviction_victim()
+        # Key with the nearest deadline; keys without one are never evicted
+        heap = self._expiry_heap
+        while heap:
+            deadline, key = heap[0]
+            if self._expiry.get(key) == deadline:
+                return key
+            heapq.heappop(heap)
+        return None
+
+    def _info(self):
+        sections = super()._info()
+        info = self.expire_info()
+        sections['stats'].update({
+            'expired_keys': info['expired_keys'],
+            'expire_cycles': info['expire_cycles'],
+            'expire_cycle_cpu_milliseconds': int(info['expire_cycle_time'] * 1000),
+        })
+        if self._data:
+            sections['keyspace']['db0'] = f"keys={len(self._data)},expires={info['expires']}"
+        return sections
+
+    def expire_info(self):
+        """Counters of the expiration of keys, lazy and active."""
+        return {
+            'expires': sum(1 for deadline in self._expiry.values() if deadline is not None),
+            'expired_keys': self._expired_keys,
+            'expire_cycles': self._expire_cycles,
+            'expire_cycle_time': self._expire_cycle_time,
+        }
+
+    def _expire(self, key, deadline):
+        if self._expire_if_needed(key) or key not in self._data:
+            return 0
+        if deadline <= time.time():
+            # A deadline in the past deletes the key, as in Redis
+            self._del([key])
+        else:
+            self._set_expiry(key, deadline)
+        return 1
+
+    def _persist(self, key):
+        if self._expire_if_needed(key) or self._expiry.get(key) is None:
+            return 0
+        self._set_expiry(key, None)
+        return 1
+
+    def _pttl(self, key):
+        """Milliseconds left before key expires, -1 if it never does and -2
+        if it does not exist."""
+        if self._expire_if_needed(key) or key not in self._data:
+            return -2
         expiry = self._expiry.get(key)
-        if expiry is not None and expiry is not None and now > expiry:
-            # Expired, remove
-            self._data.pop(key, None)
-            self._expiry.pop(key, None)
+        if expiry is None:
+            return -1
+        return max(0, int((expiry - time.time()) * 1000))
+
+    def _get(self, key):
+        if self._expire_if_needed(key):
             return None
         return super()._get(key)
 
+    def _mget(self, keys):
+        for key in keys:
+            self._expire_if_needed(key)
+        return super()._mget(keys)
+
+    def _exists(self, keys):
+        for key in keys:
+            self._expire_if_needed(key)
+        return super()._exists(keys)
+
     def _del(self, keys):
         count = super()._del(keys)
         for key in keys:
@@ -33,14 +221,22 @@ class ExpiringRemoteDict(RemoteDict):
     def _flushdb(self):
         super()._flushdb()
         self._expiry.clear()
+        self._expiry_heap = []
 
     def _flushall(self):
         super()._flushall()
         self._expiry.clear()
+        self._expiry_heap = []
+
+    def _snapshot_view(self):
+        return {'data': self._data_view(), 'expiry': dict(self._expiry)}
+
+    def _load_entries(self, data, expiry):
+        for key, value in data.items():
+            self._set_with_expiry(key, value, expiry.get(key))
 
-    def _keys(self, pattern):
+    def _live_keys(self, keys):
         # Only return non-expired keys
         now = time.time()
-        valid_keys = [k for k in self._data.keys() if (self._expiry.get(k) is None or self._expiry.get(k, 0) > now)]
-        import fnmatch
-        return [k for k in valid_keys if fnmatch.fnmatch(k, pattern)]
+        expiry = self._expiry
+        return [k for k in keys if (expiry.get(k) or now) >= now]
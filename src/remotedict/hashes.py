@@ -0,0 +1,123 @@
+import sys
+
+# A small hash is stored as a flat tuple (field1, value1, field2, value2,
+# ...): one object with two slots per field, where even an empty dict costs
+# a few hundred bytes, which adds up over millions of small records. Lookups
+# scan the fields, which for a few dozen of them is about as fast as
+# hashing. Writes build a new tuple, so a snapshot being written on another
+# thread never sees one change. A hash that grows past max_entries fields,
+# or gets a field or value longer than max_value, is converted to a dict
+# for good, as Redis converts a listpack to a hashtable.
+TYPES = (tuple, dict)
+
+_MISSING = object()
+
+
+def is_hash(value):
+    return value.__class__ in TYPES
+
+
+def encoding(h):
+    """Name of the encoding of h, as OBJECT ENCODING reports it."""
+    return 'listpack' if type(h) is tuple else 'hashtable'
+
+
+def get(h, field):
+    if type(h) is dict:
+        return h.get(field)
+    try:
+        return h[h[::2].index(field) * 2 + 1]
+    except ValueError:
+        return None
+
+
+def length(h):
+    return len(h) if type(h) is dict else len(h) // 2
+
+
+def flat(h):
+    """Fields and values, alternating, as HGETALL replies with them."""
+    if type(h) is dict:
+        return [item for pair in h.items() for item in pair]
+    return h
+
+
+def _too_long(item, max_value):
+    return type(item) is not int and len(item) > max_value
+
+
+def set_fields(h, pairs, max_entries, max_value):
+    """Set (field, value) pairs in h, or in a new hash if h is None.
+
+    Returns the hash, which is a new tuple unless it is (or has just been
+    converted to) a dict, and the number of fields that were added.
+    """
+    if h is not None and type(h) is dict:
+        added = 0
+        for field, value in pairs:
+            if field not in h:
+                added += 1
+            h[field] = value
+        return h, added
+    items = list(h or ())
+    fields = items[::2]
+    added = 0
+    for field, value in pairs:
+        try:
+            items[fields.index(field) * 2 + 1] = value
+        except ValueError:
+            fields.append(field)
+            items += (field, value)
+            added += 1
+    if len(fields) > max_entries or any(_too_long(item, max_value) for pair in pairs for item in pair):
+        return dict(zip(fields, items[1::2])), added
+    return tuple(items), added
+
+
+def delete_fields(h, fields):
+    """Remove fields from h. Returns the hash, or None once it is empty,
+    and the number of fields that were removed."""
+    removed = 0
+    if type(h) is dict:
+        for field in fields:
+            if h.pop(field, _MISSING) is not _MISSING:
+                removed += 1
+        return h or None, removed
+    items = list(h)
+    for field in fields:
+        try:
+            i = items[::2].index(field) * 2
+        except ValueError:
+            continue
+        del items[i:i + 2]
+        removed += 1
+    return tuple(items) or None, removed
+
+
+def encode(value, max_entries, max_value):
+    """A hash read from a snapshot, as a flat sequence or a dict, in the
+    encoding its size calls for."""
+    if type(value) is dict:
+        items = [item for pair in value.items() for item in pair]
+    else:
+        items = value
+    if len(items) > 2 * max_entries or any(_too_long(item, max_value) for item in items):
+        return value if type(value) is dict else dict(zip(items[::2], items[1::2]))
+    return tuple(items)
+
+
+def sizeof(h):
+    """Estimated memory of h and its fields and values."""
+    return sys.getsizeof(h) + sum(sys.getsizeof(item) for item in (h if type(h) is tuple else flat(h)))
+
+
+def fields_size(h, fields):
+    """Estimated memory of the container of h and the given fields of it,
+    before and after a write, to account for the write without walking
+    the whole hash."""
+    size = sys.getsizeof(h)
+    for field in fields:
+        value = get(h, field)
+        if value is not None:
+            size += sys.getsizeof(field) + sys.getsizeof(value)
+    return size
@@ -0,0 +1,104 @@
+import functools
+import re
+from bisect import bisect_left, bisect_right, insort
+from fnmatch import translate
+
+# Keys per sublist of SortedKeys; sublists are split at twice this size
+_LOAD = 1000
+
+
+class SortedKeys:
+    """Sorted set of keys kept as a list of sorted sublists.
+
+    add() and discard() cost a bisect plus a move of at most 2 * _LOAD
+    pointers, instead of shifting the whole array; irange() iterates from
+    any key onwards without copying the index.
+    """
+
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self._lists = [keys[i:i + _LOAD] for i in range(0, len(keys), _LOAD)]
+        self._maxes = [sublist[-1] for sublist in self._lists]
+        self._len = len(keys)
+
+    def __len__(self):
+        return self._len
+
+    def add(self, key):
+        """Insert key, which must not be in the index already."""
+        self._len += 1
+        maxes = self._maxes
+        if not maxes:
+            self._lists.append([key])
+            maxes.append(key)
+            return
+        pos = bisect_left(maxes, key)
+        if pos == len(maxes):
+            pos -= 1
+            sublist = self._lists[pos]
+            sublist.append(key)
+            maxes[pos] = key
+        else:
+            sublist = self._lists[pos]
+            insort(sublist, key)
+        if len(sublist) > 2 * _LOAD:
+            half = sublist[_LOAD:]
+            del sublist[_LOAD:]
+            maxes[pos] = sublist[-1]
+            self._lists.insert(pos + 1, half)
+            maxes.insert(pos + 1, half[-1])
+
+    def discard(self, key):
+        maxes = self._maxes
+        pos = bisect_left(maxes, key)
+        if pos == len(maxes):
+            return
+        sublist = self._lists[pos]
+        i = bisect_left(sublist, key)
+        if i == len(sublist) or sublist[i] != key:
+            return
+        del sublist[i]
+        self._len -= 1
+        if sublist:
+            maxes[pos] = sublist[-1]
+        else:
+            del self._lists[pos]
+            del maxes[pos]
+
+    def irange(self, start=None, inclusive=True):
+        """Iterate keys in order from start (or the first key). The index
+        must not change while the iterator is in use."""
+        lists = self._lists
+        if start is None:
+            pos, i = 0, 0
+        else:
+            find = bisect_left if inclusive else bisect_right
+            pos = find(self._maxes, start)
+            if pos == len(lists):
+                return
+            i = find(lists[pos], start)
+        for pos in range(pos, len(lists)):
+            sublist = lists[pos]
+            for j in range(i, len(sublist)):
+                yield sublist[j]
+            i = 0
+
+
+def literal_prefix(pattern):
+    """The part of a glob pattern before its first wildcard."""
+    special = (b'*', b'?', b'[') if isinstance(pattern, bytes) else ('*', '?', '[')
+    end = min((i for i in (pattern.find(char) for char in special) if i != -1), default=len(pattern))
+    return pattern[:end]
+
+
+@functools.lru_cache(maxsize=256)
+def glob_matcher(pattern):
+    """Compiled fnmatch-style match function for a str or bytes pattern,
+    or None if the pattern matches every key."""
+    if pattern in ('*', b'*'):
+        return None
+    if isinstance(pattern, bytes):
+        regex = translate(pattern.decode('latin-1')).encode('latin-1')
+    else:
+        regex = translate(pattern)
+    return re.compile(regex).match
@@ -0,0 +1,172 @@
+import asyncio
+import concurrent.futures
+import time
+from .remotedict import _WRONGTYPE, _flatten
+from .resp import ReplyError, ReplyParser, encode_arg
+
+# Commands that act on the connection they arrive on, which a local client
+# does not have.
+_CONNECTION_COMMANDS = frozenset([b'CLIENT', b'REPLCONF', b'PSYNC', b'SUBSCRIBE', b'PSUBSCRIBE', b'UNSUBSCRIBE',
+                                  b'PUNSUBSCRIBE'])
+
+
+def call_in_loop(server, func, *args):
+    """Run func(*args) on the thread of the server's event loop and return
+    its result. On that thread, or while the server is not running, func is
+    run directly. func may return a coroutine, which is awaited, unless run
+    directly (waiting would block the loop)."""
+    loop = getattr(server, '_loop', None)
+    if loop is None or not loop.is_running() or _running_loop() is loop:
+        result = func(*args)
+        if asyncio.iscoroutine(result):
+            result.close()
+            raise RuntimeError('command cannot complete without blocking the event loop')
+        return result
+
+    # call_soon_threadsafe() with a plain Future costs a third of what
+    # run_coroutine_threadsafe() does, most commands not being coroutines
+    future = concurrent.futures.Future()
+
+    def run():
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            return
+        if asyncio.iscoroutine(result):
+            asyncio.ensure_future(result).add_done_callback(lambda task: _copy_result(task, future))
+        else:
+            future.set_result(result)
+    loop.call_soon_threadsafe(run)
+    return future.result()
+
+
+def _copy_result(task, future):
+    try:
+        future.set_result(task.result())
+    except BaseException as e:
+        future.set_exception(e)
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class LocalClient:
+    """Client for the process a RemoteDict runs in, with start_thread().
+
+    Reads (get, mget, exists) look keys up in the server's dict on the
+    calling thread: a dict lookup is atomic under the GIL, so no lock or
+    round trip to the server's thread is needed. They return values in the
+    server's mode (str, or bytes with binary=True), treat keys past their
+    deadline as missing without removing them (the server does that), and
+    do not count as uses for LRU/LFU eviction.
+
+    Writes, and any other command through execute_command(), are handed to
+    the server's event loop and run as a command from a connected client
+    would be, so expiry, memory limits, persistence and replication all see
+    them; the calling thread waits for the reply. Replies are decoded as by
+    a RESP client (bytes, int, list, None) and errors raise ReplyError.
+    """
+
+    def __init__(self, server):
+        self._server = server
+        self._expiring = hasattr(server, '_expiry')
+        self._binary = server._binary
+        if server._binary:
+            self._key = encode_arg
+        else:
+            self._key = lambda key: key if type(key) is str else encode_arg(key).decode('utf-8', 'surrogateescape')
+
+    def _expired(self, key):
+        if not self._expiring:
+            return False
+        deadline = self._server._expiry.get(key)
+        return deadline is not None and time.time() > deadline
+
+    def _value(self, key, value, missing):
+        if value is None or self._expired(key):
+            return None
+        cls = value.__class__
+        if cls is str or cls is bytes:
+            return value
+        if cls is int:
+            return b'%d' % value if self._binary else '%d' % value
+        if cls is memoryview:
+            # Lazily loaded from a binary snapshot and not yet copied
+            return bytes(value) if self._binary else str(value, 'utf-8', 'surrogateescape')
+        if missing:
+            return None
+        raise ReplyError(_WRONGTYPE)
+
+    def get(self, key):
+        key = self._key(key)
+        return self._value(key, self._server._data.get(key), False)
+
+    def mget(self, keys):
+        """Values of keys, None for those missing or holding hashes."""
+        get = self._server._data.get
+        value = self._value
+        keys = [self._key(key) for key in keys]
+        return [value(key, get(key), True) for key in keys]
+
+    def exists(self, *keys):
+        data = self._server._data
+        count = 0
+        for key in keys:
+            key = self._key(key)
+            if key in data and not self._expired(key):
+                count += 1
+        return count
+
+    def execute_command(self, *args):
+        args = [encode_arg(arg) for arg in args]
+        if args and args[0].upper() in _CONNECTION_COMMANDS:
+            raise ReplyError(f"ERR '{args[0].decode(errors='replace').lower()}' is not available to local clients")
+        reply = call_in_loop(self._server, self._run, args)
+        parser = ReplyParser()
+        parser.feed(reply)
+        result, = parser.parse()
+        if isinstance(result, ReplyError):
+            raise result
+        return result
+
+    def _run(self, args):
+        out = []
+        self._server._current_client = None  # Not one of the connected clients
+        waiter = self._server._execute(args, out)
+        if waiter is None:
+            return b''.join(out)
+        return self._wait(waiter, out)
+
+    async def _wait(self, waiter, out):
+        await waiter
+        return b''.join(_flatten(out))
+
+    def set(self, key, value, ex=None, px=None, nx=False, xx=False):
+        """SET key value; returns True, or None if NX/XX stopped it."""
+        args = ['SET', key, value]
+        if ex is not None:
+            args += ['EX', ex]
+        if px is not None:
+            args += ['PX', px]
+        if nx:
+            args.append('NX')
+        if xx:
+            args.append('XX')
+        return self.execute_command(*args) == b'OK' or None
+
+    def mset(self, mapping):
+        args = ['MSET']
+        for key, value in mapping.items():
+            args += [key, value]
+        return self.execute_command(*args) == b'OK'
+
+    def delete(self, *keys):
+        return self.execute_command('DEL', *keys)
+
+    def incr(self, key, amount=1):
+        return self.execute_command('INCRBY', key, amount)
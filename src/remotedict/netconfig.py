@@ -0,0 +1,41 @@
+import asyncio
+import socket
+
+EVENT_LOOPS = ('asyncio', 'uvloop', 'auto')
+
+
+def new_event_loop(name='asyncio'):
+    """New event loop for an event_loop setting: 'uvloop' requires the uvloop
+    package, 'auto' uses it when it is installed and asyncio otherwise."""
+    if name not in EVENT_LOOPS:
+        raise ValueError(f"event_loop must be one of {', '.join(EVENT_LOOPS)}")
+    if name != 'asyncio':
+        try:
+            import uvloop
+        except ImportError:
+            if name == 'uvloop':
+                raise RuntimeError("event_loop='uvloop' requires the uvloop package (pip install uvloop)")
+        else:
+            return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+def loop_name():
+    """'uvloop' or 'asyncio', for the running loop."""
+    return type(asyncio.get_running_loop()).__module__.split('.')[0]
+
+
+def set_buffer_sizes(server, sndbuf=0, rcvbuf=0):
+    """Set SO_SNDBUF/SO_RCVBUF on the listening sockets of server; accepted
+    connections inherit them, and the receive buffer has to be in place
+    before the handshake for the TCP window to scale to it. 0 keeps the
+    kernel default."""
+    for sock in server.sockets:
+        if sndbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+        if rcvbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+
+
+def is_tcp(sock):
+    return sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6)
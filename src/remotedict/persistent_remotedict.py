@@ -1,78 +1,673 @@
 from .expiring_remotedict import ExpiringRemoteDict
-from .remotedict import RemoteDict
+from . import hashes
+from .remotedict import RemoteDict, _token, command
+from .resp import OK, CommandError, integer
+from .aof import AppendOnlyFile, _fsync_and_close
+from .deltas import DeltaFiles
+from .snapshot import MappedSnapshot, _to_bytes, atomic_file, dump_binary, is_binary_snapshot
+import asyncio
+import contextlib
+import gc
 import json
 import os
+import time
 
-class PersistentExpiringRemoteDict(ExpiringRemoteDict):
-    def __init__(self, address="127.0.0.1", port=6379, expiry_seconds=3600, filename="persistent_dict.json"):
-        super().__init__(address, port, expiry_seconds)
+
+# JSON has no bytes type, so binary-mode keys and values are stored as str.
+# surrogateescape keeps arbitrary bytes round-trippable while valid UTF-8
+# text is written exactly as a str-mode server would write it. Hashes are
+# written as an array of their fields and values when they are tuples, and
+# as an object when they are dicts.
+def _encode_json_value(v):
+    if isinstance(v, bytes):
+        return v.decode('utf-8', 'surrogateescape')
+    if type(v) is tuple or type(v) is list:
+        return [_encode_json_value(item) for item in v]
+    if type(v) is dict:
+        return _encode_json_dict(v)
+    return v
+
+
+def _decode_json_value(v):
+    if isinstance(v, str):
+        return v.encode('utf-8', 'surrogateescape')
+    if type(v) is list:
+        return [_decode_json_value(item) for item in v]
+    if type(v) is dict:
+        return _decode_json_dict(v)
+    return v
+
+
+def _encode_json_dict(d):
+    return {k.decode('utf-8', 'surrogateescape'): _encode_json_value(v) for k, v in d.items()}
+
+
+def _decode_json_dict(d):
+    return {k.encode('utf-8', 'surrogateescape'): _decode_json_value(v) for k, v in d.items()}
+
+
+def _write_snapshot(filename, view, binary, snapshot_format):
+    """Write view to filename atomically and return the file size."""
+    if snapshot_format == 'binary':
+        return dump_binary(filename, view['data'], view.get('expiry'))
+    if binary:
+        view = {name: _encode_json_dict(d) for name, d in view.items()}
+    with atomic_file(filename, 'w') as f:
+        json.dump(view, f)
+        return f.tell()
+
+
+class _SnapshotMixin:
+    """JSON snapshots shared by the persistent classes.
+
+    With save=None (the default) the snapshot is rewritten on every write.
+    Otherwise save is a list of (seconds, changes) rules, as in Redis'
+    "save 900 1": a background snapshot is taken once at least `changes`
+    writes happened and `seconds` elapsed since the last one. Background
+    snapshots serialize a point-in-time copy of the dataset on a worker
+    thread, or the live dataset in a forked child with bgsave_method='fork'.
+    While one runs, SAVE is refused and the saves of save=None are held
+    back until it ends, so two snapshots are never written at once.
+
+    snapshot_format selects what is written: 'json' or 'binary' (see
+    snapshot.py). Either format is read back, so switching formats
+    migrates the file on the next save. With lazy_load=True a binary
+    snapshot is memory-mapped and values are served from the mapping while
+    they are copied into memory in the background.
+    """
+
+    def _init_snapshots(self, filename, save, bgsave_method, snapshot_format, lazy_load):
+        if snapshot_format not in ('json', 'binary'):
+            raise ValueError("snapshot_format must be 'json' or 'binary'")
+        if bgsave_method not in ('thread', 'fork'):
+            raise ValueError("bgsave_method must be 'thread' or 'fork'")
+        if bgsave_method == 'fork' and not hasattr(os, 'fork'):
+            raise ValueError("bgsave_method='fork' is not available on this platform")
         self._filename = filename
-        self._load_from_disk()
+        self._snapshot_format = snapshot_format
+        self._lazy_load = lazy_load
+        self._mapped = None  # MappedSnapshot still backing some values
+        self._mapped_keys = None
+        self._hydrate_task = None
+        self._save_rules = save
+        self._bgsave_method = bgsave_method
+        self._dirty = 0  # Writes since the last snapshot
+        self._batch_depth = 0  # Nesting of _batch() blocks
+        self._batch_changes = 0  # Writes made inside the current _batch() block
+        self._last_save = time.time()
+        self._last_snapshot_duration = None
+        self._last_snapshot_size = None
+        self._last_snapshot_status = None
+        self._save_task = None
+        self._bgsave_task = None
+        self._save_after_bgsave = False  # A save=None write arrived during a background save
+
+    async def start(self):
+        await super().start()
+        if self._mapped is not None:
+            self._hydrate_task = asyncio.create_task(self._hydrate())
+        if self._save_rules:
+            self._save_task = asyncio.create_task(self._run_save_rules())
+
+    async def stop(self):
+        if self._hydrate_task:
+            self._hydrate_task.cancel()
+            self._hydrate_task = None
+        if self._save_task:
+            self._save_task.cancel()
+            self._save_task = None
+        if self._bgsave_task:
+            await asyncio.gather(self._bgsave_task, return_exceptions=True)
+        await super().stop()
+        if self._save_rules and self._dirty:
+            self._save_to_disk()
+
+    def _read_snapshot(self):
+        """Load self._filename in either format; returns (data, expiry)."""
+        if not os.path.exists(self._filename):
+            return {}, {}
+        if is_binary_snapshot(self._filename):
+            data, expiry = self._read_binary_snapshot()
+        else:
+            with open(self._filename, 'r') as f:
+                snapshot = json.load(f)
+            data, expiry = snapshot.get('data', {}), snapshot.get('expiry', {})
+            if self._binary:
+                data, expiry = _decode_json_dict(data), _decode_json_dict(expiry)
+        return self._encode_hashes(data), expiry
+
+    def _read_binary_snapshot(self):
+        snapshot = MappedSnapshot(self._filename)
+        text = not self._binary
+        # Millions of new objects and no garbage: keep the cyclic GC from
+        # repeatedly scanning them while the dict is built.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            keys = snapshot.keys(text)
+            data = dict(zip(keys, snapshot.values(text, self._lazy_load)))
+            expiry = {key: deadline for key, deadline in zip(keys, snapshot.expiry()) if deadline is not None}
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if self._lazy_load:
+            # Values are memoryviews into the mapped file until hydrated
+            self._mapped = snapshot
+            self._mapped_keys = keys
+        else:
+            snapshot.close()
+        return data, expiry
+
+    def _hydrate_value(self, key):
+        value = self._data.get(key)
+        if type(value) is memoryview:
+            self._data[key] = bytes(value) if self._binary else str(value, 'utf-8', 'surrogateescape')
+
+    async def _hydrate(self, chunk=10000):
+        # Copy mapped values into memory a chunk at a time so clients are
+        # served in between; keys written or deleted meanwhile are skipped.
+        keys = self._mapped_keys
+        for start in range(0, len(keys), chunk):
+            for key in keys[start:start + chunk]:
+                self._hydrate_value(key)
+            await asyncio.sleep(0)
+        self._release_mapping()
+
+    def _hydrate_now(self):
+        if self._mapped is not None:
+            for key in self._mapped_keys:
+                self._hydrate_value(key)
+            self._release_mapping()
+
+    def _release_mapping(self):
+        self._mapped_keys = None
+        self._mapped.close()
+        self._mapped = None
+        self._hydrate_task = None
+
+    def _snapshot_view(self):
+        self._hydrate_now()
+        return super()._snapshot_view()
+
+    def _load_dataset(self, data, expiry):
+        with self._batch():
+            super()._load_dataset(data, expiry)
 
     def _save_to_disk(self):
-        data = {
-            'data': self._data,
-            'expiry': self._expiry
+        start = time.perf_counter()
+        self._last_snapshot_size = _write_snapshot(self._filename, self._snapshot_view(), self._binary,
+                                                   self._snapshot_format)
+        self._last_snapshot_duration = time.perf_counter() - start
+        self._last_snapshot_status = 'ok'
+        self._last_save = time.time()
+        self._dirty = 0
+
+    def _changed(self, count=1):
+        if self._batch_depth:
+            self._batch_changes += count
+        elif self._save_rules is None:
+            if self._bgsave_task is None:
+                self._save_to_disk()
+            else:
+                self._save_after_bgsave = True
+        else:
+            self._dirty += count
+
+    @contextlib.contextmanager
+    def _batch(self):
+        """Writes made in the block count as changes but are saved once, at
+        the end, instead of once each."""
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._batch_changes:
+                changes, self._batch_changes = self._batch_changes, 0
+                self._changed(changes)
+
+    def _mset(self, pairs):
+        with self._batch():
+            super()._mset(pairs)
+
+    async def _run_save_rules(self):
+        interval = min(1.0, min(seconds for seconds, _ in self._save_rules) or 1.0)
+        while True:
+            await asyncio.sleep(interval)
+            elapsed = time.time() - self._last_save
+            if any(elapsed >= seconds and self._dirty >= changes for seconds, changes in self._save_rules):
+                self._start_bgsave()
+
+    def _start_bgsave(self):
+        if self._bgsave_task is None:
+            self._bgsave_task = asyncio.ensure_future(self._bgsave())
+        return self._bgsave_task
+
+    async def _bgsave(self):
+        loop = asyncio.get_running_loop()
+        started = time.time()
+        dirty = self._dirty
+        start = time.perf_counter()
+        try:
+            if self._bgsave_method == 'fork':
+                self._last_snapshot_size = await self._fork_snapshot()
+            else:
+                self._last_snapshot_size = await loop.run_in_executor(None, _write_snapshot, self._filename,
+                                                                      self._snapshot_view(), self._binary,
+                                                                      self._snapshot_format)
+            self._last_snapshot_status = 'ok'
+            self._last_save = started
+            self._dirty -= dirty
+        except Exception:
+            self._last_snapshot_status = 'err'
+        finally:
+            self._last_snapshot_duration = time.perf_counter() - start
+            self._bgsave_task = None
+        if self._save_after_bgsave:
+            self._save_after_bgsave = False
+            try:
+                self._save_to_disk()
+            except OSError:
+                self._last_snapshot_status = 'err'
+
+    async def _fork_snapshot(self):
+        # Forks on the loop thread, between two commands, so the child's
+        # copy-on-write image of the live dataset is consistent and needs
+        # no copy of its own. Only the wait runs on a worker thread.
+        self._hydrate_now()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                view = {'data': self._data}
+                if isinstance(self, ExpiringRemoteDict):
+                    view['expiry'] = self._expiry
+                _write_snapshot(self._filename, view, self._binary, self._snapshot_format)
+                code = 0
+            finally:
+                os._exit(code)
+        _, status = await asyncio.get_running_loop().run_in_executor(None, os.waitpid, pid, 0)
+        if status != 0:
+            raise OSError(f'snapshot child exited with status {status}')
+        return os.path.getsize(self._filename)
+
+    def _info(self):
+        sections = super()._info()
+        info = self.snapshot_info()
+        sections['persistence'] = {
+            'loading': 0,
+            'rdb_changes_since_last_save': info['changes_since_last_save'],
+            'rdb_bgsave_in_progress': int(info['snapshot_in_progress']),
+            'rdb_last_save_time': int(info['last_save_time']),
+            'rdb_last_bgsave_status': info['last_snapshot_status'],
+            'rdb_last_snapshot_duration_sec': info['last_snapshot_duration'],
+            'rdb_last_snapshot_size': info['last_snapshot_size'],
+            'rdb_snapshot_format': self._snapshot_format,
         }
-        with open(self._filename, 'w') as f:
-            json.dump(data, f)
+        return sections
 
-    def _load_from_disk(self):
-        if os.path.exists(self._filename):
-            with open(self._filename, 'r') as f:
-                data = json.load(f)
-                self._data = data.get('data', {})
-                self._expiry = data.get('expiry', {})
+    def snapshot_info(self):
+        """Statistics about the most recent snapshot, for tuning save rules."""
+        return {
+            'changes_since_last_save': self._dirty,
+            'last_save_time': self._last_save,
+            'last_snapshot_duration': self._last_snapshot_duration,
+            'last_snapshot_size': self._last_snapshot_size,
+            'last_snapshot_status': self._last_snapshot_status,
+            'snapshot_in_progress': self._bgsave_task is not None,
+        }
 
-    def _set(self, key, value):
-        super()._set(key, value)
+    @command('bgsave', -1, ('admin',))
+    def _cmd_bgsave(self, args, out):
+        # redis-py sends BGSAVE SCHEDULE
+        if len(args) > 2 or (len(args) == 2 and _token(args[1]) != 'SCHEDULE'):
+            raise CommandError('ERR syntax error')
+        self._start_bgsave()
+        out.append(b'+Background saving started\r\n')
+
+    @command('save', 1, ('admin',))
+    def _cmd_save(self, args, out):
+        if self._bgsave_task is not None:
+            raise CommandError('ERR Background save already in progress')
         self._save_to_disk()
+        out.append(OK)
+
+    @command('lastsave', 1, ('fast',))
+    def _cmd_lastsave(self, args, out):
+        out.append(integer(int(self._last_save)))
+
+
+class PersistentExpiringRemoteDict(_SnapshotMixin, ExpiringRemoteDict):
+    """With deltas=True, writes only mark their keys dirty. Every
+    delta_flush_interval_ms the current state of the dirty keys is appended
+    to a delta file (see deltas.py, named after filename with a .delta
+    extension), and once the delta files are delta_compact_percentage
+    percent larger than the snapshot, and at least delta_compact_min_size
+    bytes, they are compacted into a new background snapshot.
+    """
+
+    def __init__(self, address="127.0.0.1", port=6379, expiry_seconds=3600, filename="persistent_dict.json",
+                 save=None, bgsave_method='thread', snapshot_format='json', lazy_load=False, deltas=False,
+                 delta_flush_interval_ms=100, delta_compact_min_size=1024 * 1024, delta_compact_percentage=100,
+                 **kwargs):
+        super().__init__(address, port, expiry_seconds, **kwargs)
+        self._init_snapshots(filename, save, bgsave_method, snapshot_format, lazy_load)
+        self._deltas = DeltaFiles(os.path.splitext(filename)[0] + '.delta') if deltas else None
+        self._delta_flush_interval = delta_flush_interval_ms / 1000
+        self._delta_compact_min_size = delta_compact_min_size
+        self._delta_compact_percentage = delta_compact_percentage
+        self._dirty_keys = set()  # Keys written since the last delta flush
+        self._delta_flushall = False  # A flush since the last delta flush
+        self._delta_task = None
+        self._compact_task = None
+        self._load_from_disk()
+
+    async def start(self):
+        await super().start()
+        if self._deltas is not None:
+            self._delta_task = asyncio.create_task(self._run_deltas())
+
+    async def stop(self):
+        if self._delta_task:
+            self._delta_task.cancel()
+            self._delta_task = None
+        if self._compact_task:
+            await asyncio.gather(self._compact_task, return_exceptions=True)
+        await super().stop()
+        if self._deltas is not None:
+            self._flush_deltas()
+            self._deltas.close()
+
+    def _load_from_disk(self):
+        self._data, self._expiry = self._read_snapshot()
+        if self._deltas is not None:
+            for record in self._deltas.replay():
+                self._apply_delta(record)
+            self._deltas.open()
+        # Keys that expired while the server was down are not loaded
+        now = time.time()
+        for key in [key for key, deadline in self._expiry.items() if deadline is not None and deadline <= now]:
+            self._data.pop(key, None)
+            del self._expiry[key]
+
+    def _apply_delta(self, record):
+        data, expiry, deleted = record.get('set', {}), record.get('expiry', {}), record.get('del', [])
+        if self._binary:
+            data, expiry, deleted = _decode_json_dict(data), _decode_json_dict(expiry), _decode_json_value(deleted)
+        if record.get('flushall'):
+            self._data.clear()
+            self._expiry.clear()
+        self._data.update(self._encode_hashes(data))
+        self._expiry.update(expiry)
+        for key in deleted:
+            self._data.pop(key, None)
+            self._expiry.pop(key, None)
+
+    def _changed_keys(self, keys):
+        if self._deltas is None:
+            self._changed()
+        else:
+            self._dirty_keys.update(keys)
+
+    def _flush_deltas(self):
+        """Append the state of the dirty keys to the delta files. Returns
+        True if a record was written."""
+        if not self._dirty_keys and not self._delta_flushall:
+            return False
+        keys, self._dirty_keys = self._dirty_keys, set()
+        data, expiry, deleted = {}, {}, []
+        for key in keys:
+            if self._mapped is not None:
+                self._hydrate_value(key)
+            value = self._data.get(key)
+            if value is None:
+                deleted.append(key)
+            else:
+                data[key] = value
+                expiry[key] = self._expiry.get(key)
+        if self._binary:
+            data, expiry, deleted = _encode_json_dict(data), _encode_json_dict(expiry), _encode_json_value(deleted)
+        record = {'set': data, 'expiry': expiry, 'del': deleted}
+        if self._delta_flushall:
+            record['flushall'] = True
+            self._delta_flushall = False
+        self._deltas.append(json.dumps(record).encode() + b'\n')
+        return True
+
+    async def _run_deltas(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self._delta_flush_interval)
+            if self._flush_deltas():
+                # fsync a duplicate descriptor, as a compaction may rotate the file meanwhile
+                await loop.run_in_executor(None, _fsync_and_close, os.dup(self._deltas.fileno()))
+            base_size = self._last_snapshot_size or (os.path.getsize(self._filename)
+                                                     if os.path.exists(self._filename) else 0)
+            if (self._compact_task is None and self._deltas.size >= self._delta_compact_min_size and
+                    self._deltas.size >= base_size * self._delta_compact_percentage / 100):
+                self._compact_task = asyncio.ensure_future(self._compact_deltas())
+
+    async def _compact_deltas(self):
+        """Fold the delta files into a new snapshot."""
+        try:
+            if self._bgsave_task is not None:
+                # Its view may predate changes that are only in the delta files
+                await asyncio.gather(self._bgsave_task, return_exceptions=True)
+            self._flush_deltas()
+            old = self._deltas.rotate()
+            await self._start_bgsave()
+            if self._last_snapshot_status == 'ok':
+                self._deltas.remove(old)
+        finally:
+            self._compact_task = None
+
+    def _info(self):
+        sections = super()._info()
+        persistence = sections['persistence']
+        persistence['delta_enabled'] = int(self._deltas is not None)
+        if self._deltas is not None:
+            persistence['delta_files'] = self._deltas.count
+            persistence['delta_size'] = self._deltas.size
+            persistence['delta_dirty_keys'] = len(self._dirty_keys)
+            persistence['delta_compaction_in_progress'] = int(self._compact_task is not None)
+        return sections
+
+    def _set_with_expiry(self, key, value, expire_at):
+        # _set goes through here too, so every write is saved exactly once
+        super()._set_with_expiry(key, value, expire_at)
+        self._changed_keys((key,))
+
+    def _set_expiry(self, key, expire_at):
+        super()._set_expiry(key, expire_at)
+        self._changed_keys((key,))
+
+    def _remove_expired(self, key):
+        super()._remove_expired(key)
+        # Without delta files the deletion is saved with the next snapshot,
+        # and the key is not loaded if the server restarts before that
+        if self._deltas is not None:
+            self._dirty_keys.add(key)
+        elif self._save_rules:
+            self._changed()
+
+    def _hset(self, key, pairs):
+        existed = key in self._data
+        added = super()._hset(key, pairs)
+        if existed:
+            # A new hash was saved by _set_with_expiry()
+            self._changed_keys((key,))
+        return added
+
+    def _hdel(self, key, fields):
+        removed = super()._hdel(key, fields)
+        if key in self._data:
+            # Removing the last field deletes the key, which _del() saved
+            self._changed_keys((key,))
+        return removed
 
     def _del(self, keys):
         count = super()._del(keys)
-        self._save_to_disk()
+        self._changed_keys(keys)
         return count
 
     def _flushdb(self):
         super()._flushdb()
-        self._save_to_disk()
+        self._flushed()
 
     def _flushall(self):
         super()._flushall()
-        self._save_to_disk()
+        self._flushed()
 
-class PersistentRemoteDict(RemoteDict):
-    def __init__(self, address="127.0.0.1", port=6379, filename="persistent_dict.json"):
-        super().__init__(address, port)
-        self._filename = filename
+    def _flushed(self):
+        if self._deltas is None:
+            self._changed()
+        else:
+            self._dirty_keys.clear()
+            self._delta_flushall = True
+
+class PersistentRemoteDict(_SnapshotMixin, RemoteDict):
+    def __init__(self, address="127.0.0.1", port=6379, filename="persistent_dict.json", save=None,
+                 bgsave_method='thread', snapshot_format='json', lazy_load=False, appendonly=False,
+                 appendfilename=None, appendfsync='everysec', appendfsync_interval_ms=1000,
+                 auto_aof_rewrite_min_size=64 * 1024 * 1024, auto_aof_rewrite_percentage=100, **kwargs):
+        super().__init__(address, port, **kwargs)
+        self._init_snapshots(filename, save, bgsave_method, snapshot_format, lazy_load)
+        self._aof = None  # Append-only log replacing full JSON rewrites on every write
+        self._aof_task = None
+        if appendonly:
+            self._aof = AppendOnlyFile(appendfilename or os.path.splitext(filename)[0] + '.aof',
+                                       self._aof_snapshot, appendfsync, appendfsync_interval_ms,
+                                       auto_aof_rewrite_min_size, auto_aof_rewrite_percentage)
         self._load_from_disk()
 
-    def _save_to_disk(self):
-        data = {
-            'data': self._data
-        }
-        with open(self._filename, 'w') as f:
-            json.dump(data, f)
+    async def start(self):
+        await super().start()
+        if self._aof:
+            self._aof_task = asyncio.create_task(self._aof.run())
+
+    async def stop(self):
+        if self._aof_task:
+            self._aof_task.cancel()
+            self._aof_task = None
+        await super().stop()
+        if self._aof:
+            self._aof.close()
 
     def _load_from_disk(self):
-        if os.path.exists(self._filename):
-            with open(self._filename, 'r') as f:
-                data = json.load(f)
-                self._data = data.get('data', {})
+        if self._aof and self._aof.exists():
+            self._load_aof()
+        else:
+            self._data, _ = self._read_snapshot()
+            if self._aof:
+                # First start in append-only mode: seed the log with the JSON data
+                self._aof.rewrite_now()
+        if self._aof:
+            self._aof.open()
+
+    def _load_aof(self):
+        for args in self._aof.replay():
+            cmd = args[0].upper()
+            if not self._binary:
+                # Values replicated from a binary primary are logged as their raw bytes
+                args = [arg.decode('utf-8', 'surrogateescape') for arg in args]
+            if cmd == b'SET':
+                RemoteDict._set(self, args[1], args[2])
+            elif cmd == b'DEL':
+                RemoteDict._del(self, args[1:])
+            elif cmd == b'HSET':
+                h, _ = hashes.set_fields(self._data.get(args[1]), list(zip(args[2::2], args[3::2])),
+                                         self._hash_max_entries, self._hash_max_value)
+                self._hash_tables |= type(h) is dict
+                RemoteDict._set(self, args[1], h)
+            elif cmd == b'HDEL':
+                h, _ = hashes.delete_fields(self._data[args[1]], args[2:])
+                if h is None:
+                    RemoteDict._del(self, [args[1]])
+                else:
+                    RemoteDict._set(self, args[1], h)
+            elif cmd == b'FLUSHALL':
+                RemoteDict._flushall(self)
+
+    def _aof_snapshot(self):
+        items = list(self._data_view().items())
+        return (self._aof_entry(key, value) for key, value in items)
+
+    @staticmethod
+    def _aof_entry(key, value):
+        """Command recreating key (which does not exist yet) with value."""
+        if value.__class__ in hashes.TYPES:
+            return [b'HSET', _to_bytes(key)] + [_to_bytes(item) for item in hashes.flat(value)]
+        return [b'SET', _to_bytes(key), _to_bytes(value)]
+
+    def _log(self, *args):
+        self._aof.append([_to_bytes(arg) for arg in args])
+
+    def _info(self):
+        sections = super()._info()
+        persistence = sections['persistence']
+        persistence['aof_enabled'] = int(self._aof is not None)
+        if self._aof is not None:
+            persistence['aof_rewrite_in_progress'] = int(self._aof.rewrite_in_progress)
+            persistence['aof_current_size'] = self._aof.size
+            persistence['aof_base_size'] = self._aof.base_size
+            persistence['aof_fsync'] = self._aof.fsync
+        return sections
+
+    @command('bgrewriteaof', 1, ('admin',))
+    def _cmd_bgrewriteaof(self, args, out):
+        if not self._aof:
+            raise CommandError('ERR append only file is not enabled')
+        self._aof.start_rewrite()
+        out.append(b'+Background append only file rewriting started\r\n')
 
     def _set(self, key, value):
         super()._set(key, value)
-        self._save_to_disk()
+        if self._aof:
+            # Hashes only reach _set() when they are created
+            self._aof.append(self._aof_entry(key, value))
+        else:
+            self._changed()
+
+    def _hset(self, key, pairs):
+        existed = key in self._data
+        added = super()._hset(key, pairs)
+        # A new hash was saved by _set()
+        if existed:
+            if self._aof:
+                self._log(b'HSET', key, *[item for pair in pairs for item in pair])
+            else:
+                self._changed()
+        return added
+
+    def _hdel(self, key, fields):
+        removed = super()._hdel(key, fields)
+        # Removing the last field deletes the key, which _del() saved
+        if key in self._data:
+            if not self._aof:
+                self._changed()
+            elif removed:
+                self._log(b'HDEL', key, *fields)
+        return removed
 
     def _del(self, keys):
         count = super()._del(keys)
-        self._save_to_disk()
+        if self._aof:
+            if count:
+                self._log(b'DEL', *keys)
+        else:
+            self._changed()
         return count
 
     def _flushdb(self):
         super()._flushdb()
-        self._save_to_disk()
+        if self._aof:
+            self._log(b'FLUSHALL')
+        else:
+            self._changed()
 
     def _flushall(self):
         super()._flushall()
-        self._save_to_disk()
+        if self._aof:
+            self._log(b'FLUSHALL')
+        else:
+            self._changed()
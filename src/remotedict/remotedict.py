@@ -1,37 +1,541 @@
 import asyncio
+import collections
+import contextlib
+import decimal
+import itertools
+import math
+import os
+import re
+import socket
+import sys
 import threading
 import time
+from . import hashes
+from .clients import Client
+from .eviction import make_policy
+from .keyindex import SortedKeys, glob_matcher, literal_prefix
+from .netconfig import EVENT_LOOPS, is_tcp, loop_name, new_event_loop, set_buffer_sizes
+from .replication import Replica, ReplicaLink, new_replid
+from .snapshot import _to_bytes
+from .stats import Stats
+from .resp import (MAX_ARGS, MAX_BULK_LENGTH, NULL_BULK, OK, CommandError, ProtocolError, RequestParser,
+                   encode_command, encode_invalidation, encode_message, encode_subscription, integer, write_array,
+                   write_bulk)
+
+
+def _token(arg):
+    """Upper-cased str form of a command option, whichever mode args are in."""
+    return (arg.decode(errors='replace') if isinstance(arg, bytes) else arg).upper()
+
+
+def _str(arg):
+    return arg.decode(errors='replace') if isinstance(arg, bytes) else arg
+
+
+def parse_int(arg):
+    try:
+        return int(arg)
+    except ValueError:
+        raise CommandError('ERR value is not an integer or out of range')
+
+
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+_INTEGER = re.compile(rb'-?[1-9][0-9]*|0')
+
+
+def _as_int64(value):
+    """value (an argument or a stored value) as a 64-bit integer, parsed as
+    strictly as Redis does: no spaces, '+' or leading zeros."""
+    if type(value) is int:
+        return value
+    if isinstance(value, str):
+        value = value.encode('utf-8', 'surrogateescape')
+    elif type(value) is memoryview:
+        value = bytes(value)
+    if len(value) <= 20 and _INTEGER.fullmatch(value):
+        result = int(value)
+        if _INT64_MIN <= result <= _INT64_MAX:
+            return result
+    raise CommandError('ERR value is not an integer or out of range')
+
+
+def _expire_deadline(amount, milliseconds, relative, name):
+    """Deadline, in seconds since the epoch, of the expire time argument of
+    command name: seconds or milliseconds, from now or absolute. As in
+    Redis, it must fit in 64 bits once converted to milliseconds."""
+    deadline = _as_int64(amount)
+    if not milliseconds:
+        deadline *= 1000
+    if relative:
+        deadline += int(time.time() * 1000)
+    if not _INT64_MIN <= deadline <= _INT64_MAX:
+        raise CommandError(f"ERR invalid expire time in '{name}' command")
+    return deadline / 1000
+
+
+def _as_float(value):
+    if type(value) is int:
+        return float(value)
+    if type(value) is memoryview:
+        value = bytes(value)
+    try:
+        # float() would also accept surrounding spaces and '_' separators
+        if value.strip() != value or ('_' if isinstance(value, str) else b'_') in value:
+            raise ValueError
+        result = float(value)
+    except (ValueError, UnicodeDecodeError):
+        raise CommandError('ERR value is not a valid float')
+    if not math.isfinite(result):
+        raise CommandError('ERR value is not a valid float')
+    return result
+
+
+def _format_float(value):
+    """Shortest decimal text of value, without an exponent or a trailing
+    '.0' (so 3.0 is stored as '3' and can be INCRed again)."""
+    if value == 0:
+        return '0'
+    text = repr(value)
+    if 'e' in text:
+        text = format(decimal.Decimal(text), 'f')
+    return text[:-2] if text.endswith('.0') else text
+
+
+# Commands a client may send once subscribed to a channel or pattern
+_SUBSCRIBED_COMMANDS = frozenset(['subscribe', 'unsubscribe', 'psubscribe', 'punsubscribe', 'ping'])
+_DEL_EVENT = ('g', b'del')
+
+
+def notify_kinds(flags):
+    """The kinds of keyspace events to publish for a notify-keyspace-events
+    string, as in Redis: K and/or E for the keyspace and keyevent channels,
+    then g (del, flushdb, flushall), $ (set), h (hset, hdel), x (expired), e
+    (evicted), or A for all of them. '' if none are to be published."""
+    kinds = ''
+    for flag in flags:
+        if flag == 'A':
+            kinds += 'g$hxe'
+        elif flag in 'g$hxe':
+            kinds += flag
+        elif flag not in 'KE':
+            raise ValueError(f'unknown notify-keyspace-events flag {flag!r}')
+    if 'K' not in flags and 'E' not in flags:
+        return ''
+    return kinds
+
+
+# Rough per-key cost of the dict slot and bookkeeping, added to the sizes of
+# the key and value objects when used memory is estimated.
+_ENTRY_OVERHEAD = 64
+
+_MISSING = object()
+
+_HASH_TYPES = hashes.TYPES
+# Hashes as read from a snapshot: flat sequences (JSON arrays are lists) or dicts
+_LOADED_HASH_TYPES = (list, tuple, dict)
+_WRONGTYPE = 'WRONGTYPE Operation against a key holding the wrong kind of value'
+_NO_EXPIRY = 'ERR key expiry requires ExpiringRemoteDict'
+
+
+def _sizeof(value):
+    if type(value) is memoryview:
+        # Lazily loaded value: count it as the bytes it will be hydrated to
+        return sys.getsizeof(b'') + value.nbytes
+    if value.__class__ in _HASH_TYPES:
+        return hashes.sizeof(value)
+    return sys.getsizeof(value)
+
+
+CommandSpec = collections.namedtuple('CommandSpec', 'name arity flags first_key last_key step method')
+
+
+def command(name, arity, flags=(), first_key=0, last_key=0, step=0):
+    """Register the decorated method as the handler of command name.
+
+    The handler is called as handler(args, out) with the arguments already
+    decoded (unless binary=True). arity counts the command name itself: N
+    means exactly N arguments, -N at least N. flags and the key positions
+    (first, last with -1 for the last argument, and step) are reported by
+    COMMAND, and are used to route commands between shards.
+    """
+    def decorate(func):
+        func.__dict__.setdefault('_commands', []).append((name, arity, tuple(flags), first_key, last_key, step))
+        return func
+    return decorate
+
+
+_command_tables = {}
+
+
+def command_table(cls):
+    """Commands registered on cls and its bases, keyed by upper case name."""
+    table = _command_tables.get(cls)
+    if table is None:
+        table = {}
+        for klass in reversed(cls.__mro__):
+            for attr, func in vars(klass).items():
+                for name, arity, flags, first_key, last_key, step in getattr(func, '_commands', ()):
+                    table[name.upper().encode()] = CommandSpec(name, arity, flags, first_key, last_key, step, attr)
+        _command_tables[cls] = table
+    return table
+
+
+# INFO sections in output order; sections added by subclasses that are not
+# listed here come last. INFO without arguments leaves out the per-command
+# sections.
+_INFO_SECTIONS = ('server', 'clients', 'memory', 'persistence', 'stats', 'replication', 'cpu', 'commandstats',
+                  'latencystats', 'keyspace')
+_INFO_NOT_DEFAULT = ('commandstats', 'latencystats')
+
+
+def _rss():
+    """Resident set size of the process in bytes, where /proc is available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _percentile(stats, fraction):
+    # Upper bound of the histogram bucket holding the given fraction of calls
+    wanted = stats.calls * fraction
+    for bound, count in stats.cumulative_histogram():
+        if count >= wanted:
+            return bound
+    return 0
+
+
+def _printable(name):
+    return name[:128].replace(b'\r', b' ').replace(b'\n', b' ')
+
+
+def _error_reply(e):
+    """Error reply for an exception raised while a command ran: its message
+    on one line, as the reply to that command alone."""
+    if isinstance(e, CommandError):
+        return f'-{e}\r\n'.encode()
+    return b'-ERR %s\r\n' % _printable(str(e).encode(errors='replace'))
+
+
+def _flatten(out):
+    # Awaitables may fill their slot with a list of chunks (e.g. a large
+    # KEYS reply) rather than one joined bytes object.
+    return [chunk for item in out for chunk in (item if type(item) is list else (item,))]
+
 
 class RemoteDict:
-    def __init__(self, address="127.0.0.1", port=6379):
+    def __init__(self, address="127.0.0.1", port=6379, buffered_parser=True, read_size=65536, max_batch=1000,
+                 binary=False, maxmemory=0, maxkeys=0, maxmemory_policy='noeviction', stats=True,
+                 slowlog_log_slower_than=10000, slowlog_max_len=128, unix_socket=None, unix_socket_perm=None,
+                 tcp_backlog=511, tcp_nodelay=True, reuse_address=None, reuse_port=False, sndbuf=0, rcvbuf=0,
+                 event_loop='asyncio', maxclients=10000, timeout=0, client_output_buffer_limit=(0, 0, 0),
+                 replicaof=None, replica_read_only=True, replica_output_buffer_limit=256 * 1024 * 1024,
+                 hash_max_listpack_entries=128, hash_max_listpack_value=64, tracking_table_max_keys=1000000,
+                 notify_keyspace_events='', pubsub_output_buffer_limit=32 * 1024 * 1024):
         self._data = {}
+        self._binary = binary  # Store keys and values as the raw bytes received instead of str
         self._address = address
         self._port = port
+        self._buffered_parser = buffered_parser  # False selects the line-by-line parser
+        self._read_size = read_size  # Bytes requested from the socket per read
+        self._max_batch = max_batch  # Commands run per client before yielding to other clients
         self._server = None
         self._server_task = None
+        # Listening: port 0 with a unix_socket path listens on the Unix
+        # socket only. reuse_address=None keeps the platform default (on for
+        # POSIX); sndbuf/rcvbuf of 0 keep the kernel defaults. event_loop
+        # ('asyncio', 'uvloop' or 'auto') is used by start_thread().
+        if event_loop not in EVENT_LOOPS:
+            raise ValueError(f"event_loop must be one of {', '.join(EVENT_LOOPS)}")
+        self._unix_socket = unix_socket
+        self._unix_socket_perm = unix_socket_perm
+        self._unix_server = None
+        self._unix_server_task = None
+        self._tcp_backlog = tcp_backlog
+        self._tcp_nodelay = tcp_nodelay
+        self._reuse_address = reuse_address
+        self._reuse_port = reuse_port
+        self._sndbuf = sndbuf
+        self._rcvbuf = rcvbuf
+        self._event_loop = event_loop
+        # Memory limits: maxmemory is an estimate in bytes, maxkeys a number
+        # of entries (0 for no limit). Usage is tracked on every write only
+        # when a limit is set.
+        self._maxmemory = maxmemory
+        self._maxkeys = maxkeys
+        self._maxmemory_policy = maxmemory_policy
+        self._limited = bool(maxmemory or maxkeys)
+        policy = make_policy(maxmemory_policy)  # LRU/LFU order of keys
+        self._policy = policy if self._limited else None
+        self._used_memory = 0
+        self._evicted_keys = 0
+        # Sorted index of the keys for KEYS and SCAN, built on first use
+        # and then kept up to date by every write.
+        self._key_index = None
+        self._keys_chunk = 10000  # Keys matched and encoded by KEYS between yields to other clients
+        # Counters for INFO, SLOWLOG and LATENCY; None turns them all off
+        self._stats = Stats(slowlog_log_slower_than, slowlog_max_len) if stats else None
+        self._start_time = time.time()
+        self._total_connections = 0
+        # Connected clients by id. maxclients caps them (0 for no cap),
+        # timeout closes those idle for that many seconds (0 never), and
+        # client_output_buffer_limit is (hard bytes, soft bytes, soft
+        # seconds): a client whose unsent replies exceed the hard limit, or
+        # the soft one for longer than soft seconds, is disconnected (0 turns
+        # a limit off).
+        self._clients = {}
+        self._next_client_id = 1
+        self._current_client = None  # Client whose commands are running
+        self._maxclients = maxclients
+        self._timeout = timeout
+        self._obuf_hard, self._obuf_soft, self._obuf_soft_seconds = client_output_buffer_limit
+        self._obuf_limited = bool(self._obuf_hard or self._obuf_soft)
+        self._clients_cron_interval = 1.0
+        self._clients_cron_task = None
+        self._rejected_connections = 0
+        self._obuf_disconnections = 0
+        # Replication. As a primary, write commands are propagated to the
+        # replicas (client id -> Replica) as a stream of RESP commands, written
+        # once per loop iteration; _repl_offset counts its bytes. replicaof
+        # (host, port) starts this server as a replica, which by default
+        # rejects writes from its own clients.
+        self._replicas = {}
+        self._replid = new_replid()
+        self._repl_offset = 0
+        self._repl_pending = []
+        self._repl_flush_scheduled = False
+        self._replica_output_buffer_limit = replica_output_buffer_limit
+        self._replicaof = replicaof
+        self._replica_read_only = replica_read_only
+        self._replica_link = None
+        self._replica_task = None
+        self._read_only = False
+        # Hashes of up to hash_max_listpack_entries fields, none of them or
+        # their values longer than hash_max_listpack_value, are kept as flat
+        # tuples (see hashes.py). _hash_tables is set once any hash is a
+        # dict, which snapshot views then have to copy.
+        self._hash_max_entries = hash_max_listpack_entries
+        self._hash_max_value = hash_max_listpack_value
+        self._hash_tables = False
+        # Client-side caching (CLIENT TRACKING). The tracking table maps keys
+        # read by clients with tracking on to their ids; a change to a key
+        # owes each of them an invalidation message and removes the key from
+        # the table, until they read it again. Messages are written once per
+        # loop iteration, after the replies written during it. Past
+        # tracking_table_max_keys keys, the oldest is invalidated to make room.
+        self._tracking_table = {}
+        self._tracking_max_keys = tracking_table_max_keys
+        self._tracking_clients = 0
+        self._tracking_pending = {}  # Client id -> raw keys, or None for all of them
+        self._tracking_flush_scheduled = False
+        # Command name -> key positions (first, last, step), for the
+        # commands whose keys are tracked as read
+        self._read_keys = {spec.name: (spec.first_key, spec.last_key, spec.step)
+                           for spec in command_table(type(self)).values()
+                           if 'readonly' in spec.flags and spec.first_key}
+        # Pub/sub: subscribers by channel and by pattern (raw bytes). A
+        # message is encoded once and the same bytes are written to every
+        # subscriber; one whose unsent output passes
+        # pubsub_output_buffer_limit bytes (0 for no limit) is disconnected
+        # rather than left to grow. Keyspace notifications are published for
+        # the kinds of events in notify_keyspace_events (see notify_kinds()).
+        self._channels = {}
+        self._patterns = {}
+        self._pattern_matchers = {}
+        self._pubsub_clients = 0  # Clients with at least one subscription
+        self._pubsub_output_buffer_limit = pubsub_output_buffer_limit
+        self._notify_kinds = notify_kinds(notify_keyspace_events)
+        self._notify_keyspace = 'K' in notify_keyspace_events
+        self._notify_keyevent = 'E' in notify_keyspace_events
+        self._del_event = _DEL_EVENT  # Kind and name of the event _del() publishes
+        # Shared memory segment holding the snapshot last published with
+        # share_snapshot(), if any
+        self._shared_segment = None
+        # Command name (as received, upper and lower case) -> (bound handler, arity, name for stats, writes)
+        self._commands = {}
+        for name, spec in command_table(type(self)).items():
+            entry = (getattr(self, spec.method), spec.arity, spec.name, 'write' in spec.flags)
+            self._commands[name] = entry
+            self._commands[name.lower()] = entry
 
     async def start(self):
-        self._server = await asyncio.start_server(self._handle_request, self._address, self._port)
-        self._server_task = asyncio.create_task(self._server.serve_forever())
-        print(f"Server started on {self._address}:{self._port}")
+        if self._limited:
+            # Data may have been loaded from disk without being tracked
+            self._recount_memory()
+        self._key_index = None
+        self._server = await self._listen()
+        if self._server:
+            self._server_task = asyncio.create_task(self._server.serve_forever())
+        if self._unix_server:
+            self._unix_server_task = asyncio.create_task(self._unix_server.serve_forever())
+        if self._timeout or self._obuf_limited:
+            self._clients_cron_task = asyncio.create_task(self._run_clients_cron())
+        if self._replicaof:
+            self._start_replication(*self._replicaof)
+        print(f"Server started on {self._listening_on()}")
 
-    async def stop(self):
+    def _listening_on(self):
+        where = []
         if self._server:
-            self._server.close()
-            await self._server.wait_closed()
-            if self._server_task:
-                self._server_task.cancel()
+            where.append(f"{self._address}:{self._port}")
+        if self._unix_server:
+            where.append(f"unix:{self._unix_socket}")
+        return ' and '.join(where)
+
+    def _tcp_options(self):
+        """Keyword arguments for asyncio.start_server."""
+        return {'backlog': self._tcp_backlog, 'reuse_address': self._reuse_address, 'reuse_port': self._reuse_port}
+
+    async def _listen(self):
+        """Start listening; returns the TCP server, or None with port 0 and
+        a unix_socket."""
+        if self._unix_socket:
+            self._unix_server = await asyncio.start_unix_server(self._handle_request, self._unix_socket,
+                                                                backlog=self._tcp_backlog)
+            if self._unix_socket_perm is not None:
+                os.chmod(self._unix_socket, self._unix_socket_perm)
+            if not self._port:
+                return None
+        server = await asyncio.start_server(self._handle_request, self._address, self._port, **self._tcp_options())
+        set_buffer_sizes(server, self._sndbuf, self._rcvbuf)
+        return server
+
+    async def stop(self):
+        self._stop_replication()
+        if self._clients_cron_task:
+            self._clients_cron_task.cancel()
+            self._clients_cron_task = None
+        servers = [server for server in (self._server, self._unix_server) if server]
+        for server in servers:
+            server.close()
+            await server.wait_closed()
+        for task in (self._server_task, self._unix_server_task):
+            if task:
+                task.cancel()
+        if self._unix_server:
+            self._unix_server = None
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self._unix_socket)
+        self._unshare_snapshot()
+        if servers:
             print("Server stopped.")
 
-    async def _handle_request(self, reader, writer):
+    async def _handle_request(self, reader, writer, execute=None):
+        # execute(args, out) appends the reply for one command to out. It may
+        # instead reserve a slot in out and return an awaitable that fills it
+        # in; those are awaited before the batch is flushed.
+        if execute is None:
+            execute = self._execute
+            # Links between shards (which pass their own execute) are not capped
+            if self._maxclients and len(self._clients) >= self._maxclients:
+                self._rejected_connections += 1
+                writer.write(b'-ERR max number of clients reached\r\n')
+                writer.close()
+                return
+        client = Client(self._next_client_id, writer)
+        self._next_client_id += 1
+        self._clients[client.id] = client
+        self._total_connections += 1
+        if not self._tcp_nodelay:
+            # asyncio and uvloop both turn Nagle's algorithm off by default
+            sock = writer.get_extra_info('socket')
+            if is_tcp(sock):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 0)
+        try:
+            if self._buffered_parser:
+                await self._handle_request_buffered(reader, writer, execute, client)
+            else:
+                await self._handle_request_lines(reader, writer, execute, client)
+        finally:
+            del self._clients[client.id]
+            self._replicas.pop(client.id, None)
+            if client.tracking:
+                self._tracking_clients -= 1
+            if client.channels or client.patterns:
+                self._unsubscribe(client, (), [], False)
+                self._unsubscribe(client, (), [], True)
+
+    async def _handle_request_buffered(self, reader, writer, execute, client):
+        stats = self._stats
+        parser = RequestParser()
+        max_batch = self._max_batch
+        since_yield = 0
+        try:
+            while True:
+                if parser.pending > self._read_size:
+                    # Large bulk argument: fetch the rest of it in one go
+                    # instead of re-parsing the buffer after every chunk.
+                    chunk = await reader.readexactly(parser.pending)
+                else:
+                    chunk = await reader.read(self._read_size)
+                if not chunk:
+                    break
+                client.last_interaction = time.monotonic()
+                if stats is not None:
+                    stats.net_input_bytes += len(chunk)
+                parser.feed(chunk)
+                while True:
+                    try:
+                        commands = parser.parse(max_batch)
+                    except ProtocolError as e:
+                        writer.write(f'-ERR Protocol error: {e}\r\n'.encode())
+                        await writer.drain()
+                        return
+                    if not commands:
+                        break
+                    # Run the whole batch back-to-back and flush the replies
+                    # with a single write and drain.
+                    out = []
+                    pending = []
+                    self._current_client = client
+                    client.last_command = commands[-1][0] if commands[-1] else 'NULL'
+                    for args in commands:
+                        waiter = execute(args, out)
+                        if waiter is not None:
+                            pending.append(waiter)
+                    if pending:
+                        await asyncio.gather(*pending)
+                        out = _flatten(out)
+                    if stats is not None:
+                        stats.net_output_bytes += sum(map(len, out))
+                    writer.writelines(out)
+                    if self._obuf_limited and self._output_buffer_exceeded(client, time.monotonic()):
+                        return
+                    await writer.drain()
+                    if client.killed:
+                        return
+                    since_yield += len(commands)
+                    if since_yield >= max_batch:
+                        since_yield = 0
+                        await asyncio.sleep(0)  # Let other clients run
+                    if len(commands) < max_batch:
+                        break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            writer.write(f'-ERR {e}\r\n'.encode())
+            await writer.drain()
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def _handle_request_lines(self, reader, writer, execute, client):
+        # Original line-by-line parser, kept as a fallback and as the
+        # baseline for benchmarks/parser_benchmark.py.
         try:
             while True:
                 # Read the first line (RESP type)
                 line = await reader.readline()
                 if not line:
                     break
+                client.last_interaction = time.monotonic()
                 if line.startswith(b'*'):  # Array (command)
                     num_args = int(line[1:].strip())
+                    if num_args < 0 or num_args > MAX_ARGS:
+                        writer.write(b'-ERR Protocol error: invalid multibulk length\r\n')
+                        await writer.drain()
+                        return
                     args = []
                     for _ in range(num_args):
                         length_line = await reader.readline()
@@ -40,51 +544,32 @@ class RemoteDict:
                             await writer.drain()
                             return
                         length = int(length_line[1:].strip())
+                        if length < 0 or length > MAX_BULK_LENGTH:
+                            writer.write(b'-ERR Protocol error: invalid bulk length\r\n')
+                            await writer.drain()
+                            return
                         arg = await reader.readexactly(length)
                         await reader.readexactly(2)  # Discard \r\n
-                        args.append(arg.decode())
-                    if not args:
-                        writer.write(b'-ERR Empty command\r\n')
-                        await writer.drain()
-                        continue
-                    cmd = args[0].upper()
-                    response = None
-                    if cmd == 'SET' and len(args) == 3:
-                        self._set(args[1], args[2])
-                        writer.write(b'+OK\r\n')
-                    elif cmd == 'GET' and len(args) == 2:
-                        response = self._get(args[1])
-                        if response is not None:
-                            writer.write(response)
-                        else:
-                            writer.write(b'$-1\r\n')
-                    elif cmd == 'DEL' and len(args) >= 2:
-                        count = self._del(args[1:])
-                        writer.write(f":{count}\r\n".encode())
-                    elif cmd == 'EXISTS' and len(args) >= 2:
-                        count = self._exists(args[1:])
-                        writer.write(f":{count}\r\n".encode())
-                    elif cmd == 'KEYS' and len(args) == 2:
-                        keys = self._keys(args[1])
-                        resp = f"*{len(keys)}\r\n"
-                        for k in keys:
-                            resp += f"${len(k)}\r\n{k}\r\n"
-                        writer.write(resp.encode())
-                    elif cmd == 'FLUSHDB' and len(args) == 1:
-                        self._flushdb()
-                        writer.write(b'+OK\r\n')
-                    elif cmd == 'FLUSHALL' and len(args) == 1:
-                        self._flushall()
-                        writer.write(b'+OK\r\n')
-                    else:
-                        writer.write(b'-ERR unknown command or wrong number of arguments\r\n')
-                        await writer.drain()
-                        continue
+                        args.append(arg)
+                    out = []
+                    self._current_client = client
+                    client.last_command = args[0] if args else 'NULL'
+                    waiter = execute(args, out)
+                    if waiter is not None:
+                        await waiter
+                        out = _flatten(out)
+                    writer.writelines(out)
+                    if self._obuf_limited and self._output_buffer_exceeded(client, time.monotonic()):
+                        return
                     await writer.drain()
+                    if client.killed:
+                        return
                 else:
                     writer.write(b'-ERR Protocol error: expected array\r\n')
                     await writer.drain()
                     break
+        except ConnectionError:
+            pass
         except Exception as e:
             writer.write(f'-ERR {e}\r\n'.encode())
             await writer.drain()
@@ -92,25 +577,881 @@ class RemoteDict:
             writer.close()
             await writer.wait_closed()
 
+    def _output_buffer_exceeded(self, client, now):
+        """Disconnect client if its unsent replies are over the hard limit,
+        or have been over the soft limit for too long; returns whether it was.
+        Replicas have their own limit, checked as the stream is written."""
+        if client.replica is not None:
+            return False
+        size = client.output_buffer_size()
+        if self._obuf_soft and size > self._obuf_soft:
+            if client.soft_limit_since is None:
+                client.soft_limit_since = now
+            over = now - client.soft_limit_since >= self._obuf_soft_seconds
+        else:
+            client.soft_limit_since = None
+            over = False
+        if over or (self._obuf_hard and size > self._obuf_hard):
+            self._obuf_disconnections += 1
+            client.kill(abort=True)
+            return True
+        return False
+
+    async def _run_clients_cron(self):
+        # Clients waiting on a drain() or a read never reach the checks in
+        # the request loop, so idle and slow clients are also swept here.
+        while True:
+            await asyncio.sleep(self._clients_cron_interval)
+            now = time.monotonic()
+            for client in list(self._clients.values()):
+                if client.killed:
+                    continue
+                if self._obuf_limited and self._output_buffer_exceeded(client, now):
+                    continue
+                # A client with replies still to read is slow, not idle. Like
+                # Redis, subscribers and replicas only listen and never time out
+                if (self._timeout and now - client.last_interaction > self._timeout
+                        and not client.output_buffer_size() and not client.channels and not client.patterns
+                        and client.replica is None):
+                    client.kill()
+
+    def _execute(self, args, out):
+        if not args:
+            out.append(b'-ERR Empty command\r\n')
+            return
+        name = args[0]
+        entry = self._commands.get(name)  # Exact, upper or lower case names
+        if entry is None:
+            entry = self._commands.get(name.upper())
+            if entry is None:
+                self._reject(out, b"-ERR unknown command '%s'\r\n" % _printable(name))
+                return
+        handler, arity, stats_name, write = entry
+        if len(args) != arity if arity > 0 else len(args) < -arity:
+            self._reject(out, b"-ERR wrong number of arguments for '%s' command\r\n" % _printable(name.lower()))
+            return
+        if write and self._read_only:
+            self._reject(out, b"-READONLY You can't write against a read only replica.\r\n")
+            return
+        if self._pubsub_clients and stats_name not in _SUBSCRIBED_COMMANDS:
+            client = self._current_client
+            if client is not None and (client.channels or client.patterns):
+                self._reject(out, b"-ERR Can't execute '%s': only (P)SUBSCRIBE / (P)UNSUBSCRIBE / PING are allowed "
+                                  b"in this context\r\n" % _printable(name.lower()))
+                return
+        raw = args
+        if not self._binary:
+            try:
+                args = [arg.decode() for arg in args]
+            except UnicodeDecodeError:
+                self._reject(out, b'-ERR invalid UTF-8 in arguments, start the server with binary=True to store '
+                                  b'bytes\r\n')
+                return
+        # Any failure becomes the reply to this command alone, so the replies
+        # to a pipelined batch stay one per command and in order
+        stats = self._stats
+        if stats is None:
+            try:
+                result = handler(args, out)
+            except Exception as e:
+                out.append(_error_reply(e))
+                return
+        else:
+            # Commands that finish asynchronously are timed up to the point
+            # where they hand over to the loop.
+            start = time.perf_counter_ns()
+            try:
+                result = handler(args, out)
+            except Exception as e:
+                out.append(_error_reply(e))
+                stats.failed(stats_name)
+                return
+            finally:
+                stats.record(stats_name, args, time.perf_counter_ns() - start)
+        if write:
+            if self._replicas:
+                self._propagate(raw)
+        elif self._tracking_clients:
+            self._track(stats_name, args)
+        return result
+
+    def _reject(self, out, error):
+        out.append(error)
+        if self._stats is not None:
+            self._stats.rejected_calls += 1
+
+    @command('get', 2, ('readonly', 'fast'), 1, 1, 1)
+    def _cmd_get(self, args, out):
+        value = self._get(args[1])
+        if value.__class__ in _HASH_TYPES:
+            raise CommandError(_WRONGTYPE)
+        write_bulk(out, value)
+
+    @command('mget', -2, ('readonly', 'fast'), 1, -1, 1)
+    def _cmd_mget(self, args, out):
+        # Keys holding hashes are reported as missing, as Redis does
+        write_array(out, [None if value.__class__ in _HASH_TYPES else value for value in self._mget(args[1:])])
+
+    @command('mset', -3, ('write', 'denyoom'), 1, -1, 2)
+    @command('msetnx', -3, ('write', 'denyoom'), 1, -1, 2)
+    def _cmd_mset(self, args, out):
+        name = _token(args[0])
+        if len(args) % 2 == 0:
+            raise CommandError(f"ERR wrong number of arguments for '{name.lower()}' command")
+        pairs = list(zip(args[1::2], args[2::2]))
+        if name == 'MSETNX' and self._exists([key for key, _ in pairs]):
+            out.append(integer(0))
+            return
+        # The batch is admitted as a whole: a repeated key only counts once
+        self._ensure_memory_for([(key, value, None) for key, value in dict(pairs).items()])
+        self._mset(pairs)
+        out.append(OK if name == 'MSET' else integer(1))
+
+    @command('incr', 2, ('write', 'denyoom', 'fast'), 1, 1, 1)
+    def _cmd_incr(self, args, out):
+        out.append(integer(self._incrby(args[1], 1)))
+
+    @command('decr', 2, ('write', 'denyoom', 'fast'), 1, 1, 1)
+    def _cmd_decr(self, args, out):
+        out.append(integer(self._incrby(args[1], -1)))
+
+    @command('incrby', 3, ('write', 'denyoom', 'fast'), 1, 1, 1)
+    def _cmd_incrby(self, args, out):
+        out.append(integer(self._incrby(args[1], _as_int64(args[2]))))
+
+    @command('decrby', 3, ('write', 'denyoom', 'fast'), 1, 1, 1)
+    def _cmd_decrby(self, args, out):
+        amount = _as_int64(args[2])
+        if amount == _INT64_MIN:
+            raise CommandError('ERR decrement would overflow')
+        out.append(integer(self._incrby(args[1], -amount)))
+
+    @command('incrbyfloat', 3, ('write', 'denyoom', 'fast'), 1, 1, 1)
+    def _cmd_incrbyfloat(self, args, out):
+        value = self._get_string(args[1])
+        result = (0.0 if value is None else _as_float(value)) + _as_float(args[2])
+        if not math.isfinite(result):
+            raise CommandError('ERR increment would produce NaN or Infinity')
+        text = _format_float(result)
+        if self._binary:
+            text = text.encode()
+        self._ensure_memory(args[1], text)
+        self._replace(args[1], text)
+        write_bulk(out, text)
+
+    def _incrby(self, key, amount):
+        """Add amount to the integer at key (0 if it does not exist) and
+        return the result. Counters are stored as ints, so a hot key is not
+        parsed and formatted again on every increment."""
+        value = self._get_string(key)
+        result = (0 if value is None else _as_int64(value)) + amount
+        if not _INT64_MIN <= result <= _INT64_MAX:
+            raise CommandError('ERR increment or decrement would overflow')
+        self._ensure_memory(key, result)
+        self._replace(key, result)
+        return result
+
+    @command('hset', -4, ('write', 'denyoom', 'fast'), 1, 1, 1)
+    @command('hmset', -4, ('write', 'denyoom', 'fast'), 1, 1, 1)
+    def _cmd_hset(self, args, out):
+        name = _token(args[0])
+        if len(args) % 2:
+            raise CommandError(f"ERR wrong number of arguments for '{name.lower()}' command")
+        key = args[1]
+        pairs = list(zip(args[2::2], args[3::2]))
+        self._get_hash(key)  # WRONGTYPE if key holds a string
+        self._ensure_memory(key, None, sum(_sizeof(field) + _sizeof(value) for field, value in pairs))
+        added = self._hset(key, pairs)
+        out.append(integer(added) if name == 'HSET' else OK)
+
+    @command('hget', 3, ('readonly', 'fast'), 1, 1, 1)
+    def _cmd_hget(self, args, out):
+        h = self._get_hash(args[1])
+        write_bulk(out, None if h is None else hashes.get(h, args[2]))
+
+    @command('hmget', -3, ('readonly', 'fast'), 1, 1, 1)
+    def _cmd_hmget(self, args, out):
+        h = self._get_hash(args[1])
+        fields = args[2:]
+        write_array(out, [None] * len(fields) if h is None else [hashes.get(h, field) for field in fields])
+
+    @command('hgetall', 2, ('readonly',), 1, 1, 1)
+    def _cmd_hgetall(self, args, out):
+        h = self._get_hash(args[1])
+        write_array(out, () if h is None else hashes.flat(h))
+
+    @command('hlen', 2, ('readonly', 'fast'), 1, 1, 1)
+    def _cmd_hlen(self, args, out):
+        h = self._get_hash(args[1])
+        out.append(integer(0 if h is None else hashes.length(h)))
+
+    @command('hdel', -3, ('write', 'fast'), 1, 1, 1)
+    def _cmd_hdel(self, args, out):
+        h = self._get_hash(args[1])
+        out.append(integer(0 if h is None else self._hdel(args[1], args[2:])))
+
+    @command('hincrby', 4, ('write', 'denyoom', 'fast'), 1, 1, 1)
+    def _cmd_hincrby(self, args, out):
+        key, field = args[1], args[2]
+        amount = _as_int64(args[3])
+        h = self._get_hash(key)
+        value = None if h is None else hashes.get(h, field)
+        try:
+            current = 0 if value is None else _as_int64(value)
+        except CommandError:
+            raise CommandError('ERR hash value is not an integer')
+        result = current + amount
+        if not _INT64_MIN <= result <= _INT64_MAX:
+            raise CommandError('ERR increment or decrement would overflow')
+        self._ensure_memory(key, None, _sizeof(field) + _sizeof(result))
+        self._hset(key, [(field, result)])
+        out.append(integer(result))
+
+    @command('type', 2, ('readonly', 'fast'), 1, 1, 1)
+    def _cmd_type(self, args, out):
+        value = self._get(args[1])
+        if value is None:
+            out.append(b'+none\r\n')
+        else:
+            out.append(b'+hash\r\n' if value.__class__ in _HASH_TYPES else b'+string\r\n')
+
+    def _get_string(self, key):
+        """Value of key, or None; WRONGTYPE if it holds a hash."""
+        value = self._get(key)
+        if value.__class__ in _HASH_TYPES:
+            raise CommandError(_WRONGTYPE)
+        return value
+
+    def _get_hash(self, key):
+        """Hash at key, or None; WRONGTYPE if it holds a string."""
+        value = self._get(key)
+        if value is not None and value.__class__ not in _HASH_TYPES:
+            raise CommandError(_WRONGTYPE)
+        return value
+
+    def _hset(self, key, pairs):
+        """Set fields of the hash at key, creating it through _set() if it
+        does not exist. Returns the number of fields added."""
+        h = self._data.get(key)
+        if h is None:
+            h, added = hashes.set_fields(None, pairs, self._hash_max_entries, self._hash_max_value)
+            self._hash_tables |= type(h) is dict
+            self._set(key, h)
+            return added
+        fields = [field for field, _ in pairs]
+        before = hashes.fields_size(h, fields) if self._limited else 0
+        new, added = hashes.set_fields(h, pairs, self._hash_max_entries, self._hash_max_value)
+        if new is not h:
+            # A new tuple, or the dict a tuple was converted to; the key keeps its expiry
+            self._data[key] = new
+            self._hash_tables |= type(new) is dict
+        if self._limited:
+            self._used_memory += hashes.fields_size(new, fields) - before
+        if self._tracking_table:
+            self._invalidate(key)
+        if self._notify_kinds:
+            self._notify('h', b'hset', key)
+        return added
+
+    def _hdel(self, key, fields):
+        """Remove fields from the hash at key, and the key with the last
+        one. Returns the number of fields removed."""
+        h = self._data[key]
+        before = hashes.fields_size(h, fields) if self._limited else 0
+        new, removed = hashes.delete_fields(h, fields)
+        if removed and self._notify_kinds:
+            self._notify('h', b'hdel', key)
+        if new is None:
+            self._del([key])
+            return removed
+        if new is not h:
+            self._data[key] = new
+        if self._limited:
+            self._used_memory += hashes.fields_size(new, fields) - before
+        if self._tracking_table:
+            self._invalidate(key)
+        return removed
+
+    @command('del', -2, ('write',), 1, -1, 1)
+    def _cmd_del(self, args, out):
+        out.append(integer(self._del(args[1:])))
+
+    @command('exists', -2, ('readonly', 'fast'), 1, -1, 1)
+    def _cmd_exists(self, args, out):
+        out.append(integer(self._exists(args[1:])))
+
+    @command('flushdb', 1, ('write',))
+    def _cmd_flushdb(self, args, out):
+        self._flushdb()
+        out.append(OK)
+
+    @command('flushall', 1, ('write',))
+    def _cmd_flushall(self, args, out):
+        self._flushall()
+        out.append(OK)
+
+    @command('command', -1, ('loading', 'stale'))
+    def _cmd_command(self, args, out):
+        # COMMAND, COMMAND COUNT, COMMAND INFO name [name ...]
+        table = command_table(type(self))
+        if len(args) == 1:
+            specs = list(table.values())
+        elif _token(args[1]) == 'COUNT' and len(args) == 2:
+            out.append(integer(len(table)))
+            return
+        elif _token(args[1]) == 'INFO':
+            specs = [table.get(_token(name).encode()) for name in args[2:]]
+        else:
+            raise CommandError("ERR unknown subcommand or wrong number of arguments for 'command'")
+        out.append(b'*%d\r\n' % len(specs))
+        for spec in specs:
+            if spec is None:
+                out.append(b'*-1\r\n')
+                continue
+            out.append(b'*6\r\n')
+            write_bulk(out, spec.name)
+            out.append(integer(spec.arity))
+            out.append(b'*%d\r\n' % len(spec.flags))
+            out.extend(b'+%s\r\n' % flag.encode() for flag in spec.flags)
+            out.append(integer(spec.first_key))
+            out.append(integer(spec.last_key))
+            out.append(integer(spec.step))
+
+    @command('info', -1, ('loading', 'stale'))
+    def _cmd_info(self, args, out):
+        sections = self._info()
+        names = [_token(arg).lower() for arg in args[1:]] or ['default']
+        if 'all' in names or 'everything' in names:
+            wanted = set(sections)
+        elif 'default' in names:
+            wanted = set(sections) - set(_INFO_NOT_DEFAULT)
+        else:
+            wanted = set(names)
+        order = list(_INFO_SECTIONS) + [name for name in sections if name not in _INFO_SECTIONS]
+        lines = []
+        for name in order:
+            if name in wanted and name in sections:
+                if lines:
+                    lines.append('')
+                lines.append('# ' + name.capitalize())
+                lines.extend(f'{field}:{value}' for field, value in sections[name].items() if value is not None)
+        write_bulk(out, '\r\n'.join(lines) + '\r\n')
+
+    def _info(self):
+        """INFO fields by section. Subclasses extend the returned dict; fields
+        whose value is None are left out."""
+        now = time.time()
+        times = os.times()
+        stats = self._stats
+        sections = {
+            'server': {
+                'server_class': type(self).__name__,
+                'python_version': sys.version.split()[0],
+                'multiplexing_api': loop_name(),
+                'process_id': os.getpid(),
+                'tcp_port': self._port,
+                'unixsocket': self._unix_socket,
+                'uptime_in_seconds': int(now - self._start_time),
+                'uptime_in_days': int((now - self._start_time) // 86400),
+                'binary_mode': int(self._binary),
+            },
+            'clients': {
+                'connected_clients': len(self._clients),
+                'tracking_clients': self._tracking_clients,
+                'maxclients': self._maxclients,
+                'client_recent_max_output_buffer': max((client.output_buffer_size()
+                                                        for client in self._clients.values()), default=0),
+            },
+            'memory': {
+                'used_memory': self._used_memory if self._limited else None,
+                'used_memory_rss': _rss(),
+                'maxmemory': self._maxmemory,
+                'maxkeys': self._maxkeys,
+                'maxmemory_policy': self._maxmemory_policy,
+            },
+            'stats': {
+                'stats_enabled': int(stats is not None),
+                'total_connections_received': self._total_connections,
+                'rejected_connections': self._rejected_connections,
+                'client_output_buffer_limit_disconnections': self._obuf_disconnections,
+                'evicted_keys': self._evicted_keys,
+                'tracking_total_keys': len(self._tracking_table),
+                'pubsub_channels': len(self._channels),
+                'pubsub_patterns': len(self._patterns),
+            },
+            'replication': self._replication_info(),
+            'cpu': {
+                'used_cpu_sys': f'{times.system:.6f}',
+                'used_cpu_user': f'{times.user:.6f}',
+            },
+            'keyspace': {},
+        }
+        if len(self._data):
+            sections['keyspace']['db0'] = f'keys={len(self._data)},expires=0'
+        if stats is not None:
+            sections['stats'].update({
+                'total_commands_processed': stats.total_commands_processed,
+                'total_net_input_bytes': stats.net_input_bytes,
+                'total_net_output_bytes': stats.net_output_bytes,
+                'rejected_calls': stats.rejected_calls,
+            })
+            sections['commandstats'] = {
+                f'cmdstat_{name}': f'calls={cmd.calls},usec={cmd.nsec // 1000},'
+                                   f'usec_per_call={cmd.nsec / 1000 / cmd.calls if cmd.calls else 0:.2f},'
+                                   f'failed_calls={cmd.failed_calls}'
+                for name, cmd in stats.commands.items()
+            }
+            sections['latencystats'] = {
+                f'latency_percentiles_usec_{name}': f'p50={_percentile(cmd, 0.5)},p99={_percentile(cmd, 0.99)},'
+                                                    f'p99.9={_percentile(cmd, 0.999)}'
+                for name, cmd in stats.commands.items() if cmd.calls
+            }
+        return sections
+
+    def _replication_info(self):
+        info = {'role': 'slave' if self._replica_link is not None else 'master'}
+        if self._replica_link is not None:
+            info.update(self._replica_link.info())
+            info['slave_read_only'] = int(self._read_only)
+        info['connected_slaves'] = len(self._replicas)
+        for i, replica in enumerate(self._replicas.values()):
+            info[f'slave{i}'] = replica.info(self._repl_offset)
+        if self._replica_link is not None:
+            info['master_replid'] = self._replica_link.replid
+            info['master_repl_offset'] = self._replica_link.offset
+        else:
+            info['master_replid'] = self._replid
+            info['master_repl_offset'] = self._repl_offset
+        return info
+
+    def _require_stats(self):
+        if self._stats is None:
+            raise CommandError('ERR statistics are disabled on this server (stats=False)')
+        return self._stats
+
+    @command('slowlog', -2, ('admin',))
+    def _cmd_slowlog(self, args, out):
+        # SLOWLOG GET [count], SLOWLOG LEN, SLOWLOG RESET
+        stats = self._require_stats()
+        sub = _token(args[1])
+        if sub == 'GET' and len(args) <= 3:
+            count = parse_int(args[2]) if len(args) == 3 else 10
+            entries = list(stats.slowlog)
+            if count >= 0:
+                entries = entries[:count]
+            out.append(b'*%d\r\n' % len(entries))
+            for entry in entries:
+                out.append(b'*4\r\n')
+                out.append(integer(entry.id))
+                out.append(integer(entry.timestamp))
+                out.append(integer(entry.duration))
+                write_array(out, entry.args)
+        elif sub == 'LEN' and len(args) == 2:
+            out.append(integer(len(stats.slowlog)))
+        elif sub == 'RESET' and len(args) == 2:
+            stats.slowlog.clear()
+            out.append(OK)
+        else:
+            raise CommandError("ERR unknown subcommand or wrong number of arguments for 'slowlog'")
+
+    @command('latency', -2, ('admin',))
+    def _cmd_latency(self, args, out):
+        # LATENCY HISTOGRAM [command ...]
+        stats = self._require_stats()
+        if _token(args[1]) != 'HISTOGRAM':
+            raise CommandError("ERR unknown subcommand or wrong number of arguments for 'latency'")
+        names = [_token(arg).lower() for arg in args[2:]] or list(stats.commands)
+        found = [(name, stats.commands[name]) for name in names if name in stats.commands]
+        out.append(b'*%d\r\n' % (2 * len(found)))
+        for name, cmd in found:
+            write_bulk(out, name)
+            out.append(b'*4\r\n')
+            write_bulk(out, 'calls')
+            out.append(integer(cmd.calls))
+            write_bulk(out, 'histogram_usec')
+            histogram = cmd.cumulative_histogram()
+            out.append(b'*%d\r\n' % (2 * len(histogram)))
+            for bound, count in histogram:
+                out.append(integer(bound))
+                out.append(integer(count))
+
+    @command('client', -2, ('loading', 'stale'))
+    def _cmd_client(self, args, out):
+        # CLIENT ID | LIST [ID id ...] | INFO | KILL addr | KILL [ID id] [ADDR addr] [LADDR addr] [SKIPME yes/no]
+        # | GETNAME | SETNAME name | SETINFO LIB-NAME|LIB-VER value
+        client = self._current_client
+        sub = _token(args[1])
+        if sub == 'ID' and len(args) == 2:
+            out.append(integer(client.id))
+        elif sub == 'LIST':
+            clients = list(self._clients.values())
+            if len(args) > 2:
+                if _token(args[2]) != 'ID' or len(args) == 3:
+                    raise CommandError('ERR syntax error')
+                ids = {parse_int(arg) for arg in args[3:]}
+                clients = [other for other in clients if other.id in ids]
+            now = time.monotonic()
+            write_bulk(out, ''.join(other.info(now) + '\n' for other in clients))
+        elif sub == 'INFO' and len(args) == 2:
+            write_bulk(out, client.info(time.monotonic()) + '\n')
+        elif sub == 'KILL' and len(args) == 3:
+            # Old form: the address of a single client
+            addr = _str(args[2])
+            victims = [other for other in self._clients.values() if other.addr == addr]
+            if not victims:
+                raise CommandError('ERR No such client')
+            self._kill_client(victims[0])
+            out.append(OK)
+        elif sub == 'KILL' and len(args) % 2 == 0:
+            filters = []
+            skipme = True
+            for i in range(2, len(args), 2):
+                option, value = _token(args[i]), _str(args[i + 1])
+                if option == 'ID':
+                    client_id = parse_int(value)
+                    filters.append(lambda other, client_id=client_id: other.id == client_id)
+                elif option == 'ADDR':
+                    filters.append(lambda other, addr=value: other.addr == addr)
+                elif option == 'LADDR':
+                    filters.append(lambda other, addr=value: other.laddr == addr)
+                elif option == 'SKIPME' and value.lower() in ('yes', 'no'):
+                    skipme = value.lower() == 'yes'
+                else:
+                    raise CommandError('ERR syntax error')
+            killed = 0
+            for other in list(self._clients.values()):
+                if (other is client and skipme) or not all(match(other) for match in filters):
+                    continue
+                self._kill_client(other)
+                killed += 1
+            out.append(integer(killed))
+        elif sub == 'TRACKING' and len(args) == 3 and _token(args[2]) in ('ON', 'OFF'):
+            # Only the default mode: no REDIRECT, BCAST, OPTIN or OPTOUT
+            on = _token(args[2]) == 'ON'
+            if on != client.tracking:
+                client.tracking = on
+                self._tracking_clients += 1 if on else -1
+            out.append(OK)
+        elif sub == 'GETNAME' and len(args) == 2:
+            write_bulk(out, client.name or None)
+        elif sub == 'SETNAME' and len(args) == 3:
+            name = _str(args[2])
+            if any(char <= ' ' or char > '~' for char in name):
+                raise CommandError('ERR Client names cannot contain spaces, newlines or special characters.')
+            client.name = name
+            out.append(OK)
+        elif sub == 'SETINFO' and len(args) == 4 and _token(args[2]) in ('LIB-NAME', 'LIB-VER'):
+            value = _str(args[3])
+            if any(char <= ' ' or char > '~' for char in value):
+                raise CommandError('ERR lib-name and lib-ver cannot contain spaces, newlines or special characters.')
+            if _token(args[2]) == 'LIB-NAME':
+                client.lib_name = value
+            else:
+                client.lib_ver = value
+            out.append(OK)
+        else:
+            raise CommandError("ERR unknown subcommand or wrong number of arguments for 'client'")
+
+    @command('ping', -1, ('fast', 'loading', 'stale'))
+    def _cmd_ping(self, args, out):
+        if len(args) > 2:
+            raise CommandError("ERR wrong number of arguments for 'ping' command")
+        client = self._current_client
+        if client is not None and (client.channels or client.patterns):
+            # In subscribed mode the reply is an array, like a message
+            out.append(b'*2\r\n$4\r\npong\r\n')
+            write_bulk(out, args[1] if len(args) == 2 else b'')
+        elif len(args) == 2:
+            write_bulk(out, args[1])
+        else:
+            out.append(b'+PONG\r\n')
+
+    @command('subscribe', -2, ('pubsub', 'noscript', 'loading', 'stale'))
+    def _cmd_subscribe(self, args, out):
+        self._subscribe(self._current_client, args[1:], out, False)
+
+    @command('psubscribe', -2, ('pubsub', 'noscript', 'loading', 'stale'))
+    def _cmd_psubscribe(self, args, out):
+        self._subscribe(self._current_client, args[1:], out, True)
+
+    @command('unsubscribe', -1, ('pubsub', 'noscript', 'loading', 'stale'))
+    def _cmd_unsubscribe(self, args, out):
+        self._unsubscribe(self._current_client, args[1:], out, False)
+
+    @command('punsubscribe', -1, ('pubsub', 'noscript', 'loading', 'stale'))
+    def _cmd_punsubscribe(self, args, out):
+        self._unsubscribe(self._current_client, args[1:], out, True)
+
+    @command('publish', 3, ('pubsub', 'loading', 'stale', 'fast'))
+    def _cmd_publish(self, args, out):
+        out.append(integer(self._publish(_to_bytes(args[1]), _to_bytes(args[2]))))
+
+    @command('pubsub', -2, ('pubsub', 'loading', 'stale'))
+    def _cmd_pubsub(self, args, out):
+        # PUBSUB CHANNELS [pattern] | NUMSUB [channel ...] | NUMPAT
+        sub = _token(args[1])
+        if sub == 'CHANNELS' and len(args) <= 3:
+            match = glob_matcher(_to_bytes(args[2])) if len(args) == 3 else None
+            write_array(out, [channel for channel in self._channels if match is None or match(channel)])
+        elif sub == 'NUMSUB':
+            out.append(b'*%d\r\n' % (2 * (len(args) - 2)))
+            for channel in args[2:]:
+                write_bulk(out, channel)
+                out.append(integer(len(self._channels.get(_to_bytes(channel), ()))))
+        elif sub == 'NUMPAT' and len(args) == 2:
+            out.append(integer(len(self._patterns)))
+        else:
+            raise CommandError("ERR unknown subcommand or wrong number of arguments for 'pubsub'")
+
+    def _subscribe(self, client, names, out, patterns):
+        subscribed = client.patterns if patterns else client.channels
+        table = self._patterns if patterns else self._channels
+        if not client.channels and not client.patterns:
+            self._pubsub_clients += 1
+        for name in names:
+            name = _to_bytes(name)
+            if name not in subscribed:
+                subscribed.add(name)
+                subscribers = table.get(name)
+                if subscribers is None:
+                    subscribers = table[name] = set()
+                    if patterns:
+                        self._pattern_matchers[name] = glob_matcher(name)
+                subscribers.add(client)
+            out.append(encode_subscription(b'psubscribe' if patterns else b'subscribe', name,
+                                           len(client.channels) + len(client.patterns)))
+
+    def _unsubscribe(self, client, names, out, patterns):
+        """Unsubscribe client from names, or from every channel (pattern)
+        it is subscribed to if there are none."""
+        subscribed = client.patterns if patterns else client.channels
+        table = self._patterns if patterns else self._channels
+        kind = b'punsubscribe' if patterns else b'unsubscribe'
+        was_subscribed = bool(client.channels or client.patterns)
+        names = [_to_bytes(name) for name in names] or list(subscribed)
+        if not names:
+            out.append(encode_subscription(kind, None, len(client.channels) + len(client.patterns)))
+        for name in names:
+            if name in subscribed:
+                subscribed.discard(name)
+                subscribers = table[name]
+                subscribers.discard(client)
+                if not subscribers:
+                    del table[name]
+                    self._pattern_matchers.pop(name, None)
+            out.append(encode_subscription(kind, name, len(client.channels) + len(client.patterns)))
+        if was_subscribed and not client.channels and not client.patterns:
+            self._pubsub_clients -= 1
+
+    def _publish(self, channel, message):
+        """Send message to the subscribers of channel and of the patterns
+        matching it; returns how many it was sent to."""
+        receivers = 0
+        subscribers = self._channels.get(channel)
+        if subscribers:
+            receivers += self._fan_out_message(subscribers, encode_message(channel, message))
+        if self._patterns:
+            for pattern, subscribers in self._patterns.items():
+                match = self._pattern_matchers[pattern]
+                if match is None or match(channel):
+                    receivers += self._fan_out_message(subscribers, encode_message(channel, message, pattern))
+        return receivers
+
+    def _fan_out_message(self, subscribers, data):
+        # The same bytes object for every subscriber: no per-client encoding
+        limit = self._pubsub_output_buffer_limit
+        sent = 0
+        for client in subscribers:
+            if client.killed:
+                continue  # Disconnected, and unsubscribed once its handler exits
+            client.writer.write(data)
+            sent += 1
+            if limit and client.output_buffer_size() > limit:
+                # A subscriber that does not keep up must not hold the messages in memory
+                self._obuf_disconnections += 1
+                client.kill(abort=True)
+        if self._stats is not None:
+            self._stats.net_output_bytes += len(data) * sent
+        return sent
+
+    def _notify(self, kind, event, key):
+        """Publish a keyspace notification of event (bytes) on key, if
+        events of kind are on; key None is for flushes, which only publish
+        the database number on the keyevent channel."""
+        if kind not in self._notify_kinds or not (self._channels or self._patterns):
+            return
+        if key is None:
+            self._publish(b'__keyevent@0__:' + event, b'0')
+            return
+        key = _to_bytes(key)
+        if self._notify_keyspace:
+            self._publish(b'__keyspace@0__:' + key, event)
+        if self._notify_keyevent:
+            self._publish(b'__keyevent@0__:' + event, key)
+
+    def _kill_client(self, client):
+        if client is self._current_client:
+            # Still send it the reply to this command, then close
+            client.killed = True
+        else:
+            client.kill(abort=True)
+
+    @command('replconf', -1, ('admin', 'noscript', 'loading', 'stale'))
+    def _cmd_replconf(self, args, out):
+        # Sent by replicas: REPLCONF listening-port <port>, REPLCONF ACK <offset>, ...
+        client = self._current_client
+        if client.replica is None:
+            client.replica = Replica(client)
+        i = 1
+        while i + 1 < len(args):
+            option = _token(args[i])
+            if option == 'LISTENING-PORT':
+                client.replica.listening_port = parse_int(args[i + 1])
+            elif option == 'ACK':
+                client.replica.ack_offset = parse_int(args[i + 1])
+                client.replica.last_ack = time.monotonic()
+                return  # Not replied to
+            i += 2
+        if i != len(args):
+            raise CommandError('ERR syntax error')
+        out.append(OK)
+
+    @command('psync', 3, ('admin', 'noscript'))
+    def _cmd_psync(self, args, out):
+        # PSYNC replid offset: always answered with a full resync, i.e. the
+        # snapshot followed by the stream of writes made after it
+        client = self._current_client
+        if client.replica is None:
+            client.replica = Replica(client)
+        # Writes still pending are in the snapshot: send them to the current
+        # replicas before this one joins
+        self._flush_replication()
+        self._replicas[client.id] = client.replica
+        out.append(b'')
+        return client.replica.full_sync(self._snapshot_view(), self._replid, self._repl_offset)
+
+    @command('replicaof', 3, ('admin', 'noscript', 'stale'))
+    @command('slaveof', 3, ('admin', 'noscript', 'stale'))
+    def _cmd_replicaof(self, args, out):
+        # REPLICAOF host port | REPLICAOF NO ONE
+        if _token(args[1]) == 'NO' and _token(args[2]) == 'ONE':
+            if self._replica_link is not None:
+                self._stop_replication()
+                self._replicaof = None
+                self._replid = new_replid()  # A new history starts here
+            out.append(OK)
+            return
+        host, port = _str(args[1]), parse_int(args[2])
+        if self._replicaof == (host, port) and self._replica_link is not None:
+            out.append(b'+OK Already connected to specified master\r\n')
+            return
+        self._stop_replication()
+        self._replicaof = (host, port)
+        self._start_replication(host, port)
+        out.append(OK)
+
+    @command('set', -3, ('write', 'denyoom'), 1, 1, 1)
+    def _cmd_set(self, args, out):
+        # SET key value [NX|XX] [EX seconds|PX milliseconds|EXAT timestamp|PXAT ms-timestamp]
+        condition = None
+        expire_at = None
+        i = 3
+        while i < len(args):
+            option = _token(args[i])
+            if option in ('NX', 'XX') and condition is None:
+                i += 1
+            elif option in ('EX', 'PX', 'EXAT', 'PXAT') and expire_at is None and i + 1 < len(args):
+                if _as_int64(args[i + 1]) <= 0:
+                    raise CommandError('ERR invalid expire time in \'set\' command')
+                expire_at = _expire_deadline(args[i + 1], option.startswith('P'), option in ('EX', 'PX'), 'set')
+                i += 2
+                continue
+            else:
+                raise CommandError('ERR syntax error')
+            condition = option
+        # Every option is checked before any key can be evicted to make room
+        if expire_at is not None and not hasattr(self, '_expiry'):
+            raise CommandError(_NO_EXPIRY)
+        key = args[1]
+        if condition is not None and (condition == 'NX') == (self._exists([key]) > 0):
+            out.append(NULL_BULK)
+            return
+        self._ensure_memory(key, args[2])
+        if expire_at is None:
+            self._set(key, args[2])
+        else:
+            self._set_with_expiry(key, args[2], expire_at)
+        out.append(OK)
+
     def _set(self, key, value):
+        if self._key_index is not None and key not in self._data:
+            self._key_index.add(key)
+        if self._limited:
+            old = self._data.get(key, _MISSING)
+            if old is _MISSING:
+                self._used_memory += _sizeof(key) + _sizeof(value) + _ENTRY_OVERHEAD
+            else:
+                self._used_memory += _sizeof(value) - _sizeof(old)
+            if self._policy is not None:
+                self._policy.touch(key)
         self._data[key] = value
+        if self._tracking_table:
+            self._invalidate(key)
+        if self._notify_kinds:
+            if value.__class__ in _HASH_TYPES:
+                self._notify('h', b'hset', key)
+            else:
+                self._notify('$', b'set', key)
+
+    def _set_with_expiry(self, key, value, expire_at):
+        raise CommandError(_NO_EXPIRY)
+
+    def _replace(self, key, value):
+        """Set the value of key in place, as INCR does: unlike SET, an
+        existing key keeps its expiry."""
+        self._set(key, value)
 
     def _get(self, key):
         value = self._data.get(key)
-        if value is not None:
-            resp = f"${len(value)}\r\n{value}\r\n"
-            return resp.encode()
-        else:
-            return None
+        if self._policy is not None and value is not None:
+            self._policy.touch(key)
+        return value
+
+    def _mget(self, keys):
+        if self._policy is None:
+            get = self._data.get
+            return [get(key) for key in keys]
+        return [self._get(key) for key in keys]
+
+    def _mset(self, pairs):
+        for key, value in pairs:
+            self._set(key, value)
 
     def _del(self, keys):
         count = 0
         for key in keys:
-            if key in self._data:
-                del self._data[key]
+            if self._discard(key):
                 count += 1
+                if self._notify_kinds:
+                    self._notify(*self._del_event, key)
         return count
 
+    def _discard(self, key):
+        """Remove key from the dict (not from subclass state such as
+        expiry). Returns True if it was there."""
+        value = self._data.pop(key, _MISSING)
+        if value is _MISSING:
+            return False
+        if self._key_index is not None:
+            self._key_index.discard(key)
+        if self._limited:
+            self._used_memory -= _sizeof(key) + _sizeof(value) + _ENTRY_OVERHEAD
+            if self._policy is not None:
+                self._policy.remove(key)
+        if self._tracking_table:
+            self._invalidate(key)
+        return True
+
     def _exists(self, keys):
         count = 0
         for key in keys:
@@ -119,18 +1460,379 @@ class RemoteDict:
         return count
 
     def _keys(self, pattern):
-        import fnmatch
-        return [k for k in self._data.keys() if fnmatch.fnmatch(k, pattern)]
+        return self._scan(None, pattern, len(self._data) + 1)[1]
+
+    def _sorted_keys(self):
+        if self._key_index is None:
+            self._key_index = SortedKeys(self._data)
+        return self._key_index
+
+    def _scan(self, after, pattern, count):
+        """Examine up to count keys in sorted order, starting after the key
+        after (None to start from the beginning).
+
+        Returns (last key examined, or None once no keys are left, and the
+        examined keys matching pattern). A pattern with a literal prefix
+        only examines keys starting with it.
+        """
+        prefix = literal_prefix(pattern) if pattern is not None else ''
+        match = glob_matcher(pattern) if pattern is not None else None
+        if after is None or after < prefix:
+            keys = self._sorted_keys().irange(prefix or None)
+        else:
+            keys = self._sorted_keys().irange(after, inclusive=False)
+        found = []
+        examined = 0
+        for key in keys:
+            if prefix and not key.startswith(prefix):
+                return None, self._live_keys(found)
+            if match is None or match(key):
+                found.append(key)
+            examined += 1
+            if examined >= count:
+                return key, self._live_keys(found)
+        return None, self._live_keys(found)
+
+    def _live_keys(self, keys):
+        # Hook for subclasses to drop keys that exist but must not be listed
+        return keys
+
+    @command('keys', 2, ('readonly',))
+    def _cmd_keys(self, args, out):
+        # The keys are listed right away, so the commands after KEYS (even
+        # in the same pipeline) cannot change its reply. Matching and
+        # encoding them costs far more and is done a chunk at a time.
+        pattern = args[1]
+        prefix = literal_prefix(pattern)
+        keys = self._sorted_keys().irange(prefix or None)
+        if prefix:
+            keys = itertools.takewhile(lambda key: key.startswith(prefix), keys)
+        keys = list(keys)
+        if len(keys) <= self._keys_chunk:
+            write_array(out, self._matching_keys(keys, pattern))
+            return
+        slot = len(out)
+        out.append(b'')
+        return self._stream_keys(out, slot, pattern, keys)
+
+    def _matching_keys(self, keys, pattern):
+        match = glob_matcher(pattern)
+        return self._live_keys(keys if match is None else [key for key in keys if match(key)])
+
+    async def _stream_keys(self, out, slot, pattern, keys):
+        # Other clients are served between chunks
+        reply = [b'']
+        count = 0
+        for start in range(0, len(keys), self._keys_chunk):
+            if start:
+                await asyncio.sleep(0)
+            found = self._matching_keys(keys[start:start + self._keys_chunk], pattern)
+            count += len(found)
+            for key in found:
+                write_bulk(reply, key)
+        reply[0] = b'*%d\r\n' % count
+        out[slot] = reply
+
+    @command('scan', -2, ('readonly',))
+    def _cmd_scan(self, args, out):
+        # SCAN cursor [MATCH pattern] [COUNT count]
+        cursor = parse_int(args[1])
+        pattern = None
+        count = 10
+        i = 2
+        while i + 1 < len(args):
+            option = _token(args[i])
+            if option == 'MATCH':
+                pattern = args[i + 1]
+            elif option == 'COUNT':
+                count = parse_int(args[i + 1])
+                if count < 1:
+                    raise CommandError('ERR syntax error')
+            else:
+                raise CommandError('ERR syntax error')
+            i += 2
+        if i != len(args):
+            raise CommandError('ERR syntax error')
+        after, keys = self._scan(self._decode_cursor(cursor), pattern, count)
+        out.append(b'*2\r\n')
+        write_bulk(out, str(self._encode_cursor(after)))
+        write_array(out, keys)
+
+    def _encode_cursor(self, key):
+        # The cursor is the last key examined, as an integer: scanning
+        # resumes right after it, without any state kept on the server.
+        if key is None:
+            return 0
+        raw = key if isinstance(key, bytes) else key.encode('utf-8', 'surrogateescape')
+        return int.from_bytes(b'\x01' + raw, 'big')
+
+    def _decode_cursor(self, cursor):
+        if cursor == 0:
+            return None
+        raw = cursor.to_bytes((cursor.bit_length() + 7) // 8, 'big') if cursor > 0 else b''
+        if raw[:1] != b'\x01':
+            raise CommandError('ERR invalid cursor')
+        return raw[1:] if self._binary else raw[1:].decode('utf-8', 'surrogateescape')
+
+    def _snapshot_view(self):
+        """Point-in-time copy of the dataset, for snapshots and full syncs."""
+        return {'data': self._data_view()}
+
+    def _data_view(self):
+        # Strings and tuple-encoded hashes are never changed in place, so
+        # only hashes that are dicts need a copy of their own
+        if not self._hash_tables:
+            return dict(self._data)
+        return {key: (dict(value) if type(value) is dict else value) for key, value in self._data.items()}
+
+    def _encode_hashes(self, data):
+        """Give the hashes in data, as read from a snapshot, the encoding
+        their size calls for."""
+        for key, value in data.items():
+            if value.__class__ in _LOADED_HASH_TYPES:
+                value = data[key] = hashes.encode(value, self._hash_max_entries, self._hash_max_value)
+                self._hash_tables |= type(value) is dict
+        return data
+
+    def _load_dataset(self, data, expiry):
+        """Replace the whole dataset, e.g. with the snapshot of a primary;
+        expiry maps keys to deadlines."""
+        # Replicas of this server hold the old dataset: make them resync
+        for replica in list(self._replicas.values()):
+            replica.client.kill(abort=True)
+        self._replicas.clear()
+        self._flushall()
+        self._load_entries(self._encode_hashes(data), expiry)
+
+    def _load_entries(self, data, expiry):
+        self._mset(data.items())
+
+    def _start_replication(self, host, port):
+        self._replica_link = ReplicaLink(self, host, port)
+        self._replica_task = asyncio.ensure_future(self._replica_link.run())
+        self._read_only = self._replica_read_only
+
+    def _stop_replication(self):
+        if self._replica_task is not None:
+            self._replica_task.cancel()
+        self._replica_task = None
+        self._replica_link = None
+        self._read_only = False
+
+    def _propagate(self, args):
+        """Send a write (raw bytes arguments) to the replicas."""
+        data = encode_command(args)
+        self._repl_offset += len(data)
+        self._repl_pending.append(data)
+        if not self._repl_flush_scheduled:
+            # Everything written during this loop iteration goes out in one write
+            self._repl_flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush_replication)
+
+    def _flush_replication(self):
+        self._repl_flush_scheduled = False
+        if not self._repl_pending:
+            return
+        data = b''.join(self._repl_pending)
+        self._repl_pending = []
+        for replica in list(self._replicas.values()):
+            if replica.state != 'online':
+                replica.buffer.append(data)
+                continue
+            replica.client.writer.write(data)
+            if replica.client.output_buffer_size() > self._replica_output_buffer_limit:
+                # Too far behind: drop it, it will reconnect and resync
+                self._obuf_disconnections += 1
+                replica.client.kill(abort=True)
+                del self._replicas[replica.client.id]
+
+    def _apply_replicated(self, args):
+        """Run a write received from the primary (raw bytes arguments)."""
+        entry = self._commands.get(args[0]) or self._commands.get(args[0].upper())
+        if entry is None:
+            return
+        raw = args
+        if not self._binary:
+            # A binary primary may send any bytes: keep them as encode_arg() would read them back
+            args = [arg.decode('utf-8', 'surrogateescape') for arg in args]
+        try:
+            entry[0](args, [])
+        except CommandError:
+            pass
+        if self._replicas:
+            self._propagate(raw)
 
     def _flushdb(self):
         self._data.clear()
+        self._reset_memory()
+        self._key_index = None
+        self._hash_tables = False
+        self._invalidate_all()
+        if self._notify_kinds:
+            self._notify('g', b'flushdb', None)
 
     def _flushall(self):
         self._data.clear()
+        self._reset_memory()
+        self._key_index = None
+        self._hash_tables = False
+        self._invalidate_all()
+        if self._notify_kinds:
+            self._notify('g', b'flushall', None)
+
+    def _track(self, name, args):
+        """Remember the keys read by a command of a client with tracking on."""
+        client = self._current_client
+        spec = self._read_keys.get(name)
+        if client is None or not client.tracking or spec is None:
+            return
+        first, last, step = spec
+        table = self._tracking_table
+        for key in args[first:len(args) if last < 0 else last + 1:step]:
+            ids = table.get(key)
+            if ids is None:
+                if len(table) >= self._tracking_max_keys:
+                    self._invalidate(next(iter(table)))
+                ids = table[key] = set()
+            ids.add(client.id)
+
+    def _invalidate(self, key):
+        """Owe the clients that read key an invalidation message."""
+        ids = self._tracking_table.pop(key, None)
+        if not ids:
+            return
+        raw = _to_bytes(key)
+        pending = self._tracking_pending
+        for client_id in ids:
+            keys = pending.get(client_id, _MISSING)
+            if keys is _MISSING:
+                pending[client_id] = [raw]
+            elif keys is not None:
+                keys.append(raw)
+        self._schedule_invalidations()
+
+    def _invalidate_all(self):
+        if not self._tracking_clients and not self._tracking_table:
+            return
+        self._tracking_table.clear()
+        for client in self._clients.values():
+            if client.tracking:
+                self._tracking_pending[client.id] = None
+        self._schedule_invalidations()
+
+    def _schedule_invalidations(self):
+        if not self._tracking_flush_scheduled:
+            self._tracking_flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush_invalidations)
+
+    def _flush_invalidations(self):
+        self._tracking_flush_scheduled = False
+        pending = self._tracking_pending
+        self._tracking_pending = {}
+        for client_id, keys in pending.items():
+            client = self._clients.get(client_id)
+            # Clients that have gone, or turned tracking off, are skipped
+            if client is not None and client.tracking and not client.killed:
+                client.writer.write(encode_invalidation(keys))
+
+    def _reset_memory(self):
+        self._used_memory = 0
+        if self._policy is not None:
+            self._policy.clear()
+
+    def _recount_memory(self):
+        self._reset_memory()
+        for key, value in self._data.items():
+            self._used_memory += _sizeof(key) + _sizeof(value) + _ENTRY_OVERHEAD
+            if self._policy is not None:
+                self._policy.touch(key)
+
+    def _over_limit(self, changes):
+        new_keys = added = 0
+        for key, value, grow in changes:
+            old = self._data.get(key, _MISSING)
+            if old is _MISSING:
+                new_keys += 1
+                added += _sizeof(key) + (_sizeof(value) if grow is None else grow) + _ENTRY_OVERHEAD
+            else:
+                added += _sizeof(value) - _sizeof(old) if grow is None else grow
+        if self._maxkeys and new_keys and len(self._data) + new_keys > self._maxkeys:
+            return True
+        return bool(self._maxmemory) and self._used_memory + added > self._maxmemory
+
+    def _ensure_memory(self, key, value, grow=None):
+        """Evict keys until key can be set to value within the limits, or
+        raise an OOM error. Called by write commands before they write.
+        Writes that change part of a value (e.g. hash fields) pass the bytes
+        they add as grow instead."""
+        self._ensure_memory_for([(key, value, grow)])
+
+    def _ensure_memory_for(self, changes):
+        """_ensure_memory() for several (key, value, grow) changes made by
+        one command, which fit within the limits together or not at all."""
+        if not self._limited or self._replica_link is not None:
+            # Replicas hold whatever the primary sends them
+            return
+        # More keys than maxkeys never fit: fail before evicting anything
+        too_many = self._maxkeys and len(changes) > self._maxkeys
+        while self._over_limit(changes):
+            victim = None if too_many or self._maxmemory_policy == 'noeviction' else self._eviction_victim()
+            if victim is None:
+                raise CommandError("OOM command not allowed when used memory > 'maxmemory'.")
+            # Through _del so subclasses drop expiry and persist the delete
+            self._del_event = ('e', b'evicted')
+            try:
+                self._del([victim])
+            finally:
+                self._del_event = _DEL_EVENT
+            self._evicted_keys += 1
+            if self._replicas:
+                self._propagate([b'DEL', _to_bytes(victim)])
+
+    def _eviction_victim(self):
+        return self._policy.victim() if self._policy is not None else None
+
+    def memory_info(self):
+        """Memory usage and eviction counters."""
+        if not self._limited:
+            self._recount_memory()
+        return {
+            'used_memory': self._used_memory,
+            'maxmemory': self._maxmemory,
+            'maxkeys': self._maxkeys,
+            'maxmemory_policy': self._maxmemory_policy,
+            'keys': len(self._data),
+            'evicted_keys': self._evicted_keys,
+        }
+
+    def local_client(self):
+        """Client for code running in this process, alongside a server
+        started with start_thread(): reads go straight to the dict, writes
+        are handed to the server's thread (see local.LocalClient)."""
+        from .local import LocalClient
+        return LocalClient(self)
+
+    def share_snapshot(self, name=None):
+        """Publish a point-in-time copy of the dataset in a shared memory
+        segment, which other processes on the host open by its name with
+        shared.SharedSnapshot. A snapshot published earlier is unlinked
+        (processes that have it open keep their copy). Returns the name."""
+        from .local import call_in_loop
+        from .shared import publish  # multiprocessing.shared_memory needs Python 3.8
+        view = call_in_loop(self, self._snapshot_view)
+        self._unshare_snapshot()
+        self._shared_segment = publish(view, name)
+        return self._shared_segment.name
+
+    def _unshare_snapshot(self):
+        if self._shared_segment is not None:
+            from .shared import unpublish
+            unpublish(self._shared_segment)
+            self._shared_segment = None
 
     def start_thread(self):
         def run():
-            self._loop = asyncio.new_event_loop()
+            self._loop = new_event_loop(self._event_loop)
             asyncio.set_event_loop(self._loop)
             self._loop.run_until_complete(self.start())
             try:
@@ -0,0 +1,189 @@
+import asyncio
+import os
+import tempfile
+import time
+from .resp import ProtocolError, RequestParser, encode_command
+from .snapshot import MappedSnapshot, write_binary
+
+# Snapshot bytes sent or received per write/read during a full sync
+_CHUNK = 1024 * 1024
+
+
+def new_replid():
+    """Random replication id, as in Redis: 40 hex characters."""
+    return os.urandom(20).hex()
+
+
+def write_snapshot_file(view):
+    """Serialize view ({'data': ..., 'expiry': ...}) to an anonymous
+    temporary file, rewound to its start. Runs on a worker thread."""
+    f = tempfile.TemporaryFile()
+    try:
+        write_binary(f, view['data'], view.get('expiry'))
+        f.seek(0)
+    except BaseException:
+        f.close()
+        raise
+    return f
+
+
+class Replica:
+    """A replica connected to this server, as seen by the primary.
+
+    Commands propagated while its snapshot is being sent are kept in
+    buffer and written after it; once online, they are written to its
+    connection directly.
+    """
+    __slots__ = ('client', 'listening_port', 'state', 'buffer', 'ack_offset', 'last_ack')
+
+    def __init__(self, client):
+        self.client = client
+        self.listening_port = 0
+        self.state = 'wait_bgsave'
+        self.buffer = []
+        self.ack_offset = 0
+        self.last_ack = time.monotonic()
+
+    async def full_sync(self, view, replid, offset):
+        loop = asyncio.get_running_loop()
+        writer = self.client.writer
+        f = await loop.run_in_executor(None, write_snapshot_file, view)
+        try:
+            self.state = 'send_bulk'
+            size = os.fstat(f.fileno()).st_size
+            writer.write(b'+FULLRESYNC %s %d\r\n$%d\r\n' % (replid.encode(), offset, size))
+            while True:
+                chunk = f.read(_CHUNK)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+        finally:
+            f.close()
+        writer.writelines(self.buffer)
+        self.buffer = None
+        self.state = 'online'
+
+    def info(self, offset):
+        host = self.client.addr.rsplit(':', 1)[0]
+        lag = int(time.monotonic() - self.last_ack)
+        return (f'ip={host},port={self.listening_port},state={self.state},'
+                f'offset={self.ack_offset if self.state == "online" else offset},lag={lag}')
+
+
+class ReplicaLink:
+    """Connection of a replica to its primary.
+
+    run() connects, loads the primary's snapshot into server through
+    server._load_dataset(), then applies the stream of write commands that
+    follows with server._apply_replicated(). It reconnects, with a new full
+    sync, whenever the link drops, until it is cancelled.
+    """
+
+    def __init__(self, server, host, port, retry_interval=1.0):
+        self.server = server
+        self.host = host
+        self.port = port
+        self.retry_interval = retry_interval
+        self.state = 'connect'
+        self.replid = '?'
+        self.offset = -1
+        self.last_io = time.monotonic()
+        self.full_syncs = 0
+
+    async def run(self):
+        while True:
+            try:
+                await self._sync()
+            except (OSError, EOFError, ProtocolError, ValueError, asyncio.IncompleteReadError):
+                pass
+            self.state = 'connect'
+            await asyncio.sleep(self.retry_interval)
+
+    async def _sync(self):
+        self.state = 'connecting'
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        acks = None
+        try:
+            self.state = 'handshake'
+            writer.write(encode_command([b'REPLCONF', b'listening-port', b'%d' % (self.server._port or 0)]))
+            await self._expect_ok(reader)
+            writer.write(encode_command([b'PSYNC', self.replid.encode(), b'%d' % self.offset]))
+            line = await reader.readline()
+            if not line.startswith(b'+FULLRESYNC '):
+                raise ProtocolError(f'unexpected reply to PSYNC: {line[:64]!r}')
+            _, replid, offset = line.split()
+            self.state = 'sync'
+            await self._load_snapshot(reader)
+            self.replid = replid.decode()
+            self.offset = int(offset)
+            self.full_syncs += 1
+            self.state = 'connected'
+            acks = asyncio.ensure_future(self._send_acks(writer))
+            await self._stream(reader)
+        finally:
+            if acks is not None:
+                acks.cancel()
+            writer.close()
+
+    async def _expect_ok(self, reader):
+        line = await reader.readline()
+        if not line.startswith(b'+'):
+            raise ProtocolError(f'primary refused replication: {line[:64]!r}')
+
+    async def _load_snapshot(self, reader):
+        header = await reader.readline()
+        if not header.startswith(b'$'):
+            raise ProtocolError('expected the snapshot bulk string')
+        remaining = int(header[1:])
+        fd, path = tempfile.mkstemp(prefix='remotedict-replica-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while remaining:
+                    chunk = await reader.read(min(remaining, _CHUNK))
+                    if not chunk:
+                        raise EOFError('primary closed the link during the full sync')
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            snapshot = MappedSnapshot(path)
+            try:
+                text = not self.server._binary
+                keys = snapshot.keys(text)
+                data = dict(zip(keys, snapshot.values(text)))
+                expiry = {key: deadline for key, deadline in zip(keys, snapshot.expiry()) if deadline is not None}
+            finally:
+                snapshot.close()
+        finally:
+            os.unlink(path)
+        self.last_io = time.monotonic()
+        self.server._load_dataset(data, expiry)
+
+    async def _stream(self, reader):
+        parser = RequestParser()
+        apply = self.server._apply_replicated
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                return
+            self.last_io = time.monotonic()
+            parser.feed(chunk)
+            before = len(parser)
+            for args in parser.parse():
+                apply(args)
+            # Bytes of complete commands applied from this chunk and earlier ones
+            self.offset += before - len(parser)
+
+    async def _send_acks(self, writer):
+        while True:
+            writer.write(encode_command([b'REPLCONF', b'ACK', b'%d' % self.offset]))
+            await asyncio.sleep(1)
+
+    def info(self):
+        return {
+            'master_host': self.host,
+            'master_port': self.port,
+            'master_link_status': 'up' if self.state == 'connected' else 'down',
+            'master_last_io_seconds_ago': int(time.monotonic() - self.last_io) if self.offset >= 0 else -1,
+            'master_sync_in_progress': int(self.state == 'sync'),
+            'slave_repl_offset': self.offset,
+        }
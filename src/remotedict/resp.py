@@ -0,0 +1,342 @@
+OK = b'+OK\r\n'
+NULL_BULK = b'$-1\r\n'
+CRLF = b'\r\n'
+
+# Headers for short bulk strings are built once and shared by every reply.
+_BULK_HEADERS = [b'$%d\r\n' % n for n in range(1024)]
+
+# Largest argument count and bulk length accepted in a request, as in Redis
+# (proto-max-bulk-len): larger ones are rejected rather than buffered.
+MAX_ARGS = (1 << 31) - 1
+MAX_BULK_LENGTH = 512 * 1024 * 1024
+# Longest *<count> or $<length> line waited for, as Redis' inline limit
+MAX_HEADER_LENGTH = 64 * 1024
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class ReplyError(Exception):
+    """An error reply (-ERR ...) decoded by ReplyParser."""
+
+
+class Push(list):
+    """A push message (>...) decoded by ReplyParser: sent by the server on
+    its own, e.g. to invalidate keys cached by a client, rather than in
+    reply to a command."""
+
+
+class CommandError(Exception):
+    """Raised by command handlers and sent to the client as an error reply.
+
+    The message starts with the error code, e.g. 'ERR syntax error'.
+    """
+
+
+def bulk_header(length):
+    if length < 1024:
+        return _BULK_HEADERS[length]
+    return b'$%d\r\n' % length
+
+
+def integer(n):
+    return b':%d\r\n' % n
+
+
+def write_bulk(out, value):
+    """Append a bulk string reply for value (str, bytes-like, int as
+    stored by INCR, or None) to out."""
+    if value is None:
+        out.append(NULL_BULK)
+        return
+    if isinstance(value, str):
+        # Values loaded or replicated from bytes keep non-UTF-8 bytes as surrogates
+        value = value.encode('utf-8', 'surrogateescape')
+    elif type(value) is int:
+        value = b'%d' % value
+    out.append(bulk_header(len(value)))
+    out.append(value)
+    out.append(CRLF)
+
+
+def write_array(out, items):
+    out.append(b'*%d\r\n' % len(items))
+    for item in items:
+        write_bulk(out, item)
+
+
+def encode_arg(arg):
+    """Command argument as bytes: str is encoded as UTF-8, numbers are
+    written out in decimal."""
+    if type(arg) is bytes:
+        return arg
+    if isinstance(arg, str):
+        return arg.encode('utf-8', 'surrogateescape')
+    if isinstance(arg, (int, float)):
+        return repr(arg).encode()
+    return bytes(arg)
+
+
+def encode_invalidation(keys):
+    """The push message telling a tracking client to drop keys (raw
+    bytes) from its cache; keys of None drops everything, after a flush.
+    As in RESP3, but with a RESP2 null array, the only null this server
+    writes."""
+    out = [b'>2\r\n$10\r\ninvalidate\r\n']
+    if keys is None:
+        out.append(b'*-1\r\n')
+    else:
+        write_array(out, keys)
+    return b''.join(out)
+
+
+def encode_message(channel, message, pattern=None):
+    """What a subscriber receives for a message published to channel (all
+    raw bytes): ['message', channel, message], or ['pmessage', pattern,
+    channel, message] for a subscription to pattern."""
+    if pattern is None:
+        out = [b'*3\r\n$7\r\nmessage\r\n']
+    else:
+        out = [b'*4\r\n$8\r\npmessage\r\n', bulk_header(len(pattern)), pattern, CRLF]
+    out += (bulk_header(len(channel)), channel, CRLF, bulk_header(len(message)), message, CRLF)
+    return b''.join(out)
+
+
+def encode_subscription(kind, channel, count):
+    """The reply for one channel or pattern of a (P)SUBSCRIBE or
+    (P)UNSUBSCRIBE: [kind, channel (None if there were none to unsubscribe
+    from), subscriptions left]."""
+    out = [b'*3\r\n']
+    write_bulk(out, kind)
+    write_bulk(out, channel)
+    out.append(integer(count))
+    return b''.join(out)
+
+
+def encode_command(args):
+    """Encode a command (a sequence of bytes arguments) as a RESP array."""
+    out = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        out.append(bulk_header(len(arg)))
+        out.append(arg)
+        out.append(CRLF)
+    return b''.join(out)
+
+
+class _Incomplete(Exception):
+    pass
+
+
+class RequestParser:
+    """Incremental RESP request parser.
+
+    Bytes received from the socket are appended with feed(); parse() then
+    decodes every complete command in the buffer in one pass (or at most
+    limit of them) and keeps the remainder for the next call. The arguments
+    of a partial command are kept too, so each call only parses new ones.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        # Bytes still missing from the partial command at the head of the
+        # buffer, when that is known (i.e. we are inside a bulk argument).
+        self.pending = 0
+        # (arguments parsed, argument count, offset of the next argument) of
+        # the partial command at the head of the buffer, if any
+        self._partial = None
+
+    def feed(self, data):
+        self._buf += data
+
+    def __len__(self):
+        return len(self._buf)
+
+    def parse(self, limit=None):
+        buf = self._buf
+        end = len(buf)
+        view = memoryview(buf)
+        commands = []
+        pos = 0
+        self.pending = 0
+        partial, self._partial = self._partial, None
+        try:
+            while pos < end and (limit is None or len(commands) < limit):
+                if partial is not None:
+                    args, num_args, p = partial
+                    partial = None
+                else:
+                    if buf[pos] != 42:  # b'*'
+                        raise ProtocolError('expected array')
+                    eol = buf.find(b'\r\n', pos)
+                    if eol < 0:
+                        if end - pos > MAX_HEADER_LENGTH:
+                            raise ProtocolError('too big mbulk count string')
+                        break
+                    num_args = int(buf[pos + 1:eol])
+                    if num_args < 0 or num_args > MAX_ARGS:
+                        raise ProtocolError('invalid multibulk length')
+                    p = eol + 2
+                    args = []
+                while len(args) < num_args:
+                    if p >= end:
+                        break
+                    if buf[p] != 36:  # b'$'
+                        raise ProtocolError('expected bulk string')
+                    eol = buf.find(b'\r\n', p)
+                    if eol < 0:
+                        if end - p > MAX_HEADER_LENGTH:
+                            raise ProtocolError('too big bulk count string')
+                        break
+                    length = int(buf[p + 1:eol])
+                    if length < 0 or length > MAX_BULK_LENGTH:
+                        raise ProtocolError('invalid bulk length')
+                    start = eol + 2
+                    if start + length + 2 > end:
+                        self.pending = start + length + 2 - end
+                        break
+                    args.append(bytes(view[start:start + length]))
+                    p = start + length + 2
+                else:
+                    commands.append(args)
+                    pos = p
+                    continue
+                # Partial command: it starts at the head of the buffer once
+                # the complete ones before it are dropped
+                self._partial = (args, num_args, p - pos)
+                break
+            if partial is not None:
+                self._partial = partial  # limit reached before it was resumed
+        except ValueError:
+            raise ProtocolError('invalid length')
+        finally:
+            view.release()
+        if pos:
+            del buf[:pos]
+        return commands
+
+
+class ReplyParser:
+    """Incremental RESP reply parser, the client-side counterpart of
+    RequestParser.
+
+    parse() returns the decoded value of every complete reply in the
+    buffer: bytes for simple and bulk strings, int for integers, list for
+    arrays, None for nulls, ReplyError instances for error replies and
+    Push instances for push messages. With raw=True the undecoded bytes of each reply are returned instead.
+
+    Bulk and simple strings, which make up nearly every reply of this
+    server (and bulk strings every item of its arrays), are parsed inline
+    rather than by _read().
+    Received chunks are kept in a list and only joined once there are
+    enough bytes for the reply that was cut short, so a large reply is not
+    copied again for every chunk of it.
+    """
+
+    def __init__(self):
+        self._buf = b''
+        self._chunks = []
+        self._size = 0
+        self._need = 0  # Bytes needed before parsing can make progress
+
+    def feed(self, data):
+        self._chunks.append(data)
+        self._size += len(data)
+
+    def __len__(self):
+        return self._size
+
+    def parse(self, raw=False):
+        if self._size < self._need or not self._chunks:
+            return []
+        buf = self._buf
+        if buf or len(self._chunks) > 1:
+            buf = buf + b''.join(self._chunks)
+        else:
+            buf = self._chunks[0]
+        self._chunks = []
+        size = len(buf)
+        replies = []
+        pos = 0
+        need = 0
+        try:
+            while pos < size:
+                kind = buf[pos]
+                if kind == 36 or kind == 43:  # b'$', b'+'
+                    eol = buf.find(b'\r\n', pos)
+                    if eol < 0:
+                        need = size + 1
+                        break
+                    if kind == 43:
+                        value = buf[pos + 1:eol]
+                        end = eol + 2
+                    else:
+                        length = int(buf[pos + 1:eol])
+                        if length < 0:
+                            value = None
+                            end = eol + 2
+                        else:
+                            end = eol + 4 + length
+                            if end > size:
+                                need = end
+                                break
+                            value = buf[eol + 2:end - 2]
+                else:
+                    value, end = self._read(buf, pos, size)
+                replies.append(buf[pos:end] if raw else value)
+                pos = end
+        except _Incomplete as e:
+            need = e.args[0] if e.args else size + 1
+        except ValueError:
+            raise ProtocolError('invalid reply')
+        self._buf = buf[pos:] if pos else buf
+        self._size = size - pos
+        self._need = need - pos
+        return replies
+
+    def _read(self, buf, pos, size):
+        eol = buf.find(b'\r\n', pos)
+        if eol < 0:
+            raise _Incomplete()
+        kind = buf[pos]
+        if kind == 36:  # b'$'
+            length = int(buf[pos + 1:eol])
+            if length < 0:
+                return None, eol + 2
+            end = eol + 4 + length
+            if end > size:
+                raise _Incomplete(end)
+            return buf[eol + 2:end - 2], end
+        if kind == 43:  # b'+'
+            return buf[pos + 1:eol], eol + 2
+        if kind == 58:  # b':'
+            return int(buf[pos + 1:eol]), eol + 2
+        if kind == 45:  # b'-'
+            return ReplyError(buf[pos + 1:eol].decode(errors='replace')), eol + 2
+        if kind == 42 or kind == 62:  # b'*', b'>'
+            count = int(buf[pos + 1:eol])
+            if count < 0:
+                return None, eol + 2
+            pos = eol + 2
+            items = [] if kind == 42 else Push()
+            append = items.append
+            for _ in range(count):
+                if pos < size and buf[pos] == 36:
+                    eol = buf.find(b'\r\n', pos)
+                    if eol < 0:
+                        raise _Incomplete()
+                    length = int(buf[pos + 1:eol])
+                    if length < 0:
+                        append(None)
+                        pos = eol + 2
+                        continue
+                    end = eol + 4 + length
+                    if end > size:
+                        raise _Incomplete(end)
+                    append(buf[eol + 2:end - 2])
+                    pos = end
+                else:
+                    item, pos = self._read(buf, pos, size)
+                    append(item)
+            return items, pos
+        raise ProtocolError(f'unexpected reply type {chr(kind)!r}')
@@ -0,0 +1,401 @@
+import asyncio
+import collections
+import inspect
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import zlib
+from .netconfig import new_event_loop, set_buffer_sizes
+from .remotedict import RemoteDict, _flatten, command_table
+from .resp import OK, ReplyError, ReplyParser, encode_command, integer, write_array, write_bulk
+
+
+def shard_for_key(key, count):
+    """Index of the shard owning key (raw bytes) out of count shards."""
+    return zlib.crc32(key) % count
+
+
+def _decode(raw):
+    parser = ReplyParser()
+    parser.feed(raw)
+    return parser.parse()[0]
+
+
+def _encode_keys(values):
+    out = []
+    write_array(out, [key for keys in values for key in keys])
+    return b''.join(out)
+
+
+# Commands whose keys (args[1:]) are split by owner; the replies of the
+# shards involved are combined into one.
+_MULTI_KEY_COMMANDS = {
+    b'DEL': lambda values: integer(sum(values)),
+    b'EXISTS': lambda values: integer(sum(values)),
+}
+
+# Commands fanned out to every shard. Subscribers are connected to one
+# worker each, so a PUBLISH reaches them all through their workers.
+_ALL_SHARD_COMMANDS = {
+    b'KEYS': _encode_keys,
+    b'FLUSHDB': lambda values: OK,
+    b'FLUSHALL': lambda values: OK,
+    b'PUBLISH': lambda values: integer(sum(values)),
+}
+
+
+class _PeerLink:
+    """Pipelined connection from one shard to a peer shard's Unix socket.
+
+    request() writes the command immediately and returns a future for the
+    raw reply; replies are matched to requests in order.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._writer = None
+        self._connecting = None
+        self._backlog = []
+        self._waiters = collections.deque()
+
+    def request(self, args):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        data = encode_command(args)
+        if self._writer is not None:
+            self._writer.write(data)
+        else:
+            self._backlog.append(data)
+            if self._connecting is None:
+                self._connecting = asyncio.ensure_future(self._connect())
+        return future
+
+    async def _connect(self):
+        for _ in range(50):
+            try:
+                reader, writer = await asyncio.open_unix_connection(self._path)
+                break
+            except OSError:
+                await asyncio.sleep(0.1)  # Peer may still be starting
+        else:
+            self._connecting = None
+            self._backlog = []
+            self._fail_waiters()
+            return
+        writer.write(b''.join(self._backlog))
+        self._backlog = []
+        self._writer = writer
+        self._connecting = None
+        asyncio.ensure_future(self._read_replies(reader, writer))
+
+    async def _read_replies(self, reader, writer):
+        parser = ReplyParser()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                parser.feed(data)
+                for reply in parser.parse(raw=True):
+                    future = self._waiters.popleft()
+                    if not future.done():
+                        future.set_result(reply)
+        except Exception:
+            pass
+        finally:
+            self._writer = None
+            writer.close()
+            self._fail_waiters()
+
+    def _fail_waiters(self):
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError('shard connection lost'))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class _ShardMixin:
+    """Turns a RemoteDict class into one shard of a ShardedRemoteDict.
+
+    The shard accepts clients on the shared public port (SO_REUSEPORT) and
+    serves peer shards on its own Unix socket. Commands on keys owned by
+    another shard are forwarded to that shard's socket; commands spanning
+    several shards are fanned out and their replies combined.
+    """
+
+    def _init_shard(self, index, socket_paths):
+        self._shard_index = index
+        self._shard_count = len(socket_paths)
+        self._socket_paths = socket_paths
+        self._peers = {}
+        self._peer_server = None
+        self._connections = set()
+        # Commands whose only key is args[1] (per their registered key
+        # positions) are routed to the shard owning it
+        self._single_key_commands = {name for name, spec in command_table(type(self)).items()
+                                     if spec.first_key == spec.last_key == 1}
+
+    async def _listen(self):
+        options = dict(self._tcp_options(), reuse_port=True)
+        server = await asyncio.start_server(self._handle_request, self._address, self._port, **options)
+        set_buffer_sizes(server, self._sndbuf, self._rcvbuf)
+        self._peer_server = await asyncio.start_unix_server(self._handle_peer_request,
+                                                            self._socket_paths[self._shard_index])
+        self._peers = {i: _PeerLink(path) for i, path in enumerate(self._socket_paths) if i != self._shard_index}
+        print(f"Shard {self._shard_index} listening on {self._address}:{self._port}")
+        return server
+
+    async def stop(self):
+        for peer in self._peers.values():
+            peer.close()
+        if self._peer_server:
+            self._peer_server.close()
+            await self._peer_server.wait_closed()
+        await super().stop()
+        # Let open connections finish instead of being cancelled on exit
+        for writer in list(self._connections):
+            writer.close()
+        for _ in range(10):
+            if not self._connections:
+                break
+            await asyncio.sleep(0.01)
+
+    async def _handle_request(self, reader, writer, execute=None):
+        self._connections.add(writer)
+        try:
+            await super()._handle_request(reader, writer, execute)
+        finally:
+            self._connections.discard(writer)
+
+    async def _handle_peer_request(self, reader, writer):
+        # Requests from peers are already routed here, so run them locally
+        await self._handle_request(reader, writer, self._execute_local)
+
+    def _execute_local(self, args, out):
+        return super()._execute(args, out)
+
+    def _execute(self, args, out):
+        if not args or self._shard_count == 1:
+            return super()._execute(args, out)
+        cmd = args[0].upper()
+        if cmd == b'CLIENT' and len(args) > 2 and args[1].upper() == b'TRACKING':
+            # Keys read through another shard would not be tracked
+            out.append(b'-ERR CLIENT TRACKING is not available with more than one shard\r\n')
+            return
+        if cmd in self._single_key_commands and len(args) >= 2:
+            owner = shard_for_key(args[1], self._shard_count)
+            if owner == self._shard_index:
+                return super()._execute(args, out)
+            slot = len(out)
+            out.append(b'')
+            return self._forward(out, slot, self._peers[owner].request(args))
+        if cmd in _MULTI_KEY_COMMANDS and len(args) >= 2:
+            groups = {}
+            for key in args[1:]:
+                groups.setdefault(shard_for_key(key, self._shard_count), [args[0]]).append(key)
+            return self._fan_out(out, groups.items(), _MULTI_KEY_COMMANDS[cmd])
+        if cmd in _ALL_SHARD_COMMANDS:
+            return self._fan_out(out, [(i, args) for i in range(self._shard_count)], _ALL_SHARD_COMMANDS[cmd])
+        if cmd == b'SCAN' and len(args) >= 2:
+            return self._scan_shards(args, out)
+        if cmd == b'MGET' and len(args) >= 2:
+            return self._mget_shards(args, out)
+        if cmd in (b'MSET', b'MSETNX') and len(args) >= 3 and len(args) % 2 == 1:
+            groups = {}
+            for i in range(1, len(args), 2):
+                groups.setdefault(shard_for_key(args[i], self._shard_count), [args[0]]).extend(args[i:i + 2])
+            if cmd == b'MSETNX' and len(groups) > 1:
+                # All or nothing cannot be guaranteed across shards
+                out.append(b"-CROSSSLOT Keys in request don't hash to the same shard\r\n")
+                return
+            return self._fan_out(out, groups.items(), lambda values: OK if cmd == b'MSET' else integer(values[0]))
+        return super()._execute(args, out)
+
+    def _mget_shards(self, args, out):
+        positions = {}
+        for i, key in enumerate(args[1:]):
+            positions.setdefault(shard_for_key(key, self._shard_count), []).append(i)
+
+        def combine(values):
+            # Put each shard's values back in the order the keys were given
+            result = [None] * (len(args) - 1)
+            for indexes, shard_values in zip(positions.values(), values):
+                for i, value in zip(indexes, shard_values):
+                    result[i] = value
+            reply = []
+            write_array(reply, result)
+            return b''.join(reply)
+
+        parts = [(owner, [args[0]] + [args[i + 1] for i in indexes]) for owner, indexes in positions.items()]
+        return self._fan_out(out, parts, combine)
+
+    def _scan_shards(self, args, out):
+        # Shards are scanned one after the other. The client's cursor is
+        # shard cursor * shard count + shard index, so a finished shard
+        # hands over to the next one with cursor 0.
+        try:
+            cursor = int(args[1])
+        except ValueError:
+            return super()._execute(args, out)  # Let the shard report the error
+        count = self._shard_count
+        shard, local = cursor % count, cursor // count
+
+        def combine(values):
+            next_local, keys = values[0]
+            next_local = int(next_local)
+            if next_local:
+                next_cursor = next_local * count + shard
+            else:
+                next_cursor = shard + 1 if shard + 1 < count else 0
+            reply = [b'*2\r\n']
+            write_bulk(reply, str(next_cursor))
+            write_array(reply, keys)
+            return b''.join(reply)
+
+        part = [args[0], str(local).encode()] + args[2:]
+        return self._fan_out(out, [(shard, part)], combine)
+
+    def _fan_out(self, out, parts, combine):
+        slot = len(out)
+        out.append(b'')
+        results = []
+        for owner, part in parts:
+            if owner == self._shard_index:
+                local = []
+                waiter = super()._execute(part, local)
+                if waiter is None:
+                    results.append(_decode(b''.join(local)))
+                else:
+                    results.append(asyncio.ensure_future(self._local_reply(waiter, local)))
+            else:
+                results.append(self._peers[owner].request(part))
+        return self._combine(out, slot, results, combine)
+
+    async def _local_reply(self, waiter, local):
+        await waiter
+        return b''.join(_flatten(local))
+
+    async def _forward(self, out, slot, future):
+        try:
+            out[slot] = await future
+        except ConnectionError as e:
+            out[slot] = f'-ERR {e}\r\n'.encode()
+
+    async def _combine(self, out, slot, results, combine):
+        values = []
+        try:
+            for result in results:
+                if isinstance(result, asyncio.Future):
+                    result = _decode(await result)
+                values.append(result)
+        except ConnectionError as e:
+            out[slot] = f'-ERR {e}\r\n'.encode()
+            return
+        for value in values:
+            if isinstance(value, ReplyError):
+                out[slot] = f'-{value}\r\n'.encode()
+                return
+        out[slot] = combine(values)
+
+
+_shard_classes = {}
+
+
+def _shard_class(dict_class):
+    cls = _shard_classes.get(dict_class)
+    if cls is None:
+        cls = type('Sharded' + dict_class.__name__, (_ShardMixin, dict_class), {})
+        _shard_classes[dict_class] = cls
+    return cls
+
+
+def _run_worker(dict_class, index, socket_paths, address, port, kwargs, ready):
+    shard = _shard_class(dict_class)(address, port, **kwargs)
+    shard._init_shard(index, socket_paths)
+
+    async def main():
+        stopping = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopping.set)
+        await shard.start()
+        ready.put(index)
+        await stopping.wait()
+        await shard.stop()
+
+    loop = new_event_loop(shard._event_loop)
+    try:
+        loop.run_until_complete(main())
+    finally:
+        loop.close()
+
+
+class ShardedRemoteDict:
+    """Runs a RemoteDict (or any subclass) as N worker processes.
+
+    Every worker listens on the same address and port with SO_REUSEPORT, so
+    the kernel spreads client connections across them, and owns the keys
+    that hash to it (see shard_for_key). Keys owned by another worker are
+    read and written over that worker's Unix socket.
+
+    Persistent classes get one file per worker, derived from filename, so
+    the worker count must stay the same across restarts.
+    """
+
+    def __init__(self, address="127.0.0.1", port=6379, workers=None, dict_class=RemoteDict, **kwargs):
+        if not hasattr(socket, 'SO_REUSEPORT') or not hasattr(socket, 'AF_UNIX'):
+            raise RuntimeError('ShardedRemoteDict requires SO_REUSEPORT and Unix domain sockets')
+        if kwargs.get('unix_socket'):
+            raise ValueError('ShardedRemoteDict workers share a TCP port; unix_socket is not supported')
+        if kwargs.get('replicaof'):
+            raise ValueError('ShardedRemoteDict does not support replication')
+        self._address = address
+        self._port = port
+        self._workers = workers or os.cpu_count() or 1
+        self._dict_class = dict_class
+        self._kwargs = kwargs
+        self._processes = []
+        self._socket_dir = None
+
+    def _worker_kwargs(self, index):
+        kwargs = dict(self._kwargs)
+        param = inspect.signature(self._dict_class.__init__).parameters.get('filename')
+        if param is not None and self._workers > 1:
+            root, ext = os.path.splitext(kwargs.get('filename', param.default))
+            kwargs['filename'] = f"{root}.shard{index}{ext}"
+        return kwargs
+
+    def start_workers(self, timeout=30):
+        ctx = multiprocessing.get_context('spawn')
+        self._socket_dir = tempfile.mkdtemp(prefix='remotedict-')
+        socket_paths = [os.path.join(self._socket_dir, f'shard{i}.sock') for i in range(self._workers)]
+        ready = ctx.Queue()
+        for index in range(self._workers):
+            process = ctx.Process(target=_run_worker, daemon=True,
+                                  args=(self._dict_class, index, socket_paths, self._address, self._port,
+                                        self._worker_kwargs(index), ready))
+            process.start()
+            self._processes.append(process)
+        try:
+            for _ in range(self._workers):
+                ready.get(timeout=timeout)
+        except Exception:
+            self.stop_workers()
+            raise RuntimeError('sharded server workers failed to start')
+        print(f"Sharded server started on {self._address}:{self._port} with {self._workers} workers")
+
+    def stop_workers(self):
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            process.join(timeout=5)
+        self._processes = []
+        if self._socket_dir:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+            self._socket_dir = None
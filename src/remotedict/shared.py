@@ -0,0 +1,104 @@
+import io
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+from .snapshot import TYPE_STRING, _decode_hash, _slices, read_index, value_bounds, write_binary
+
+# Names of the segments published by this process and not yet unpublished
+_published = set()
+
+
+def publish(view, name=None):
+    """Write a snapshot view (see RemoteDict._snapshot_view()) to a new
+    shared memory segment, in the binary snapshot format. Returns the
+    SharedMemory, which the caller passes to unpublish() when done with it."""
+    f = io.BytesIO()
+    size = write_binary(f, view['data'], view.get('expiry'))
+    segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+    segment.buf[:size] = f.getbuffer()
+    _published.add(segment.name)
+    return segment
+
+
+def unpublish(segment):
+    """Unlink a segment from publish(); processes that have it open keep
+    their mapping until they close it."""
+    _published.discard(segment.name)
+    segment.close()
+    segment.unlink()
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        pass
+    # Before 3.13 every process attaching a segment on POSIX registers it
+    # with its resource tracker, which unlinks it when the process exits
+    segment = shared_memory.SharedMemory(name=name)
+    if os.name == 'posix' and segment.name not in _published:
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+
+class SharedSnapshot:
+    """Read-only view of a dataset published with
+    RemoteDict.share_snapshot(), for other processes on the same host.
+
+    Opening it reads the keys into a dict of positions; each get() then
+    copies one value out of the shared segment, with no socket or parsing
+    in between. The view is of the dataset at the time it was shared:
+    writes made since are not seen until the server shares a new snapshot
+    and the view is reopened. Keys past their deadline are reported as
+    missing. Keys may be given as str or bytes; values are bytes, or str
+    with text=True.
+    """
+
+    def __init__(self, name, text=False):
+        self._segment = _attach(name)
+        self._text = text
+        buf = self._segment.buf
+        (self.count, keys_offset, self._types, key_offsets, self._value_offsets,
+         self._deadlines) = read_index(buf)
+        raw = bytes(buf[keys_offset:keys_offset + key_offsets[-1]])
+        self._positions = {key: i for i, key in enumerate(_slices(raw, key_offsets))}
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return self._position(key) is not None
+
+    def _position(self, key):
+        if isinstance(key, str):
+            key = key.encode('utf-8', 'surrogateescape')
+        i = self._positions.get(key)
+        if i is None:
+            return None
+        deadline = self._deadlines[i]
+        if deadline == deadline and time.time() > deadline:  # NaN for no expiry
+            return None
+        return i
+
+    def _value(self, i):
+        start, end = value_bounds(self._value_offsets, i)
+        value = bytes(self._segment.buf[start:end])
+        if self._types[i] != TYPE_STRING:
+            return dict(zip(*[iter(_decode_hash(value, self._text))] * 2))
+        return value.decode('utf-8', 'surrogateescape') if self._text else value
+
+    def get(self, key):
+        """Value of key, or None; a hash is returned as a dict."""
+        i = self._position(key)
+        return None if i is None else self._value(i)
+
+    def mget(self, keys):
+        """Values of keys, None for those missing or holding hashes."""
+        values = []
+        for key in keys:
+            i = self._position(key)
+            values.append(None if i is None or self._types[i] != TYPE_STRING else self._value(i))
+        return values
+
+    def close(self):
+        self._segment.close()
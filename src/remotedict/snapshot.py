@@ -0,0 +1,251 @@
+import contextlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from .hashes import TYPES as _HASH_TYPES, flat
+
+# Layout of a binary snapshot:
+#
+#   header   MAGIC, flags (reserved), entry count, offset of the keys
+#            section, offset of the index
+#   values   every value's bytes, back to back
+#   keys     every key's bytes, back to back
+#   index    type per entry (u8), key offsets (count + 1 x u64), value
+#            offsets (count + 1 x u64), expiry timestamps (count x f64,
+#            NaN for none)
+#
+# Offsets are relative to the start of their section, so entry i is
+# keys[key_offsets[i]:key_offsets[i + 1]]. The index is made of flat
+# arrays, which lets startup slice keys and values with list
+# comprehensions instead of unpacking one record at a time.
+#
+# The value of a TYPE_HASH entry is its number of fields and values (u32),
+# their lengths (u32 each) and their bytes back to back.
+MAGIC = b'RDSNAP02'
+_HEADER = struct.Struct('<8sIQQQ')
+_U32 = struct.Struct('<I')
+
+TYPE_STRING = 0
+TYPE_HASH = 1
+
+_NO_EXPIRY = float('nan')
+
+
+def _to_bytes(value):
+    if isinstance(value, str):
+        return value.encode('utf-8', 'surrogateescape')
+    if type(value) is int:
+        # Counters are stored as ints and saved as their decimal string
+        return b'%d' % value
+    return value
+
+
+def _to_little_endian(arr):
+    if sys.byteorder != 'little':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr
+
+
+def _slices(buf, offsets, base=0):
+    return [buf[base + start:base + end] for start, end in zip(offsets, offsets[1:])]
+
+
+def _encode_hash(h):
+    items = [_to_bytes(item) for item in flat(h)]
+    lengths = array('I', [len(item) for item in items])
+    return _U32.pack(len(items)) + _to_little_endian(lengths).tobytes() + b''.join(items)
+
+
+def _decode_hash(buf, text):
+    """Fields and values of a hash, alternating, as a flat tuple."""
+    count, = _U32.unpack_from(buf, 0)
+    lengths = array('I')
+    lengths.frombytes(buf[4:4 + 4 * count])
+    if sys.byteorder != 'little':
+        lengths.byteswap()
+    pos = 4 + 4 * count
+    items = []
+    for length in lengths:
+        items.append(buf[pos:pos + length])
+        pos += length
+    if text:
+        return tuple(item.decode('utf-8', 'surrogateescape') for item in items)
+    return tuple(items)
+
+
+def is_binary_snapshot(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+@contextlib.contextmanager
+def atomic_file(filename, mode='wb'):
+    """Open a new temporary file next to filename for writing; if the block
+    succeeds it is synced and renamed over filename. Every call gets a file
+    of its own, so two saves in flight never write to the same one."""
+    directory, name = os.path.split(os.path.abspath(filename))
+    fd, temp = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, filename)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(temp)
+        raise
+
+
+def dump_binary(filename, data, expiry=None):
+    """Write data (and optional per-key expiry timestamps) to filename
+    atomically. Returns the size of the file."""
+    with atomic_file(filename) as f:
+        return write_binary(f, data, expiry)
+
+
+def write_binary(f, data, expiry=None):
+    """Write a binary snapshot to f, a seekable binary file positioned at
+    its start. Returns the size written."""
+    raw_keys = []
+    key_offsets = array('Q', [0])
+    value_offsets = array('Q', [0])
+    deadlines = array('d')
+    types = bytearray()
+    key_end = value_end = 0
+    f.write(b'\0' * _HEADER.size)
+    for key, value in data.items():
+        if value.__class__ in _HASH_TYPES:
+            value = _encode_hash(value)
+            types.append(TYPE_HASH)
+        else:
+            value = _to_bytes(value)
+            types.append(TYPE_STRING)
+        f.write(value)
+        value_end += len(value)
+        value_offsets.append(value_end)
+        raw_key = _to_bytes(key)
+        raw_keys.append(raw_key)
+        key_end += len(raw_key)
+        key_offsets.append(key_end)
+        deadline = expiry.get(key) if expiry else None
+        deadlines.append(_NO_EXPIRY if deadline is None else deadline)
+    keys_offset = _HEADER.size + value_end
+    f.write(b''.join(raw_keys))
+    index_offset = keys_offset + key_end
+    f.write(types)
+    for arr in (key_offsets, value_offsets, deadlines):
+        f.write(_to_little_endian(arr).tobytes())
+    size = f.tell()
+    f.seek(0)
+    f.write(_HEADER.pack(MAGIC, 0, len(raw_keys), keys_offset, index_offset))
+    return size
+
+
+def _read_array(buf, typecode, pos, count):
+    arr = array(typecode)
+    arr.frombytes(buf[pos:pos + arr.itemsize * count])
+    if sys.byteorder != 'little':
+        arr.byteswap()
+    return arr
+
+
+def read_index(buf):
+    """Header and index of the binary snapshot in buf (any bytes-like
+    object): entry count, offset of the keys section, types, key offsets,
+    value offsets and expiry timestamps. Raises ValueError if buf does not
+    hold a snapshot."""
+    try:
+        magic, _, count, keys_offset, pos = _HEADER.unpack_from(buf, 0)
+    except struct.error:
+        raise ValueError('not a binary snapshot')
+    if magic != MAGIC:
+        raise ValueError('not a binary snapshot')
+    types = bytes(buf[pos:pos + count])
+    pos += count
+    key_offsets = _read_array(buf, 'Q', pos, count + 1)
+    pos += 8 * (count + 1)
+    value_offsets = _read_array(buf, 'Q', pos, count + 1)
+    pos += 8 * (count + 1)
+    deadlines = _read_array(buf, 'd', pos, count)
+    return count, keys_offset, types, key_offsets, value_offsets, deadlines
+
+
+def value_bounds(value_offsets, i):
+    """Start and end of the value of entry i, from the start of the snapshot."""
+    return _HEADER.size + value_offsets[i], _HEADER.size + value_offsets[i + 1]
+
+
+class MappedSnapshot:
+    """Read-only, memory-mapped view of a binary snapshot.
+
+    keys() and values() return lists in index order. Values can be returned
+    as memoryviews into the mapping, which stay valid until close().
+    """
+
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+        self._mmap = None
+        self._view = None
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            (self.count, self._keys_offset, self._types, self._key_offsets, self._value_offsets,
+             self._deadlines) = read_index(self._mmap)
+        except ValueError:
+            self.close()
+            raise ValueError(f'{filename} is not a binary snapshot')
+        self._view = memoryview(self._mmap)
+
+    def __len__(self):
+        return self.count
+
+    def types(self):
+        return self._types
+
+    def keys(self, text=False):
+        raw = self._mmap[self._keys_offset:self._keys_offset + self._key_offsets[-1]]
+        if text:
+            if raw.isascii():
+                # Character offsets equal byte offsets: decode once, then slice
+                return _slices(raw.decode('ascii'), self._key_offsets)
+            return [key.decode('utf-8', 'surrogateescape') for key in _slices(raw, self._key_offsets)]
+        return _slices(raw, self._key_offsets)
+
+    def values(self, text=False, lazy=False):
+        """Values in index order; hashes are returned as flat tuples of
+        their fields and values, never lazily."""
+        # Values are sliced straight out of the mapping, one at a time, so
+        # loading never holds a second copy of the whole values section.
+        if lazy:
+            values = _slices(self._view, self._value_offsets, _HEADER.size)
+        else:
+            values = _slices(self._mmap, self._value_offsets, _HEADER.size)
+            if text:
+                values = [value.decode('utf-8', 'surrogateescape') for value in values]
+        if self._types.count(TYPE_STRING) != self.count:
+            offsets = self._value_offsets
+            for i, entry_type in enumerate(self._types):
+                if entry_type == TYPE_HASH:
+                    start = _HEADER.size + offsets[i]
+                    values[i] = _decode_hash(self._mmap[start:_HEADER.size + offsets[i + 1]], text)
+        return values
+
+    def expiry(self):
+        """Per-entry expiry timestamps, None where the key does not expire."""
+        return [None if deadline != deadline else deadline for deadline in self._deadlines]
+
+    def close(self):
+        try:
+            if self._view is not None:
+                self._view.release()
+            if self._mmap is not None:
+                self._mmap.close()
+        except BufferError:
+            # Values are still referenced somewhere (e.g. a reply being
+            # sent); the mapping is released once they are collected.
+            pass
+        self._file.close()
@@ -0,0 +1,81 @@
+import collections
+import time
+
+# Latency histograms have one bucket per power of two microseconds: bucket i
+# counts calls that took less than 2 ** i microseconds (and at least half
+# that). 64 buckets cover any duration a perf_counter_ns() delta can have,
+# so recording needs no bounds check.
+HISTOGRAM_BUCKETS = 64
+
+SlowlogEntry = collections.namedtuple('SlowlogEntry', 'id timestamp duration args')
+
+# Like Redis, slowlog entries keep at most this many arguments, each cut
+# to at most this many characters.
+_SLOWLOG_MAX_ARGS = 32
+_SLOWLOG_MAX_ARG_LEN = 128
+
+
+class CommandStats:
+    __slots__ = ('calls', 'nsec', 'failed_calls', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.nsec = 0
+        self.failed_calls = 0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+
+    def cumulative_histogram(self):
+        """(upper bound in usec, calls at or below it) for the non-empty
+        range of buckets, as reported by LATENCY HISTOGRAM."""
+        total = 0
+        result = []
+        for i, count in enumerate(self.histogram):
+            total += count
+            if total:
+                result.append((1 << i, total))
+            if total == self.calls:
+                break
+        return result
+
+
+class Stats:
+    """Counters for INFO, SLOWLOG and LATENCY HISTOGRAM.
+
+    record() is called once per command with its duration from
+    perf_counter_ns(); it does a dict lookup and a few integer updates.
+    slowlog_log_slower_than is in microseconds: 0 logs every command and a
+    negative value disables the slow log.
+    """
+
+    def __init__(self, slowlog_log_slower_than=10000, slowlog_max_len=128):
+        self.commands = collections.defaultdict(CommandStats)  # Command name -> CommandStats
+        # Threshold in usec; infinity when the slow log is disabled
+        self._slowlog_threshold = slowlog_log_slower_than if slowlog_log_slower_than >= 0 else float('inf')
+        self.slowlog = collections.deque(maxlen=slowlog_max_len)
+        self._slowlog_next_id = 0
+        self.rejected_calls = 0
+        self.net_input_bytes = 0
+        self.net_output_bytes = 0
+
+    @property
+    def total_commands_processed(self):
+        return sum(stats.calls for stats in self.commands.values())
+
+    def record(self, name, args, elapsed_ns):
+        stats = self.commands[name]
+        stats.calls += 1
+        stats.nsec += elapsed_ns
+        usec = elapsed_ns // 1000
+        stats.histogram[usec.bit_length()] += 1
+        if usec >= self._slowlog_threshold:
+            self._log_slow(args, usec)
+
+    def failed(self, name):
+        self.commands[name].failed_calls += 1
+
+    def _log_slow(self, args, usec):
+        kept = [arg[:_SLOWLOG_MAX_ARG_LEN] for arg in args[:_SLOWLOG_MAX_ARGS]]
+        if len(args) > _SLOWLOG_MAX_ARGS:
+            kept[-1] = f'... ({len(args) - _SLOWLOG_MAX_ARGS + 1} more arguments)'
+        self.slowlog.appendleft(SlowlogEntry(self._slowlog_next_id, int(time.time()), usec, kept))
+        self._slowlog_next_id += 1
@@ -2,10 +2,33 @@ import unittest
 from tests import test_remotedict_server
 from tests import test_expiring_remotedict_server
 from tests import test_persistent_remotedict_server
+from tests import test_pipeline_remotedict_server
+from tests import test_sharded_remotedict_server
+from tests import test_maxmemory_remotedict_server
+from tests import test_stats_remotedict_server
+from tests import test_benchmark
+from tests import test_clients_remotedict_server
+from tests import test_replication_remotedict_server
+from tests import test_hashes_remotedict_server
+from tests import test_local_remotedict_server
+from tests import test_client_remotedict_server
+from tests import test_pubsub_remotedict_server
 
 if __name__ == "__main__":
     suite1 = unittest.defaultTestLoader.loadTestsFromModule(test_remotedict_server)
     suite2 = unittest.defaultTestLoader.loadTestsFromModule(test_expiring_remotedict_server)
     suite3 = unittest.defaultTestLoader.loadTestsFromModule(test_persistent_remotedict_server)
-    all_tests = unittest.TestSuite([suite1, suite2, suite3])
+    suite4 = unittest.defaultTestLoader.loadTestsFromModule(test_pipeline_remotedict_server)
+    suite5 = unittest.defaultTestLoader.loadTestsFromModule(test_sharded_remotedict_server)
+    suite6 = unittest.defaultTestLoader.loadTestsFromModule(test_maxmemory_remotedict_server)
+    suite7 = unittest.defaultTestLoader.loadTestsFromModule(test_stats_remotedict_server)
+    suite8 = unittest.defaultTestLoader.loadTestsFromModule(test_benchmark)
+    suite9 = unittest.defaultTestLoader.loadTestsFromModule(test_clients_remotedict_server)
+    suite10 = unittest.defaultTestLoader.loadTestsFromModule(test_replication_remotedict_server)
+    suite11 = unittest.defaultTestLoader.loadTestsFromModule(test_hashes_remotedict_server)
+    suite12 = unittest.defaultTestLoader.loadTestsFromModule(test_local_remotedict_server)
+    suite13 = unittest.defaultTestLoader.loadTestsFromModule(test_client_remotedict_server)
+    suite14 = unittest.defaultTestLoader.loadTestsFromModule(test_pubsub_remotedict_server)
+    all_tests = unittest.TestSuite([suite1, suite2, suite3, suite4, suite5, suite6, suite7, suite8, suite9,
+                                    suite10, suite11, suite12, suite13, suite14])
     unittest.TextTestRunner().run(all_tests)
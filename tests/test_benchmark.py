@@ -0,0 +1,57 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import argparse
+import contextlib
+import io
+import json
+import unittest
+from remotedict import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_parse_mix(self):
+        self.assertEqual(benchmark.parse_mix('get=80,SET=20'), {'get': 80.0, 'set': 20.0})
+        self.assertEqual(benchmark.parse_mix('mget'), {'mget': 1.0})
+        with self.assertRaises(argparse.ArgumentTypeError):
+            benchmark.parse_mix('get=1,flushall=1')
+
+    def test_parse_options(self):
+        options = benchmark.parse_options(['binary=true', 'save=[[60, 1000]]', 'filename=data.json'])
+        self.assertEqual(options, {'binary': True, 'save': [[60, 1000]], 'filename': 'data.json'})
+
+    def test_json_report_and_baseline(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            status = benchmark.main(['--port', '8116', '--clients', '2', '--processes', '1', '--pipeline', '4',
+                                     '--keyspace', '100', '--duration', '0.5', '--tests', 'get,set', '--json'])
+        self.assertEqual(status, 0)
+        report = json.loads(out.getvalue())
+        self.assertEqual([run['mix'] for run in report['runs']], [{'get': 1.0}, {'set': 1.0}])
+        for run in report['runs']:
+            self.assertGreater(run['ops'], 0)
+            self.assertEqual(run['errors'], 0)
+            latency = run['latency_usec']
+            self.assertLessEqual(latency['p50'], latency['p99'])
+            self.assertLessEqual(latency['p99'], latency['p999'])
+        self.assertEqual(benchmark.compare(report, report, 10), [])
+        faster = json.loads(out.getvalue())
+        faster['runs'][0]['ops_per_sec'] *= 2
+        self.assertEqual(len(benchmark.compare(report, faster, 10)), 1)
+
+    def test_compare_clients(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            status = benchmark.main(['--port', '8141', '--keyspace', '100', '--compare-clients', '--requests', '200',
+                                     '--json'])
+        self.assertEqual(status, 0)
+        runs = json.loads(out.getvalue())['client_runs']
+        self.assertEqual({(run['client'], run['command']) for run in runs},
+                         {(client, command) for client in ('remotedict', 'redis-py') for command in ('get', 'set')})
+        for run in runs:
+            self.assertGreater(run['cpu_usec'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,293 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import unittest
+import asyncio
+import time
+import threading
+import socket
+import tempfile
+import redis
+from remotedict import RemoteDict, ExpiringRemoteDict
+from remotedict.client import AsyncClient, Client, pack_command
+from remotedict.resp import ReplyError, ReplyParser
+
+
+class TestReplyParser(unittest.TestCase):
+    data = (b'+OK\r\n:42\r\n$3\r\nabc\r\n$-1\r\n*3\r\n$1\r\na\r\n$-1\r\n*2\r\n:1\r\n$2\r\nxy\r\n*-1\r\n'
+            b'-ERR bad\r\n$0\r\n\r\n*0\r\n$5\r\na\r\nbc\r\n')
+
+    def test_replies_split_anywhere(self):
+        parser = ReplyParser()
+        parser.feed(self.data)
+        expected = parser.parse()
+        self.assertEqual(expected[:6], [b'OK', 42, b'abc', None, [b'a', None, [1, b'xy']], None])
+        self.assertIsInstance(expected[6], ReplyError)
+        self.assertEqual(expected[7:], [b'', [], b'a\r\nbc'])
+        for step in range(1, 8):
+            parser = ReplyParser()
+            replies = []
+            for i in range(0, len(self.data), step):
+                parser.feed(self.data[i:i + step])
+                replies += parser.parse()
+            self.assertEqual([repr(reply) for reply in replies], [repr(reply) for reply in expected])
+            self.assertEqual(len(parser), 0)
+
+    def test_raw_replies(self):
+        parser = ReplyParser()
+        parser.feed(self.data)
+        self.assertEqual(b''.join(parser.parse(raw=True)), self.data)
+
+    def test_large_reply_in_chunks(self):
+        data = b'$1000000\r\n' + b'x' * 1000000 + b'\r\n'
+        parser = ReplyParser()
+        for i in range(0, len(data), 65536):
+            parser.feed(data[i:i + 65536])
+            replies = parser.parse()
+        self.assertEqual(replies, [b'x' * 1000000])
+
+
+class TestClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ExpiringRemoteDict(address="127.0.0.1", port=8138, expiry_seconds=0)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = Client(port=8138)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.close()
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def test_commands(self):
+        self.assertTrue(self.client.set('name', 'ada'))
+        self.assertEqual(self.client.get('name'), b'ada')
+        self.assertIsNone(self.client.set('name', 'bob', nx=True))
+        self.assertTrue(self.client.mset({'a': 1, b'b': 2.5}))
+        self.assertEqual(self.client.mget(['a', 'b', 'missing']), [b'1', b'2.5', None])
+        self.assertEqual(self.client.incr('counter', 3), 3)
+        self.assertTrue(self.client.expire('counter', 100))
+        self.assertGreater(self.client.ttl('counter'), 90)
+        self.assertEqual(self.client.hset('record', {'f': 'v', 'g': 1}), 2)
+        self.assertEqual(self.client.hget('record', 'g'), b'1')
+        self.assertEqual(self.client.hgetall('record'), {b'f': b'v', b'g': b'1'})
+        self.assertEqual(self.client.exists('name', 'record', 'missing'), 2)
+        self.assertEqual(self.client.delete('name', 'a', 'b', 'counter', 'record'), 5)
+        self.assertEqual(self.client.execute_command('EXISTS', 'name', 'record'), 0)
+
+    def test_errors(self):
+        self.client.hset('record', {'f': 'v'})
+        with self.assertRaisesRegex(ReplyError, 'WRONGTYPE'):
+            self.client.get('record')
+        # The connection is still usable after an error reply
+        self.assertEqual(self.client.hget('record', 'f'), b'v')
+        self.client.delete('record')
+
+    def test_pipeline(self):
+        pipe = self.client.pipeline()
+        pipe.set('p', 1).incr('p').get('p').execute_command('HGET', 'p', 'f')
+        with self.assertRaisesRegex(ReplyError, 'WRONGTYPE'):
+            pipe.execute()
+        pipe.set('p', 1).incr('p').get('p').execute_command('HGET', 'p', 'f')
+        results = pipe.execute(raise_on_error=False)
+        self.assertEqual(results[:3], [True, 2, b'2'])
+        self.assertIsInstance(results[3], ReplyError)
+        self.assertEqual(pipe.execute(), [])
+        self.client.delete('p')
+
+    def test_decode(self):
+        client = Client(port=8138, decode=True)
+        client.mset({'x': 'é', 'y': 'z'})
+        self.assertEqual(client.mget(['x', 'y']), ['é', 'z'])
+        self.assertEqual(client.get('x'), 'é')
+        client.delete('x', 'y')
+        client.close()
+
+    def test_threads_share_the_pool(self):
+        client = Client(port=8138, max_connections=2)
+
+        def work():
+            for _ in range(100):
+                client.incr('shared')
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(client.get('shared'), b'400')
+        self.assertLessEqual(len(client._pool._idle), 2)
+        client.delete('shared')
+        client.close()
+
+
+class TestAsyncClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.socket_dir = tempfile.mkdtemp()
+        cls.socket_path = os.path.join(cls.socket_dir, 'remotedict.sock')
+        cls.server = RemoteDict(address="127.0.0.1", port=8139, unix_socket=cls.socket_path)
+        cls.server.start_thread()
+        time.sleep(1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+        os.rmdir(cls.socket_dir)
+
+    def test_commands(self):
+        async def main():
+            client = AsyncClient(port=8139)
+            self.assertTrue(await client.set('name', 'ada'))
+            self.assertEqual(await client.get('name'), b'ada')
+            self.assertTrue(await client.mset({'a': 1, 'b': 2}))
+            self.assertEqual(await client.mget(['a', 'b', 'missing']), [b'1', b'2', None])
+            self.assertEqual(await client.hset('record', {'f': 'v'}), 1)
+            self.assertEqual(await client.hgetall('record'), {b'f': b'v'})
+            with self.assertRaisesRegex(ReplyError, 'WRONGTYPE'):
+                await client.get('record')
+            self.assertEqual(await client.delete('name', 'a', 'b', 'record'), 4)
+            await client.close()
+        asyncio.run(main())
+
+    def test_concurrent_awaits_are_pipelined(self):
+        async def main():
+            client = AsyncClient(unix_socket=self.socket_path)
+            await client.connect()
+            connection = client._connections[0]
+            writes = []
+            write = connection.transport.write
+            connection.transport.write = lambda data: (writes.append(data), write(data))
+            replies = await asyncio.gather(*[client.incr('counter') for _ in range(100)])
+            self.assertEqual(replies, list(range(1, 101)))
+            self.assertEqual(len(writes), 1)
+            self.assertEqual(await client.get('counter'), b'100')
+            await client.delete('counter')
+            await client.close()
+        asyncio.run(main())
+
+    def test_connection_pool_and_reconnect(self):
+        async def main():
+            client = AsyncClient(port=8139, max_connections=3, decode=True)
+            await asyncio.gather(*[client.set(f'k{i}', i) for i in range(10)])
+            self.assertEqual(len(client._connections), 3)
+            values = await asyncio.gather(*[client.get(f'k{i}') for i in range(10)])
+            self.assertEqual(values, [str(i) for i in range(10)])
+            pending = asyncio.ensure_future(client.get('k0'))
+            await asyncio.sleep(0)  # Queued, but not answered yet
+            for connection in list(client._connections):
+                connection.transport.abort()
+            with self.assertRaises(ConnectionError):
+                await pending
+            await asyncio.sleep(0.1)
+            self.assertEqual(await client.get('k0'), '0')
+            await client.delete(*[f'k{i}' for i in range(10)])
+            await client.close()
+        asyncio.run(main())
+
+
+class TestTracking(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ExpiringRemoteDict(address="127.0.0.1", port=8142, expiry_seconds=0)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.other = redis.Redis(host='127.0.0.1', port=8142, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def assertReceived(self, sock, expected):
+        data = b''
+        while len(data) < len(expected):
+            data += sock.recv(len(expected) - len(data))
+        self.assertEqual(data, expected)
+
+    def test_invalidation_pushes(self):
+        self.other.flushall()  # Keys read by the clients of other tests stay tracked until changed
+        self.other.set('k', 'v')
+        sock = socket.create_connection(('127.0.0.1', 8142), timeout=5)
+        sock.sendall(pack_command(('CLIENT', 'TRACKING', 'ON')) + pack_command(('GET', 'k')) +
+                     pack_command(('MGET', 'k', 'm')))
+        self.assertReceived(sock, b'+OK\r\n$1\r\nv\r\n*2\r\n$1\r\nv\r\n$-1\r\n')
+        self.assertEqual(self.other.info('clients')['tracking_clients'], 1)
+        self.assertEqual(self.other.info('stats')['tracking_total_keys'], 2)
+        self.other.set('k', 'w')
+        self.assertReceived(sock, b'>2\r\n$10\r\ninvalidate\r\n*1\r\n$1\r\nk\r\n')
+        # Once invalidated, a key is not tracked until it is read again
+        self.other.delete('k')
+        self.other.set('m', 'x')
+        self.assertReceived(sock, b'>2\r\n$10\r\ninvalidate\r\n*1\r\n$1\r\nm\r\n')
+        self.other.flushall()
+        self.assertReceived(sock, b'>2\r\n$10\r\ninvalidate\r\n*-1\r\n')
+        sock.sendall(pack_command(('CLIENT', 'TRACKING', 'OFF')) + pack_command(('GET', 'k')))
+        self.assertReceived(sock, b'+OK\r\n$-1\r\n')
+        self.other.set('k', 'v')
+        sock.settimeout(0.2)
+        with self.assertRaises(socket.timeout):
+            sock.recv(1)
+        sock.close()
+        time.sleep(0.1)
+        self.assertEqual(self.other.info('clients')['tracking_clients'], 0)
+        self.other.delete('k', 'm')
+
+    def test_expired_keys_are_invalidated(self):
+        sock = socket.create_connection(('127.0.0.1', 8142), timeout=5)
+        self.other.set('short', 'v', px=100)
+        sock.sendall(pack_command(('CLIENT', 'TRACKING', 'ON')) + pack_command(('GET', 'short')))
+        self.assertReceived(sock, b'+OK\r\n$1\r\nv\r\n')
+        time.sleep(0.15)
+        self.assertIsNone(self.other.get('short'))
+        self.assertReceived(sock, b'>2\r\n$10\r\ninvalidate\r\n*1\r\n$5\r\nshort\r\n')
+        sock.close()
+
+    def test_client_cache(self):
+        client = Client(port=8142, cache_size=2, decode=True)
+        self.other.mset({'a': '1', 'b': '2', 'c': '3'})
+        self.assertEqual(client.get('a'), '1')
+        self.assertIsNone(client.get('missing'))
+        self.assertEqual(len(client._cache), 2)
+        calls = self.other.info('commandstats')['cmdstat_get']['calls']
+        self.assertEqual((client.get('a'), client.get('missing')), ('1', None))
+        self.assertEqual(self.other.info('commandstats')['cmdstat_get']['calls'], calls)
+        self.other.set('a', 'changed')
+        time.sleep(0.1)
+        self.assertEqual(client.get('a'), 'changed')
+        # Own writes are seen at once; the least recently used entry goes first
+        client.set('a', 'mine')
+        self.assertEqual(client.get('a'), 'mine')
+        client.get('b')
+        client.get('c')
+        self.assertEqual(sorted(client._cache._replies), [b'b', b'c'])
+        client.delete('a', 'b', 'c')
+        self.assertEqual(len(client._cache), 0)
+        client.close()
+
+    def test_async_client_cache(self):
+        async def main():
+            client = AsyncClient(port=8142, cache_size=100)
+            self.other.set('x', '1')
+            self.assertEqual(await asyncio.gather(client.get('x'), client.get('x')), [b'1', b'1'])
+            self.assertEqual(client._cache.get(b'x'), b'1')
+            self.other.set('x', '2')
+            await asyncio.sleep(0.1)
+            self.assertEqual(await client.get('x'), b'2')
+            await client.mset({'x': '3', 'y': '4'})
+            self.assertEqual(await client.get('x'), b'3')
+            client._connections[0].transport.close()
+            await asyncio.sleep(0.1)
+            self.assertEqual(len(client._cache), 0)
+            self.assertEqual(await client.get('y'), b'4')
+            await client.delete('x', 'y')
+            self.assertIsNone(await client.get('x'))
+            await client.close()
+        asyncio.run(main())
+
+
+if __name__ == '__main__':
+    unittest.main()
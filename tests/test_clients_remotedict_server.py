@@ -0,0 +1,147 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import unittest
+import socket
+import time
+import redis
+from remotedict import RemoteDict
+from remotedict.resp import encode_command
+
+
+def raw_connection(port, rcvbuf=None):
+    sock = socket.socket()
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.connect(('127.0.0.1', port))
+    sock.settimeout(5)
+    return sock
+
+
+def is_closed(sock):
+    try:
+        while True:
+            data = sock.recv(1 << 20)
+            if not data:
+                return True
+    except ConnectionResetError:
+        return True
+    except socket.timeout:
+        return False
+
+
+class TestClientCommands(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = RemoteDict(address="127.0.0.1", port=8119, maxclients=3)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8119, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def test_name_id_and_list(self):
+        self.assertTrue(self.client.client_setname('reporter'))
+        self.assertEqual(self.client.client_getname(), 'reporter')
+        client_id = self.client.client_id()
+        entries = self.client.client_list()
+        mine = [entry for entry in entries if entry['id'] == str(client_id)]
+        self.assertEqual(len(mine), 1)
+        self.assertEqual(mine[0]['name'], 'reporter')
+        self.assertEqual(mine[0]['cmd'], 'client')
+        self.assertEqual(self.client.client_info()['id'], client_id)
+        with self.assertRaises(redis.exceptions.ResponseError):
+            self.client.client_setname('has space')
+
+    def test_kill_by_id_and_addr(self):
+        victim = raw_connection(8119)
+        victim.sendall(encode_command([b'CLIENT', b'ID']))
+        victim_id = int(victim.recv(100)[1:-2])
+        self.assertEqual(self.client.client_kill_filter(_id=victim_id), 1)
+        self.assertTrue(is_closed(victim))
+        self.assertEqual(self.client.client_kill_filter(_id=victim_id), 0)
+
+        victim = raw_connection(8119)
+        victim.sendall(encode_command([b'CLIENT', b'ID']))
+        victim.recv(100)
+        self.assertTrue(self.client.client_kill('%s:%d' % victim.getsockname()))
+        self.assertTrue(is_closed(victim))
+        with self.assertRaises(redis.exceptions.ResponseError):
+            self.client.client_kill('127.0.0.1:1')
+
+    def test_kill_self_gets_reply(self):
+        sock = raw_connection(8119)
+        sock.sendall(encode_command([b'CLIENT', b'KILL', b'SKIPME', b'no', b'ID', b'0']))
+        self.assertEqual(sock.recv(100), b':0\r\n')
+        sock.sendall(encode_command([b'CLIENT', b'ID']))
+        client_id = sock.recv(100)[1:-2]
+        sock.sendall(encode_command([b'CLIENT', b'KILL', b'SKIPME', b'no', b'ID', client_id]))
+        self.assertEqual(sock.recv(100), b':1\r\n')
+        self.assertTrue(is_closed(sock))
+
+    def test_maxclients(self):
+        self.client.client_id()  # Holds one of the three connections
+        socks = [raw_connection(8119) for _ in range(2)]
+        try:
+            for sock in socks:
+                sock.sendall(encode_command([b'CLIENT', b'ID']))
+                sock.recv(100)
+            extra = raw_connection(8119)
+            self.assertEqual(extra.recv(100), b'-ERR max number of clients reached\r\n')
+            self.assertTrue(is_closed(extra))
+            self.assertGreaterEqual(self.client.info('stats')['rejected_connections'], 1)
+        finally:
+            for sock in socks:
+                sock.close()
+
+
+class TestClientLimits(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = RemoteDict(address="127.0.0.1", port=8120, timeout=1,
+                                client_output_buffer_limit=(1 << 20, 0, 0))
+        cls.server._clients_cron_interval = 0.2
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8120, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def test_idle_timeout(self):
+        sock = raw_connection(8120)
+        sock.sendall(encode_command([b'CLIENT', b'ID']))
+        sock.recv(100)
+        time.sleep(2)
+        self.assertTrue(is_closed(sock))
+
+    def test_subscribers_do_not_time_out(self):
+        sock = raw_connection(8120)
+        sock.sendall(encode_command([b'SUBSCRIBE', b'quiet']))
+        sock.recv(100)
+        time.sleep(2)
+        self.assertEqual(self.client.publish('quiet', 'still there'), 1)
+        self.assertEqual(sock.recv(100), b'*3\r\n$7\r\nmessage\r\n$5\r\nquiet\r\n$11\r\nstill there\r\n')
+        sock.close()
+
+    def test_output_buffer_hard_limit(self):
+        value = b'x' * 100000
+        keys = [b'big%d' % i for i in range(200)]
+        self.client.mset({key: value for key in keys})
+        before = self.client.info('stats')['client_output_buffer_limit_disconnections']
+        sock = raw_connection(8120, rcvbuf=4096)
+        sock.sendall(encode_command([b'MGET'] + keys))
+        time.sleep(0.5)
+        self.assertEqual(self.client.info('stats')['client_output_buffer_limit_disconnections'], before + 1)
+        self.assertTrue(is_closed(sock))
+        self.client.delete(*keys)
+
+
+if __name__ == '__main__':
+    unittest.main()
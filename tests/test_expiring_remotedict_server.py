@@ -92,3 +92,118 @@ class TestExpiringRemoteDictServer(unittest.TestCase):
         self.assertEqual(self.client.exists('x', 'y'), 2)
         self.client.flushall()
         self.assertEqual(self.client.exists('x', 'y'), 0)
+
+    def test_set_with_expiry_options(self):
+        self.client.set('ex_key', 'v', ex=30)
+        self.assertGreater(self.client.ttl('ex_key'), 2)
+        self.client.set('px_key', 'v', px=300)
+        self.assertLessEqual(self.client.pttl('px_key'), 300)
+        time.sleep(0.4)
+        self.assertIsNone(self.client.get('px_key'))
+        self.assertEqual(self.client.exists('px_key'), 0)
+        self.client.delete('ex_key')
+
+    def test_set_nx_xx(self):
+        self.assertTrue(self.client.set('nx_key', '1', nx=True))
+        self.assertIsNone(self.client.set('nx_key', '2', nx=True))
+        self.assertEqual(self.client.get('nx_key'), b'1')
+        self.assertTrue(self.client.set('nx_key', '3', xx=True))
+        self.assertIsNone(self.client.set('xx_missing', '1', xx=True))
+        self.assertEqual(self.client.get('nx_key'), b'3')
+        self.client.delete('nx_key')
+
+    def test_expire_ttl_persist(self):
+        self.client.set('ttl_key', 'v')
+        self.assertLessEqual(self.client.ttl('ttl_key'), 2)
+        self.assertTrue(self.client.expire('ttl_key', 100))
+        self.assertGreater(self.client.ttl('ttl_key'), 90)
+        self.assertTrue(self.client.pexpire('ttl_key', 100000))
+        self.assertGreater(self.client.pttl('ttl_key'), 90000)
+        self.assertTrue(self.client.persist('ttl_key'))
+        self.assertEqual(self.client.ttl('ttl_key'), -1)
+        self.assertFalse(self.client.persist('ttl_key'))
+        time.sleep(2.1)
+        self.assertEqual(self.client.get('ttl_key'), b'v')
+        self.assertTrue(self.client.expireat('ttl_key', int(time.time()) + 100))
+        self.assertGreater(self.client.ttl('ttl_key'), 90)
+        self.assertTrue(self.client.expire('ttl_key', -1))
+        self.assertIsNone(self.client.get('ttl_key'))
+        self.assertEqual(self.client.ttl('missing_ttl_key'), -2)
+        self.assertFalse(self.client.expire('missing_ttl_key', 10))
+
+    def test_mset_keys_expire(self):
+        self.client.mset({'mset_exp1': '1', 'mset_exp2': '2'})
+        self.assertEqual(self.client.mget('mset_exp1', 'mset_exp2'), [b'1', b'2'])
+        self.assertLessEqual(self.client.ttl('mset_exp1'), 2)
+        time.sleep(2.1)
+        self.assertEqual(self.client.mget('mset_exp1', 'mset_exp2'), [None, None])
+
+    def test_counter_keeps_ttl(self):
+        self.client.set('counter', '1', ex=100)
+        self.assertEqual(self.client.incr('counter'), 2)
+        self.assertEqual(self.client.incrbyfloat('counter', 0.5), 2.5)
+        self.assertGreater(self.client.ttl('counter'), 90)
+        self.assertEqual(self.client.incr('new_counter'), 1)
+        self.assertLessEqual(self.client.ttl('new_counter'), 2)
+        self.client.set('expired_counter', '10', px=100)
+        time.sleep(0.2)
+        # An expired counter starts again from 0, with a fresh deadline
+        self.assertEqual(self.client.incr('expired_counter'), 1)
+        self.assertGreater(self.client.ttl('expired_counter'), 0)
+        self.client.delete('counter', 'new_counter', 'expired_counter')
+
+    def test_invalid_set_options(self):
+        with self.assertRaises(redis.exceptions.ResponseError):
+            self.client.execute_command('SET', 'bad', 'v', 'EX', 'abc')
+        with self.assertRaises(redis.exceptions.ResponseError):
+            self.client.execute_command('SET', 'bad', 'v', 'BOGUS')
+        for option, amount in (('EX', 1 << 62), ('PX', (1 << 63) - 1), ('EX', 1 << 64), ('EXAT', 0)):
+            with self.assertRaisesRegex(redis.exceptions.ResponseError, 'invalid expire time|not an integer'):
+                self.client.execute_command('SET', 'bad', 'v', option, amount)
+        self.assertIsNone(self.client.get('bad'))
+        self.client.set('bounded', 'v')
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, "invalid expire time in 'expire' command"):
+            self.client.expire('bounded', 1 << 62)
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, "invalid expire time in 'pexpire' command"):
+            self.client.pexpire('bounded', (1 << 63) - 1)
+        self.assertGreater(self.client.ttl('bounded'), 0)
+        self.client.delete('bounded')
+
+
+class TestActiveExpiration(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ExpiringRemoteDict(address="127.0.0.1", port=8107, expiry_seconds=0, expire_hz=50)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8107, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def test_unread_keys_are_reclaimed(self):
+        pipe = self.client.pipeline(transaction=False)
+        for i in range(500):
+            pipe.set(f'active:{i}', 'v', px=100)
+        pipe.set('active:keep', 'v')
+        pipe.execute()
+        before = self.server.expire_info()['expired_keys']
+        time.sleep(0.5)
+        # Never read, but removed from the dict by the active expirer
+        self.assertNotIn('active:0', self.server._data)
+        self.assertEqual(self.client.keys('active:*'), [b'active:keep'])
+        self.assertGreaterEqual(self.server.expire_info()['expired_keys'] - before, 500)
+        self.assertGreater(self.server.expire_info()['expire_cycles'], 0)
+        self.client.delete('active:keep')
+
+    def test_overwritten_deadline_is_not_used(self):
+        self.client.set('active:moved', 'v', px=100)
+        self.client.expire('active:moved', 100)
+        time.sleep(0.3)
+        self.assertEqual(self.client.get('active:moved'), b'v')
+        self.client.persist('active:moved')
+        time.sleep(0.1)
+        self.assertEqual(self.client.ttl('active:moved'), -1)
+        self.client.delete('active:moved')
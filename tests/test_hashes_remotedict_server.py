@@ -0,0 +1,218 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import unittest
+import time
+import redis
+from remotedict import RemoteDict, ExpiringRemoteDict, PersistentRemoteDict, PersistentExpiringRemoteDict
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class TestHashes(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = RemoteDict(address="127.0.0.1", port=8127, hash_max_listpack_entries=4,
+                                hash_max_listpack_value=16)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8127, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def test_hash_commands(self):
+        self.assertEqual(self.client.hset('user:1', mapping={'name': 'ada', 'lang': 'en'}), 2)
+        self.assertEqual(self.client.hset('user:1', 'lang', 'fr'), 0)
+        self.assertEqual(self.client.hget('user:1', 'lang'), b'fr')
+        self.assertIsNone(self.client.hget('user:1', 'missing'))
+        self.assertEqual(self.client.hmget('user:1', 'name', 'missing', 'lang'), [b'ada', None, b'fr'])
+        self.assertEqual(self.client.hgetall('user:1'), {b'name': b'ada', b'lang': b'fr'})
+        self.assertEqual(self.client.hincrby('user:1', 'visits', 5), 5)
+        self.assertEqual(self.client.hincrby('user:1', 'visits', -2), 3)
+        self.assertEqual(self.client.hdel('user:1', 'name', 'missing'), 1)
+        self.assertEqual(self.client.hlen('user:1'), 2)
+        self.assertEqual(self.client.type('user:1'), b'hash')
+        self.assertEqual(self.client.hdel('user:1', 'lang', 'visits'), 2)
+        # The last field removed deletes the key
+        self.assertEqual(self.client.exists('user:1'), 0)
+        self.assertEqual(self.client.type('user:1'), b'none')
+        self.assertEqual(self.client.hgetall('user:1'), {})
+        self.assertEqual(self.client.hlen('user:1'), 0)
+        self.assertEqual(self.client.hmget('user:1', 'a', 'b'), [None, None])
+        self.assertEqual(self.client.hdel('user:1', 'a'), 0)
+        self.assertTrue(self.client.execute_command('HMSET', 'user:2', 'name', 'bob'))
+        self.assertEqual(self.client.hget('user:2', 'name'), b'bob')
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, 'wrong number of arguments'):
+            self.client.execute_command('HSET', 'user:2', 'name')
+        self.client.delete('user:2')
+
+    def test_hincrby_errors(self):
+        self.client.hset('counters', 'text', 'abc')
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, 'hash value is not an integer'):
+            self.client.hincrby('counters', 'text', 1)
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, 'not an integer'):
+            self.client.hincrby('counters', 'n', 'x')
+        self.client.hset('counters', 'n', str(2 ** 63 - 1))
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, 'overflow'):
+            self.client.hincrby('counters', 'n', 1)
+        self.client.delete('counters')
+
+    def test_wrong_type(self):
+        self.client.set('plain', 'v')
+        self.client.hset('record', 'f', 'v')
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, 'WRONGTYPE'):
+            self.client.hget('plain', 'f')
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, 'WRONGTYPE'):
+            self.client.hset('plain', 'f', 'v')
+        for command in (lambda: self.client.get('record'), lambda: self.client.incr('record'),
+                        lambda: self.client.incrbyfloat('record', 1.5)):
+            with self.assertRaisesRegex(redis.exceptions.ResponseError, 'WRONGTYPE'):
+                command()
+        self.assertEqual(self.client.mget('plain', 'record'), [b'v', None])
+        self.assertEqual(self.client.type('plain'), b'string')
+        # SET replaces a hash, as in Redis
+        self.assertTrue(self.client.set('record', 'now a string'))
+        self.assertEqual(self.client.get('record'), b'now a string')
+        self.client.delete('plain', 'record')
+
+    def test_compact_encoding_is_converted(self):
+        self.client.hset('small', mapping={f'f{i}': i for i in range(4)})
+        self.assertIs(type(self.server._data['small']), tuple)
+        self.client.hset('small', 'f4', 4)
+        self.assertIs(type(self.server._data['small']), dict)
+        self.assertEqual(self.client.hlen('small'), 5)
+        self.client.hset('long_value', 'f', 'x' * 17)
+        self.assertIs(type(self.server._data['long_value']), dict)
+        self.client.hincrby('counter_hash', 'hits', 1)
+        self.assertEqual(self.server._data['counter_hash'], ('hits', 1))
+        self.assertEqual(self.client.hgetall('counter_hash'), {b'hits': b'1'})
+        self.client.delete('small', 'long_value', 'counter_hash')
+
+
+class TestExpiringHashes(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ExpiringRemoteDict(address="127.0.0.1", port=8128, expiry_seconds=2)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8128, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def test_hash_expiry(self):
+        self.client.hset('session', 'user', 'ada')
+        self.assertLessEqual(self.client.ttl('session'), 2)
+        self.assertTrue(self.client.expire('session', 100))
+        # Changing fields keeps the key's deadline
+        self.client.hset('session', 'page', 'home')
+        self.client.hincrby('session', 'views', 1)
+        self.client.hdel('session', 'page')
+        self.assertGreater(self.client.ttl('session'), 90)
+        self.client.hset('short_session', 'user', 'bob')
+        time.sleep(2.1)
+        self.assertIsNone(self.client.hget('short_session', 'user'))
+        self.assertEqual(self.client.hgetall('short_session'), {})
+        self.client.delete('session')
+
+
+class TestPersistentHashes(unittest.TestCase):
+    filename = 'persistent_dict_hashes_test.json'
+    aof_filename = 'persistent_dict_hashes_test.aof'
+
+    def tearDown(self):
+        for name in (self.filename, self.aof_filename):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def run_server(self, server_class, **kwargs):
+        server = server_class(address="127.0.0.1", port=8129, filename=self.filename, **kwargs)
+        server.start_thread()
+        time.sleep(1)
+        client = redis.Redis(host='127.0.0.1', port=8129, db=0)
+        client.hset('small', mapping={'a': '1', 'b': '2'})
+        client.hset('big', mapping={f'f{i}': i for i in range(200)})
+        client.hincrby('small', 'c', 3)
+        client.hdel('big', 'f0')
+        client.hset('gone', 'f', 'v')
+        client.hdel('gone', 'f')
+        time.sleep(0.2)  # Wait for the group commit
+        server.stop_thread()
+        time.sleep(0.1)
+
+    def test_json_snapshot(self):
+        self.run_server(PersistentExpiringRemoteDict, expiry_seconds=0)
+        reloaded = PersistentExpiringRemoteDict(port=8130, filename=self.filename, expiry_seconds=0)
+        self.assertEqual(reloaded._data['small'], ('a', '1', 'b', '2', 'c', 3))
+        self.assertIs(type(reloaded._data['big']), dict)
+        self.assertEqual(len(reloaded._data['big']), 199)
+        self.assertNotIn('gone', reloaded._data)
+
+    def test_binary_snapshot_and_binary_mode(self):
+        self.run_server(PersistentExpiringRemoteDict, expiry_seconds=100, snapshot_format='binary', binary=True)
+        reloaded = PersistentExpiringRemoteDict(port=8130, filename=self.filename, binary=True)
+        self.assertEqual(reloaded._data[b'small'], (b'a', b'1', b'b', b'2', b'c', b'3'))
+        self.assertEqual(reloaded._data[b'big'][b'f199'], b'199')
+        self.assertIn(b'big', reloaded._expiry)
+        text = PersistentExpiringRemoteDict(port=8130, filename=self.filename, lazy_load=True)
+        self.assertEqual(text._data['small'], ('a', '1', 'b', '2', 'c', '3'))
+        text._release_mapping()
+
+    def test_append_only_log(self):
+        self.run_server(PersistentRemoteDict, appendonly=True, appendfilename=self.aof_filename,
+                        appendfsync_interval_ms=50)
+        reloaded = PersistentRemoteDict(port=8130, filename=self.filename, appendonly=True,
+                                        appendfilename=self.aof_filename)
+        self.assertEqual(reloaded._data['small'], ('a', '1', 'b', '2', 'c', '3'))
+        self.assertEqual(len(reloaded._data['big']), 199)
+        self.assertNotIn('gone', reloaded._data)
+        # A rewritten log recreates each hash with one HSET
+        reloaded._aof.rewrite_now()
+        reloaded._aof.close()
+        again = PersistentRemoteDict(port=8130, filename=self.filename, appendonly=True,
+                                     appendfilename=self.aof_filename)
+        self.assertEqual(again._data['big']['f199'], '199')
+        again._aof.close()
+
+
+class TestHashReplication(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.primary = RemoteDict(address="127.0.0.1", port=8131)
+        cls.primary.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8131, db=0)
+        cls.client.hset('before', mapping={'a': '1', 'b': '2'})
+        cls.replica = RemoteDict(address="127.0.0.1", port=8132, replicaof=('127.0.0.1', 8131))
+        cls.replica.start_thread()
+        time.sleep(1)
+        cls.replica_client = redis.Redis(host='127.0.0.1', port=8132, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.replica.stop_thread()
+        cls.primary.stop_thread()
+        time.sleep(0.1)
+
+    def test_snapshot_and_stream(self):
+        self.assertTrue(wait_for(lambda: self.replica_client.hgetall('before') == {b'a': b'1', b'b': b'2'}))
+        self.client.hincrby('before', 'a', 10)
+        self.client.hdel('before', 'b')
+        self.assertTrue(wait_for(lambda: self.replica_client.hgetall('before') == {b'a': b'11'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import unittest
+import time
+import threading
+import multiprocessing
+import redis
+from remotedict import RemoteDict, ExpiringRemoteDict
+from remotedict.resp import ReplyError
+from remotedict.shared import SharedSnapshot
+
+
+def read_shared(name, keys, results):
+    view = SharedSnapshot(name)
+    results.put((len(view), view.mget(keys), view.get('record')))
+    view.close()
+
+
+class TestLocalClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ExpiringRemoteDict(address="127.0.0.1", port=8135, expiry_seconds=0)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8135, db=0)
+        cls.local = cls.server.local_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def test_reads_and_writes(self):
+        self.assertTrue(self.local.set('name', 'ada'))
+        self.assertEqual(self.client.get('name'), b'ada')
+        self.client.set('lang', 'en')
+        self.assertEqual(self.local.get('lang'), 'en')
+        self.assertEqual(self.local.get(b'lang'), 'en')
+        self.assertIsNone(self.local.get('missing'))
+        self.assertTrue(self.local.mset({'a': 1, 'b': b'2'}))
+        self.assertEqual(self.local.mget(['a', 'b', 'missing']), ['1', '2', None])
+        self.assertEqual(self.local.incr('counter', 5), 5)
+        self.assertEqual(self.local.get('counter'), '5')
+        self.assertIsNone(self.local.set('name', 'bob', nx=True))
+        self.assertEqual(self.local.exists('name', 'lang', 'missing'), 2)
+        self.assertEqual(self.local.delete('name', 'lang', 'missing'), 2)
+        self.assertEqual(self.client.exists('name', 'lang'), 0)
+        self.assertEqual(sorted(self.local.execute_command('KEYS', '*')), [b'a', b'b', b'counter'])
+        self.client.delete('a', 'b', 'counter')
+
+    def test_errors(self):
+        self.local.execute_command('HSET', 'record', 'f', 'v')
+        with self.assertRaisesRegex(ReplyError, 'WRONGTYPE'):
+            self.local.get('record')
+        self.assertEqual(self.local.mget(['record']), [None])
+        self.assertEqual(self.local.exists('record'), 1)
+        with self.assertRaisesRegex(ReplyError, 'unknown command'):
+            self.local.execute_command('NOSUCHCOMMAND')
+        with self.assertRaisesRegex(ReplyError, 'not available to local clients'):
+            self.local.execute_command('CLIENT', 'ID')
+        self.local.delete('record')
+
+    def test_expired_keys_are_missing(self):
+        self.local.set('short', 'v', px=100)
+        self.assertEqual(self.local.get('short'), 'v')
+        time.sleep(0.15)
+        self.assertIsNone(self.local.get('short'))
+        self.assertEqual(self.local.mget(['short']), [None])
+        self.assertEqual(self.local.exists('short'), 0)
+
+    def test_concurrent_threads(self):
+        def work(n):
+            for i in range(200):
+                self.local.incr('shared_counter')
+                self.local.set(f'thread:{n}', i)
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.local.get('shared_counter'), '800')
+        self.assertEqual(self.local.mget([f'thread:{n}' for n in range(4)]), ['199'] * 4)
+        self.client.delete('shared_counter', *[f'thread:{n}' for n in range(4)])
+
+
+class TestLocalClientBinary(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = RemoteDict(address="127.0.0.1", port=8136, binary=True)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.local = cls.server.local_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def test_binary_values(self):
+        self.local.set(b'raw', b'\xff\x00')
+        self.assertEqual(self.local.get('raw'), b'\xff\x00')
+        self.local.incr('n')
+        self.assertEqual(self.local.mget([b'raw', 'n']), [b'\xff\x00', b'1'])
+
+
+class TestSharedSnapshot(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ExpiringRemoteDict(address="127.0.0.1", port=8137, expiry_seconds=0)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8137, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def test_sibling_process_reads(self):
+        self.client.set('a', '1')
+        self.client.incr('n')
+        self.client.hset('record', mapping={'f': 'v'})
+        self.client.set('short', 'v', px=100)
+        name = self.server.share_snapshot()
+        time.sleep(0.15)
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=read_shared, args=(name, ['a', 'n', 'record', 'short', 'missing'],
+                                                                    results))
+        process.start()
+        count, values, record = results.get(timeout=10)
+        process.join()
+        self.assertEqual(count, 4)
+        self.assertEqual(values, [b'1', b'1', None, None, None])
+        self.assertEqual(record, {b'f': b'v'})
+        self.client.delete('a', 'n', 'record')
+
+    def test_sharing_again_replaces_the_snapshot(self):
+        self.client.set('version', '1')
+        first = self.server.share_snapshot()
+        view = SharedSnapshot(first, text=True)
+        self.client.set('version', '2')
+        self.assertEqual(view.get('version'), '1')
+        second = self.server.share_snapshot()
+        self.assertEqual(view.get('version'), '1')  # Still mapped after the unlink
+        view.close()
+        with self.assertRaises(FileNotFoundError):
+            SharedSnapshot(first)
+        view = SharedSnapshot(second, text=True)
+        self.assertEqual(view.get('version'), '2')
+        self.assertIn('version', view)
+        view.close()
+        self.client.delete('version')
+
+
+if __name__ == '__main__':
+    unittest.main()
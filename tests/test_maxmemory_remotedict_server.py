@@ -0,0 +1,157 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import unittest
+import time
+import redis
+from remotedict import RemoteDict, ExpiringRemoteDict
+
+
+class MaxMemoryTestCase(unittest.TestCase):
+    dict_class = RemoteDict
+    port = None
+    options = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = cls.dict_class(address="127.0.0.1", port=cls.port, **cls.options)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=cls.port, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def setUp(self):
+        self.client.flushdb()
+
+
+class TestNoEviction(MaxMemoryTestCase):
+    port = 8108
+    options = {'maxkeys': 3}
+
+    def test_oom_error(self):
+        for key in ('a', 'b', 'c'):
+            self.client.set(key, '1')
+        with self.assertRaises(redis.exceptions.OutOfMemoryError):
+            self.client.set('d', '1')
+        # Overwriting an existing key needs no new entry
+        self.assertTrue(self.client.set('a', '2'))
+        self.assertEqual(self.client.delete('b'), 1)
+        self.assertTrue(self.client.set('d', '1'))
+        self.assertEqual(self.server.memory_info()['evicted_keys'], 0)
+
+    def test_mset_is_admitted_as_a_whole(self):
+        with self.assertRaises(redis.exceptions.OutOfMemoryError):
+            self.client.mset({f'k{i}': '1' for i in range(10)})
+        self.assertEqual(len(self.client.keys()), 0)
+        self.assertTrue(self.client.mset({'a': '1', 'b': '1'}))
+        with self.assertRaises(redis.exceptions.OutOfMemoryError):
+            self.client.mset({'a': '2', 'c': '1', 'd': '1'})
+        self.assertEqual(self.client.mget('a', 'c', 'd'), [b'1', None, None])
+
+
+class TestAllKeysLRU(MaxMemoryTestCase):
+    port = 8109
+    options = {'maxkeys': 3, 'maxmemory_policy': 'allkeys-lru'}
+
+    def test_least_recently_used_is_evicted(self):
+        for key in ('a', 'b', 'c'):
+            self.client.set(key, '1')
+        self.client.get('a')
+        self.client.set('d', '1')
+        self.assertEqual(self.client.exists('a', 'b', 'c', 'd'), 3)
+        self.assertIsNone(self.client.get('b'))
+        self.assertEqual(self.server.memory_info()['evicted_keys'], 1)
+
+    def test_rejected_set_evicts_nothing(self):
+        evicted = self.server.memory_info()['evicted_keys']
+        for key in ('a', 'b', 'c'):
+            self.client.set(key, '1')
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, 'requires ExpiringRemoteDict'):
+            self.client.set('d', '1', ex=10)
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, 'invalid expire time'):
+            self.client.set('d', '1', px=0)
+        self.assertEqual(self.client.exists('a', 'b', 'c', 'd'), 3)
+        self.assertEqual(self.server.memory_info()['evicted_keys'], evicted)
+
+    def test_mset_evicts_for_the_whole_batch(self):
+        evicted = self.server.memory_info()['evicted_keys']
+        for key in ('a', 'b', 'c'):
+            self.client.set(key, '1')
+        self.client.mset({'d': '1', 'e': '1', 'a': '2'})
+        self.assertEqual(len(self.client.keys()), 3)
+        self.assertEqual(self.client.mget('a', 'd', 'e'), [b'2', b'1', b'1'])
+        # More new keys than maxkeys can never fit
+        with self.assertRaises(redis.exceptions.OutOfMemoryError):
+            self.client.mset({f'k{i}': '1' for i in range(10)})
+        self.assertEqual(len(self.client.keys()), 3)
+        self.assertEqual(self.server.memory_info()['evicted_keys'], evicted + 3)
+
+
+class TestAllKeysLFU(MaxMemoryTestCase):
+    port = 8110
+    options = {'maxkeys': 3, 'maxmemory_policy': 'allkeys-lfu'}
+
+    def test_least_frequently_used_is_evicted(self):
+        for key in ('a', 'b', 'c'):
+            self.client.set(key, '1')
+        for _ in range(200):
+            self.client.get('a')
+            self.client.get('c')
+        self.client.set('d', '1')
+        self.assertIsNone(self.client.get('b'))
+        self.assertEqual(self.client.exists('a', 'c', 'd'), 3)
+
+
+class TestMaxMemoryBytes(MaxMemoryTestCase):
+    port = 8111
+    options = {'maxmemory': 20000, 'maxmemory_policy': 'allkeys-lru'}
+
+    def test_used_memory_stays_under_limit(self):
+        for i in range(200):
+            self.client.set(f'big{i}', 'x' * 500)
+        info = self.server.memory_info()
+        self.assertLessEqual(info['used_memory'], 20000)
+        self.assertGreater(info['evicted_keys'], 0)
+        # The newest keys survive
+        self.assertIsNotNone(self.client.get('big199'))
+        self.assertIsNone(self.client.get('big0'))
+        self.client.flushdb()
+        self.assertEqual(self.server.memory_info()['used_memory'], 0)
+
+    def test_hash_writes_are_tracked(self):
+        self.client.hset('record', mapping={f'f{i}': 'v' * 20 for i in range(60)})
+        for i in range(0, 60, 2):
+            self.client.hdel('record', f'f{i}')
+            self.client.hincrby('record', f'n{i}', i)
+        self.client.hset('small', 'f', 'v')
+        tracked = self.server._used_memory
+        self.server._recount_memory()
+        self.assertEqual(self.server._used_memory, tracked)
+        self.client.flushdb()
+
+
+class TestVolatileTTL(MaxMemoryTestCase):
+    dict_class = ExpiringRemoteDict
+    port = 8112
+    options = {'expiry_seconds': 0, 'maxkeys': 3, 'maxmemory_policy': 'volatile-ttl'}
+
+    def test_nearest_deadline_is_evicted(self):
+        self.client.set('forever', '1')
+        self.client.set('later', '1', ex=100)
+        self.client.set('sooner', '1', ex=10)
+        self.client.set('new', '1')
+        self.assertIsNone(self.client.get('sooner'))
+        self.client.set('newer', '1')
+        self.assertIsNone(self.client.get('later'))
+        # Only keys without an expiry are left
+        with self.assertRaises(redis.exceptions.OutOfMemoryError):
+            self.client.set('newest', '1')
+        self.assertEqual(self.client.exists('forever', 'new', 'newer'), 3)
+
+
+del MaxMemoryTestCase
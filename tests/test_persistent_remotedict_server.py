@@ -3,9 +3,14 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 
 import unittest
+import asyncio
+import threading
 import time
 import redis
 from remotedict import PersistentRemoteDict, PersistentExpiringRemoteDict
+from remotedict.aof import AppendOnlyFile
+from remotedict.local import call_in_loop
+from remotedict.resp import CommandError
 
 
 class TestPersistentRemoteDictServer(unittest.TestCase):
@@ -85,6 +90,26 @@ class TestPersistentRemoteDictServer(unittest.TestCase):
         self.client.flushall()
         self.assertEqual(self.client.exists('x', 'y'), 0)
 
+    def test_mset_saves_once(self):
+        saves = []
+        save_to_disk = self.server._save_to_disk
+        self.server._save_to_disk = lambda: saves.append(1) or save_to_disk()
+        try:
+            self.client.mset({f'persist_mset{i}': str(i) for i in range(100)})
+        finally:
+            del self.server._save_to_disk
+        self.assertEqual(len(saves), 1)
+        reloaded = PersistentRemoteDict(address="127.0.0.1", port=8088)
+        self.assertEqual(reloaded._data['persist_mset99'], '99')
+        self.client.delete(*[f'persist_mset{i}' for i in range(100)])
+
+    def test_counter_survives_reload(self):
+        self.client.incrby('persist_counter', 5)
+        self.client.incr('persist_counter')
+        reloaded = PersistentRemoteDict(address="127.0.0.1", port=8088)
+        self.assertEqual(reloaded._data['persist_counter'], 6)
+        self.client.delete('persist_counter')
+
 
 class TestPersistentExpiringRemoteDictServer(unittest.TestCase):
     @classmethod
@@ -167,3 +192,386 @@ class TestPersistentExpiringRemoteDictServer(unittest.TestCase):
         self.assertEqual(self.client.exists('x', 'y'), 2)
         self.client.flushall()
         self.assertEqual(self.client.exists('x', 'y'), 0)
+
+
+    def test_expired_keys_are_not_loaded(self):
+        self.client.set('expired_on_disk', 'v', px=100)
+        self.client.set('kept_on_disk', 'v', ex=100)
+        time.sleep(0.2)
+        reloaded = PersistentExpiringRemoteDict(address="127.0.0.1", port=8089, expiry_seconds=2)
+        self.assertNotIn('expired_on_disk', reloaded._data)
+        self.assertNotIn('expired_on_disk', reloaded._expiry)
+        self.assertIn('kept_on_disk', reloaded._data)
+        self.client.delete('kept_on_disk')
+
+class TestPersistentRemoteDictBinary(unittest.TestCase):
+    filename = 'persistent_dict_binary_test.json'
+
+    @classmethod
+    def setUpClass(cls):
+        if os.path.exists(cls.filename):
+            os.remove(cls.filename)
+        cls.server = PersistentExpiringRemoteDict(address="127.0.0.1", port=8093, filename=cls.filename, binary=True)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8093, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+        if os.path.exists(cls.filename):
+            os.remove(cls.filename)
+
+    def test_binary_values_survive_reload(self):
+        value = bytes(range(256))
+        self.client.set(b'bin\xfekey', value)
+        self.client.set('textkey', 'h\u00e9llo')
+        reloaded = PersistentExpiringRemoteDict(port=8094, filename=self.filename, binary=True)
+        self.assertEqual(reloaded._data[b'bin\xfekey'], value)
+        self.assertEqual(reloaded._data[b'textkey'], 'h\u00e9llo'.encode())
+        self.assertIn(b'bin\xfekey', reloaded._expiry)
+        # Valid UTF-8 is stored as plain text, readable by a str-mode server
+        text = PersistentExpiringRemoteDict(port=8095, filename=self.filename)
+        self.assertEqual(text._data['textkey'], 'h\u00e9llo')
+
+
+class TestPersistentRemoteDictAppendOnly(unittest.TestCase):
+    filename = 'persistent_dict_aof_test.json'
+    aof_filename = 'persistent_dict_aof_test.aof'
+
+    @classmethod
+    def setUpClass(cls):
+        for name in (cls.filename, cls.aof_filename):
+            if os.path.exists(name):
+                os.remove(name)
+        cls.server = PersistentRemoteDict(address="127.0.0.1", port=8097, filename=cls.filename, appendonly=True,
+                                          appendfsync='everysec', appendfsync_interval_ms=50)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8097, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+        for name in (cls.filename, cls.aof_filename):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def reload(self):
+        time.sleep(0.2)  # Wait for the group commit
+        return PersistentRemoteDict(port=8098, filename=self.filename, appendonly=True)
+
+    def test_writes_are_replayed(self):
+        self.client.set('aofkey1', 'v1')
+        self.client.set('aofkey2', 'v2')
+        self.client.set('aofkey1', 'v3')
+        self.client.delete('aofkey2')
+        self.assertFalse(os.path.exists(self.filename), 'JSON snapshot should not be written in append-only mode')
+        reloaded = self.reload()
+        self.assertEqual(reloaded._data.get('aofkey1'), 'v3')
+        self.assertNotIn('aofkey2', reloaded._data)
+        reloaded._aof.close()
+
+    def test_counters_are_replayed(self):
+        self.client.incr('aofcounter')
+        self.client.incrby('aofcounter', 41)
+        reloaded = self.reload()
+        self.assertEqual(reloaded._data.get('aofcounter'), '42')
+        reloaded._aof.close()
+
+    def test_non_utf8_values_are_replayed(self):
+        # A text-mode server only holds such values when they are replicated from a binary primary
+        call_in_loop(self.server, self.server._apply_replicated, [b'SET', b'aofraw', b'\xff\xfe'])
+        reloaded = self.reload()
+        self.assertEqual(reloaded._data.get('aofraw'), '\udcff\udcfe')
+        reloaded._aof.close()
+        self.client.delete('aofraw')
+
+    def test_flush_is_replayed(self):
+        self.client.set('aofflush', 'x')
+        self.client.flushall()
+        self.client.set('aofafter', 'y')
+        reloaded = self.reload()
+        self.assertEqual(reloaded._data, {'aofafter': 'y'})
+        reloaded._aof.close()
+        self.client.delete('aofafter')
+
+    def test_rewrite_compacts_log(self):
+        for i in range(200):
+            self.client.set('aofrewrite', str(i))
+        time.sleep(0.2)
+        before = os.path.getsize(self.aof_filename)
+        self.client.execute_command('BGREWRITEAOF')
+        time.sleep(0.5)
+        self.assertLess(os.path.getsize(self.aof_filename), before)
+        self.client.set('aofrewrite', 'last')
+        reloaded = self.reload()
+        self.assertEqual(reloaded._data.get('aofrewrite'), 'last')
+        reloaded._aof.close()
+
+    def test_truncated_tail_is_ignored(self):
+        self.client.set('aoftail', 'ok')
+        time.sleep(0.2)
+        copy = 'persistent_dict_aof_tail_test.aof'
+        with open(self.aof_filename, 'rb') as src, open(copy, 'wb') as dst:
+            dst.write(src.read() + b'*3\r\n$3\r\nSET\r\n$7\r\naoft')
+        try:
+            reloaded = PersistentRemoteDict(port=8098, filename=self.filename, appendonly=True, appendfilename=copy)
+            self.assertEqual(reloaded._data.get('aoftail'), 'ok')
+            reloaded._set('aofnext', 'fine')
+            reloaded._aof.close()
+            again = PersistentRemoteDict(port=8098, filename=self.filename, appendonly=True, appendfilename=copy)
+            self.assertEqual(again._data.get('aofnext'), 'fine')
+            again._aof.close()
+        finally:
+            os.remove(copy)
+
+    def test_appends_during_rewrite_are_written_once(self):
+        filename = 'persistent_dict_aof_rewrite_test.aof'
+        snapshot_taken = threading.Event()
+
+        def snapshot():
+            yield [b'SET', b'counter', b'1']
+            snapshot_taken.wait(5)
+        aof = AppendOnlyFile(filename, snapshot, fsync='no')
+        aof.open()
+        try:
+            async def run():
+                rewrite = aof.start_rewrite()
+                await asyncio.sleep(0)
+                snapshot_taken.set()
+                time.sleep(0.2)
+                await asyncio.sleep(0)
+                # The rewrite now resumes before the write of this append
+                aof.append([b'INCR', b'counter'])
+                await rewrite
+            asyncio.run(run())
+            aof.close()
+            self.assertEqual(list(AppendOnlyFile(filename, snapshot).replay()),
+                             [[b'SET', b'counter', b'1'], [b'INCR', b'counter']])
+        finally:
+            os.remove(filename)
+
+
+class TestPersistentRemoteDictSaveRules(unittest.TestCase):
+    filename = 'persistent_dict_rules_test.json'
+
+    @classmethod
+    def setUpClass(cls):
+        if os.path.exists(cls.filename):
+            os.remove(cls.filename)
+        # Snapshot once at least 5 writes happened and 0.2 seconds passed
+        cls.server = PersistentExpiringRemoteDict(address="127.0.0.1", port=8099, filename=cls.filename,
+                                                  save=[(0.2, 5)])
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8099, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+        if os.path.exists(cls.filename):
+            os.remove(cls.filename)
+
+    def test_snapshot_after_enough_changes(self):
+        self.client.flushall()
+        self.client.save()  # Reset the change counter
+        os.remove(self.filename)
+        for i in range(3):
+            self.client.set(f'rulekey{i}', str(i))
+        time.sleep(1.2)
+        self.assertFalse(os.path.exists(self.filename), 'snapshot taken before the change threshold')
+        self.client.set('rulekey3', '3')
+        self.client.set('rulekey4', '4')
+        time.sleep(1.5)
+        self.assertTrue(os.path.exists(self.filename))
+        reloaded = PersistentExpiringRemoteDict(port=8100, filename=self.filename)
+        self.assertEqual(sorted(reloaded._data), [f'rulekey{i}' for i in range(5)])
+        self.assertIn('rulekey4', reloaded._expiry)
+        info = self.server.snapshot_info()
+        self.assertEqual(info['last_snapshot_status'], 'ok')
+        self.assertEqual(info['last_snapshot_size'], os.path.getsize(self.filename))
+        self.assertIsNotNone(info['last_snapshot_duration'])
+        self.assertEqual(info['changes_since_last_save'], 0)
+
+    def test_bgsave_command(self):
+        self.client.set('bgsavekey', 'x')
+        before = self.client.lastsave()
+        self.assertTrue(self.client.bgsave())
+        time.sleep(0.5)
+        reloaded = PersistentExpiringRemoteDict(port=8100, filename=self.filename)
+        self.assertEqual(reloaded._data.get('bgsavekey'), 'x')
+        self.assertGreaterEqual(self.client.lastsave(), before)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'fork is not available')
+    def test_fork_snapshot(self):
+        filename = 'persistent_dict_fork_test.json'
+        server = PersistentRemoteDict(port=8101, filename=filename, save=[(60, 1000)], bgsave_method='fork')
+        try:
+            server._set('forkkey', 'forkvalue')
+
+            async def run():
+                await server._start_bgsave()
+            asyncio.run(run())
+            self.assertEqual(server.snapshot_info()['last_snapshot_status'], 'ok')
+            reloaded = PersistentRemoteDict(port=8102, filename=filename)
+            self.assertEqual(reloaded._data, {'forkkey': 'forkvalue'})
+        finally:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def test_saves_wait_for_bgsave(self):
+        filename = 'persistent_dict_overlap_test.json'
+        server = PersistentRemoteDict(port=8101, filename=filename)
+        try:
+            async def run():
+                bgsave = server._start_bgsave()
+                await asyncio.sleep(0)  # The background save took its copy of the dataset
+                with self.assertRaises(CommandError):
+                    server._cmd_save([b'SAVE'], [])
+                server._set('late', 'v')  # Saved once the background save ends
+                await bgsave
+            asyncio.run(run())
+            reloaded = PersistentRemoteDict(port=8102, filename=filename)
+            self.assertEqual(reloaded._data, {'late': 'v'})
+            self.assertEqual([name for name in os.listdir('.') if name.startswith(filename + '.')], [])
+        finally:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+
+class TestPersistentBinarySnapshot(unittest.TestCase):
+    filename = 'persistent_dict_snapshot_test.db'
+
+    def setUp(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def test_binary_round_trip(self):
+        server = PersistentExpiringRemoteDict(port=8103, filename=self.filename, snapshot_format='binary')
+        server._set('binsnap1', 'h\u00e9llo')
+        server._set('binsnap2', 'x' * 10000)
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(8), b'RDSNAP02')
+        reloaded = PersistentExpiringRemoteDict(port=8104, filename=self.filename)
+        self.assertEqual(reloaded._data, {'binsnap1': 'h\u00e9llo', 'binsnap2': 'x' * 10000})
+        self.assertEqual(reloaded._expiry, server._expiry)
+
+    def test_json_migrates_to_binary(self):
+        server = PersistentRemoteDict(port=8103, filename=self.filename)
+        server._set('migrate', 'me')
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(1), b'{')
+        migrated = PersistentRemoteDict(port=8104, filename=self.filename, snapshot_format='binary')
+        self.assertEqual(migrated._data, {'migrate': 'me'})
+        migrated._set('another', 'key')
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(8), b'RDSNAP02')
+        reloaded = PersistentRemoteDict(port=8105, filename=self.filename, binary=True)
+        self.assertEqual(reloaded._data, {b'migrate': b'me', b'another': b'key'})
+
+    def test_lazy_load_serves_from_mapping(self):
+        writer = PersistentRemoteDict(port=8103, filename=self.filename, snapshot_format='binary', save=[(3600, 1)])
+        for i in range(25000):
+            writer._set(f'lazy{i}', f'value{i}')
+        writer._save_to_disk()
+        server = PersistentRemoteDict(address="127.0.0.1", port=8106, filename=self.filename,
+                                      snapshot_format='binary', lazy_load=True)
+        self.assertIsInstance(server._data['lazy0'], memoryview)
+        server.start_thread()
+        try:
+            client = redis.Redis(host='127.0.0.1', port=8106, db=0)
+            self.assertEqual(client.get('lazy24999'), b'value24999')
+            client.set('lazy1', 'changed')
+            time.sleep(0.5)
+            self.assertIsNone(server._mapped)
+            self.assertEqual(server._data['lazy0'], 'value0')
+            self.assertEqual(server._data['lazy1'], 'changed')
+            self.assertEqual(client.get('lazy1'), b'changed')
+        finally:
+            server.stop_thread()
+
+
+class TestPersistentExpiringDeltas(unittest.TestCase):
+    filename = 'persistent_dict_delta_test.json'
+
+    @classmethod
+    def remove_files(cls):
+        for name in os.listdir('.'):
+            if name == cls.filename or name.startswith('persistent_dict_delta_test.delta.'):
+                os.remove(name)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.remove_files()
+        cls.server = PersistentExpiringRemoteDict(address="127.0.0.1", port=8133, filename=cls.filename,
+                                                  expiry_seconds=0, deltas=True, delta_flush_interval_ms=50,
+                                                  delta_compact_min_size=20000)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8133, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+        cls.remove_files()
+
+    def reload(self):
+        time.sleep(0.2)  # Wait for the next flush
+        return PersistentExpiringRemoteDict(port=8134, filename=self.filename, expiry_seconds=0, deltas=True)
+
+    def test_writes_are_coalesced(self):
+        saves = []
+        save_to_disk = self.server._save_to_disk
+        self.server._save_to_disk = lambda: saves.append(1) or save_to_disk()
+        delta_size = self.server._deltas.size
+        try:
+            for i in range(200):
+                self.client.set('hot_counter', str(i))
+            self.client.set('expiring', 'v', ex=100)
+            self.client.hset('record', 'field', 'v')
+            self.client.set('deleted', 'v')
+            self.client.delete('deleted')
+        finally:
+            del self.server._save_to_disk
+        self.assertEqual(saves, [])
+        reloaded = self.reload()
+        self.assertEqual(reloaded._data['hot_counter'], '199')
+        self.assertGreater(reloaded._expiry['expiring'], time.time() + 90)
+        self.assertEqual(reloaded._data['record'], ('field', 'v'))
+        self.assertNotIn('deleted', reloaded._data)
+        # One record for the 200 SETs of hot_counter, not 200
+        self.assertLess(self.server._deltas.size - delta_size, 2000)
+        reloaded._deltas.close()
+
+    def test_expired_keys_are_recorded(self):
+        self.client.set('short_lived', 'v', px=100)
+        time.sleep(0.2)
+        self.assertIsNone(self.client.get('short_lived'))
+        reloaded = self.reload()
+        self.assertNotIn('short_lived', reloaded._data)
+        reloaded._deltas.close()
+
+    def test_flushall_and_compaction(self):
+        self.client.set('before_flush', 'v')
+        self.client.flushall()
+        for i in range(300):
+            self.client.set(f'compacted{i}', 'x' * 100)
+        time.sleep(0.5)
+        persistence = self.client.info('persistence')
+        self.assertEqual(persistence['delta_enabled'], 1)
+        # The values alone are 30000 bytes: the older delta files were removed
+        self.assertLess(persistence['delta_size'], 30000)
+        self.assertTrue(os.path.exists(self.filename))
+        reloaded = self.reload()
+        self.assertNotIn('before_flush', reloaded._data)
+        self.assertEqual(len([key for key in reloaded._data if key.startswith('compacted')]), 300)
+        reloaded._deltas.close()
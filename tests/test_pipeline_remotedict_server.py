@@ -0,0 +1,99 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import unittest
+import time
+import redis
+from remotedict import RemoteDict, ExpiringRemoteDict
+
+
+class TestPipelineRemoteDictServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = RemoteDict(address="127.0.0.1", port=8090)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8090, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def test_pipeline_set_and_get(self):
+        pipe = self.client.pipeline(transaction=False)
+        for i in range(1000):
+            pipe.set(f'pipe{i}', f'value{i}')
+        for i in range(1000):
+            pipe.get(f'pipe{i}')
+        results = pipe.execute()
+        self.assertEqual(results[:1000], [True] * 1000)
+        self.assertEqual([r.decode() for r in results[1000:]], [f'value{i}' for i in range(1000)])
+        self.assertEqual(self.client.delete(*[f'pipe{i}' for i in range(1000)]), 1000)
+
+    def test_pipeline_mixed_commands(self):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set('pipe_a', '1')
+        pipe.set('pipe_b', '2')
+        pipe.exists('pipe_a', 'pipe_b', 'pipe_c')
+        pipe.execute_command('FOOBAR')
+        pipe.delete('pipe_a')
+        pipe.get('pipe_a')
+        pipe.get('pipe_b')
+        results = pipe.execute(raise_on_error=False)
+        self.assertEqual(results[:3], [True, True, 2])
+        self.assertIsInstance(results[3], redis.exceptions.ResponseError)
+        self.assertEqual(results[4:], [1, None, b'2'])
+        self.client.delete('pipe_b')
+
+    def test_pipeline_throughput(self):
+        count = 5000
+        start = time.perf_counter()
+        for i in range(count):
+            self.client.set(f'seq{i}', 'x')
+        sequential = count / (time.perf_counter() - start)
+
+        pipe = self.client.pipeline(transaction=False)
+        for i in range(count):
+            pipe.set(f'seq{i}', 'y')
+        start = time.perf_counter()
+        pipe.execute()
+        pipelined = count / (time.perf_counter() - start)
+
+        self.assertGreater(pipelined, sequential)
+        self.assertEqual(self.client.get(f'seq{count - 1}'), b'y')
+        self.client.delete(*[f'seq{i}' for i in range(count)])
+
+
+class TestPipelineSmallBatchServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A tiny batch cap forces every pipeline to be split across batches
+        cls.server = ExpiringRemoteDict(address="127.0.0.1", port=8091, max_batch=7)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8091, db=0)
+        cls.other_client = redis.Redis(host='127.0.0.1', port=8091, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def test_pipeline_split_across_batches(self):
+        pipe = self.client.pipeline(transaction=False)
+        for i in range(500):
+            pipe.set(f'batch{i}', str(i))
+            pipe.get(f'batch{i}')
+        results = pipe.execute()
+        self.assertEqual(results[0::2], [True] * 500)
+        self.assertEqual([r.decode() for r in results[1::2]], [str(i) for i in range(500)])
+
+    def test_other_client_served(self):
+        self.other_client.set('batch_other', 'ok')
+        pipe = self.client.pipeline(transaction=False)
+        for i in range(200):
+            pipe.get('batch_other')
+        self.assertEqual(pipe.execute(), [b'ok'] * 200)
+        self.assertEqual(self.other_client.get('batch_other'), b'ok')
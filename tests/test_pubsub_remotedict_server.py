@@ -0,0 +1,175 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import socket
+import unittest
+import time
+import redis
+from unittest import mock
+from remotedict import RemoteDict, ExpiringRemoteDict
+from remotedict import remotedict as remotedict_module
+from remotedict.client import pack_command
+
+
+class TestPubSub(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = RemoteDict(address="127.0.0.1", port=8143, pubsub_output_buffer_limit=256 * 1024)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8143, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def messages(self, pubsub, count):
+        messages = []
+        for _ in range(count):
+            message = pubsub.get_message(timeout=1)
+            if message is None:
+                break
+            messages.append((message['type'], message['pattern'], message['channel'], message['data']))
+        return messages
+
+    def test_subscribe_and_publish(self):
+        pubsub = self.client.pubsub()
+        pubsub.subscribe('news', 'sport')
+        pubsub.psubscribe('n*')
+        self.assertEqual(self.messages(pubsub, 3), [('subscribe', None, b'news', 1), ('subscribe', None, b'sport', 2),
+                                                    ('psubscribe', None, b'n*', 3)])
+        self.assertEqual(self.client.publish('news', 'hello'), 2)
+        self.assertEqual(self.client.publish('sport', 'goal'), 1)
+        self.assertEqual(self.client.publish('weather', 'rain'), 0)
+        self.assertEqual(self.messages(pubsub, 3), [('message', None, b'news', b'hello'),
+                                                    ('pmessage', b'n*', b'news', b'hello'),
+                                                    ('message', None, b'sport', b'goal')])
+        self.assertEqual(self.client.pubsub_channels(), [b'news', b'sport'])
+        self.assertEqual(self.client.pubsub_numsub('news', 'weather'), [(b'news', 1), (b'weather', 0)])
+        self.assertEqual(self.client.pubsub_numpat(), 1)
+        pubsub.unsubscribe()
+        pubsub.punsubscribe('n*')
+        replies = self.messages(pubsub, 3)
+        self.assertEqual(sorted(reply[:3] for reply in replies), [('punsubscribe', None, b'n*'),
+                                                                  ('unsubscribe', None, b'news'),
+                                                                  ('unsubscribe', None, b'sport')])
+        self.assertEqual([reply[3] for reply in replies], [2, 1, 0])
+        pubsub.close()
+
+    def test_subscribed_mode(self):
+        sock = socket.create_connection(('127.0.0.1', 8143), timeout=5)
+        sock.sendall(pack_command(('UNSUBSCRIBE',)) + pack_command(('SUBSCRIBE', 'c')) + pack_command(('GET', 'k')) +
+                     pack_command(('PING',)))
+        expected = (b'*3\r\n$11\r\nunsubscribe\r\n$-1\r\n:0\r\n*3\r\n$9\r\nsubscribe\r\n$1\r\nc\r\n:1\r\n'
+                    b"-ERR Can't execute 'get': only (P)SUBSCRIBE / (P)UNSUBSCRIBE / PING are allowed in this "
+                    b"context\r\n*2\r\n$4\r\npong\r\n$0\r\n\r\n")
+        data = b''
+        while len(data) < len(expected):
+            data += sock.recv(4096)
+        self.assertEqual(data, expected)
+        self.assertEqual([info['flags'] for info in self.client.client_list() if info['sub'] == '1'], ['P'])
+        sock.close()
+        time.sleep(0.1)
+        self.assertEqual(self.client.pubsub_numsub('c'), [(b'c', 0)])
+        self.assertEqual(self.client.ping(), True)
+
+    def test_message_encoded_once(self):
+        subscribers = [self.client.pubsub() for _ in range(3)]
+        for pubsub in subscribers:
+            pubsub.subscribe('fanout')
+            self.messages(pubsub, 1)
+        with mock.patch.object(remotedict_module, 'encode_message', wraps=remotedict_module.encode_message) as encode:
+            self.assertEqual(self.client.publish('fanout', 'x'), 3)
+        self.assertEqual(encode.call_count, 1)
+        for pubsub in subscribers:
+            self.assertEqual(self.messages(pubsub, 1), [('message', None, b'fanout', b'x')])
+            pubsub.close()
+
+    def test_slow_subscriber_is_dropped(self):
+        slow = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        slow.connect(('127.0.0.1', 8143))
+        slow.sendall(pack_command(('SUBSCRIBE', 'firehose')))
+        time.sleep(0.1)
+        before = self.client.info('stats')['client_output_buffer_limit_disconnections']
+        message = b'x' * 16384
+        receivers = [self.client.publish('firehose', message) for _ in range(200)]
+        # The subscriber never reads: once its unsent messages pass the limit it is dropped
+        self.assertEqual(receivers[0], 1)
+        self.assertEqual(receivers[-1], 0)
+        self.assertEqual(self.client.info('stats')['client_output_buffer_limit_disconnections'], before + 1)
+        time.sleep(0.1)
+        self.assertEqual(self.client.pubsub_numsub('firehose'), [(b'firehose', 0)])
+        slow.close()
+
+
+class TestKeyspaceNotifications(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ExpiringRemoteDict(address="127.0.0.1", port=8144, expiry_seconds=0, notify_keyspace_events='KEA')
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8144, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def events(self, pubsub):
+        events = []
+        while True:
+            message = pubsub.get_message(timeout=0.5)
+            if message is None:
+                return events
+            if message['type'] == 'pmessage':
+                events.append((message['channel'], message['data']))
+
+    def test_events(self):
+        pubsub = self.client.pubsub()
+        pubsub.psubscribe('__keyspace@0__:*', '__keyevent@0__:*')
+        self.client.set('a', '1')
+        self.client.hset('h', mapping={'f': 'v', 'g': 'w'})
+        self.client.hdel('h', 'f')
+        self.client.hdel('h', 'g')
+        self.client.delete('a', 'missing')
+        self.client.set('short', 'v', px=50)
+        time.sleep(0.3)  # Expired by the active expiry cycle
+        self.client.flushdb()
+        self.assertEqual(self.events(pubsub), [
+            (b'__keyspace@0__:a', b'set'), (b'__keyevent@0__:set', b'a'),
+            (b'__keyspace@0__:h', b'hset'), (b'__keyevent@0__:hset', b'h'),
+            (b'__keyspace@0__:h', b'hdel'), (b'__keyevent@0__:hdel', b'h'),
+            (b'__keyspace@0__:h', b'hdel'), (b'__keyevent@0__:hdel', b'h'),
+            (b'__keyspace@0__:h', b'del'), (b'__keyevent@0__:del', b'h'),
+            (b'__keyspace@0__:a', b'del'), (b'__keyevent@0__:del', b'a'),
+            (b'__keyspace@0__:short', b'set'), (b'__keyevent@0__:set', b'short'),
+            (b'__keyspace@0__:short', b'expired'), (b'__keyevent@0__:expired', b'short'),
+            (b'__keyevent@0__:flushdb', b'0'),
+        ])
+        pubsub.close()
+
+    def test_event_kinds(self):
+        server = RemoteDict(address="127.0.0.1", port=8145, maxkeys=1, maxmemory_policy='allkeys-lru',
+                            notify_keyspace_events='Ee')
+        server.start_thread()
+        time.sleep(1)
+        client = redis.Redis(host='127.0.0.1', port=8145, db=0)
+        pubsub = client.pubsub()
+        pubsub.psubscribe('*')
+        client.set('a', '1')
+        client.set('b', '2')  # Evicts a
+        client.delete('b')
+        self.assertEqual(self.events(pubsub), [(b'__keyevent@0__:evicted', b'a')])
+        pubsub.close()
+        client.close()
+        server.stop_thread()
+        time.sleep(0.1)
+        with self.assertRaises(ValueError):
+            RemoteDict(notify_keyspace_events='KZ')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,10 +4,17 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../s
 
 import unittest
 import asyncio
+import importlib.util
+import shutil
+import socket
+import stat
+import tempfile
 import time
 import threading
 import redis
 from remotedict import RemoteDict
+from remotedict.remotedict import command
+from remotedict.resp import MAX_HEADER_LENGTH, ProtocolError, RequestParser, write_bulk
 
 
 class TestRemoteDictServer(unittest.TestCase):
@@ -60,6 +67,33 @@ class TestRemoteDictServer(unittest.TestCase):
         result = self.client.get(key)
         self.assertEqual(result.decode(), value)
 
+    def test_large_value(self):
+        # Larger than the server's read size, so the value spans many reads
+        key = 'largekey'
+        value = 'v' * 300000
+        self.client.set(key, value)
+        self.assertEqual(self.client.get(key).decode(), value)
+        self.client.delete(key)
+
+    def test_non_ascii_value(self):
+        # The bulk length must count bytes, not characters
+        key = 'unicodekey'
+        value = 'h\u00e9llo w\u00f6rld \u2603'
+        self.client.set(key, value)
+        self.assertEqual(self.client.get(key).decode(), value)
+        self.client.delete(key)
+
+    def test_pipelined_commands(self):
+        pipe = self.client.pipeline(transaction=False)
+        for i in range(100):
+            pipe.set(f'pipekey{i}', str(i))
+        for i in range(100):
+            pipe.get(f'pipekey{i}')
+        results = pipe.execute()
+        self.assertEqual(results[:100], [True] * 100)
+        self.assertEqual([r.decode() for r in results[100:]], [str(i) for i in range(100)])
+        self.client.delete(*[f'pipekey{i}' for i in range(100)])
+
     def test_unknown_command(self):
         # Send a truly unknown command and expect a ResponseError
         with self.assertRaises(redis.exceptions.ResponseError):
@@ -198,3 +232,305 @@ class TestRemoteDictServerThreaded(unittest.TestCase):
         self.assertEqual(self.client.exists('x', 'y'), 2)
         self.client.flushall()
         self.assertEqual(self.client.exists('x', 'y'), 0)
+
+    def test_mget_mset(self):
+        self.assertTrue(self.client.mset({'mkey1': 'a', 'mkey2': 'b', 'mkey3': 'c'}))
+        self.assertEqual(self.client.mget('mkey1', 'missing', 'mkey3', 'mkey2'), [b'a', None, b'c', b'b'])
+        self.assertFalse(self.client.msetnx({'mkey3': 'x', 'mkey4': 'd'}))
+        self.assertIsNone(self.client.get('mkey4'))
+        self.assertTrue(self.client.msetnx({'mkey4': 'd', 'mkey5': 'e'}))
+        self.assertEqual(self.client.mget('mkey4', 'mkey5'), [b'd', b'e'])
+        with self.assertRaises(redis.exceptions.ResponseError):
+            self.client.execute_command('MSET', 'mkey1', 'a', 'mkey2')
+        self.client.delete('mkey1', 'mkey2', 'mkey3', 'mkey4', 'mkey5')
+
+    def test_counters(self):
+        self.assertEqual(self.client.incr('counter'), 1)
+        self.assertEqual(self.client.incrby('counter', 10), 11)
+        self.assertEqual(self.client.decr('counter'), 10)
+        self.assertEqual(self.client.decrby('counter', 15), -5)
+        self.assertIs(type(self.server._data['counter']), int)
+        self.assertEqual(self.client.get('counter'), b'-5')
+        self.client.set('counter', '41')
+        self.assertEqual(self.client.incr('counter'), 42)
+        self.client.set('counter', str(2 ** 63 - 1))
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, 'overflow'):
+            self.client.incr('counter')
+        for bad in ('abc', ' 1', '01', '+1', '1.5', ''):
+            self.client.set('counter', bad)
+            with self.assertRaisesRegex(redis.exceptions.ResponseError, 'not an integer'):
+                self.client.incr('counter')
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, 'not an integer'):
+            self.client.incrby('counter2', '1x')
+        self.assertEqual(self.client.mget('counter', 'counter2'), [b'', None])
+        self.client.delete('counter')
+
+    def test_incrbyfloat(self):
+        self.assertEqual(self.client.incrbyfloat('float', 10.5), 10.5)
+        self.assertEqual(self.client.incrbyfloat('float', 0.1), 10.6)
+        self.assertEqual(self.client.incrbyfloat('float', -5.6), 5.0)
+        self.assertEqual(self.client.get('float'), b'5')
+        self.assertEqual(self.client.incr('float'), 6)
+        self.client.incrbyfloat('float', '5.0e3')
+        self.assertEqual(self.client.get('float'), b'5006')
+        self.client.incrbyfloat('bigfloat', '1e20')
+        self.assertEqual(self.client.get('bigfloat'), b'100000000000000000000')
+        for bad in ('abc', 'nan', 'inf', ' 1', '1_0'):
+            with self.assertRaisesRegex(redis.exceptions.ResponseError, 'not a valid float'):
+                self.client.incrbyfloat('float', bad)
+        self.client.incrbyfloat('bigfloat', 1.7e308)
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, 'NaN or Infinity'):
+            self.client.incrbyfloat('bigfloat', 1.7e308)
+        self.client.delete('float', 'bigfloat')
+
+    def test_command_names_are_case_insensitive(self):
+        self.client.set('casekey', 'v')
+        self.assertEqual(self.client.execute_command('get', 'casekey'), b'v')
+        self.assertEqual(self.client.execute_command('GeT', 'casekey'), b'v')
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, 'wrong number of arguments'):
+            self.client.execute_command('GET', 'casekey', 'extra')
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, 'unknown command'):
+            self.client.execute_command('NOSUCHCOMMAND')
+        self.client.delete('casekey')
+
+    def test_command(self):
+        commands = self.client.command()
+        self.assertEqual(self.client.command_count(), len(commands))
+        self.assertEqual(commands['get']['arity'], 2)
+        self.assertEqual(commands['mset']['step_count'], 2)
+        self.assertIn('write', commands['set']['flags'])
+        info = self.client.execute_command('COMMAND', 'INFO', 'del')
+        self.assertEqual(info['del']['last_key_pos'], -1)
+
+    def test_scan(self):
+        keys = {f'scan:{i}' for i in range(250)}
+        for key in keys:
+            self.client.set(key, 'v')
+        self.client.set('other', 'v')
+        found = []
+        cursor = 0
+        while True:
+            cursor, batch = self.client.scan(cursor, match='scan:*', count=20)
+            found.extend(k.decode() for k in batch)
+            # Keys written or deleted mid-scan do not disturb the others
+            self.client.set(f'scan:new{cursor}', 'v')
+            self.client.delete('other')
+            if cursor == 0:
+                break
+        self.assertTrue(keys.issubset(found))
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(set(self.client.scan_iter(match='scan:1?')), {f'scan:{i}'.encode() for i in range(10, 20)})
+        self.client.delete(*self.client.keys('scan:*'))
+        with self.assertRaises(redis.exceptions.ResponseError):
+            self.client.scan(cursor=12345)
+
+    def test_keys_in_chunks(self):
+        self.server._keys_chunk = 50
+        try:
+            for i in range(500):
+                self.client.set(f'chunked:{i:03}', 'v')
+            self.assertEqual(self.client.keys('chunked:*'), [f'chunked:{i:03}'.encode() for i in range(500)])
+            self.assertEqual(self.client.keys('chunked:4?9'), [f'chunked:4{i}9'.encode() for i in range(10)])
+            self.assertEqual(self.client.delete(*[f'chunked:{i:03}' for i in range(500)]), 500)
+            self.assertEqual(self.client.keys('chunked:*'), [])
+        finally:
+            self.server._keys_chunk = 10000
+
+    def test_pipelined_keys_runs_before_the_next_commands(self):
+        self.server._keys_chunk = 50
+        try:
+            for i in range(500):
+                self.client.set(f'ordered:{i:03}', 'v')
+            pipe = self.client.pipeline(transaction=False)
+            pipe.keys('ordered:*')
+            pipe.set('ordered:new', 'v')
+            pipe.delete(*[f'ordered:{i:03}' for i in range(500)])
+            keys, _, deleted = pipe.execute()
+            self.assertEqual(keys, [f'ordered:{i:03}'.encode() for i in range(500)])
+            self.assertEqual(deleted, 500)
+            self.client.delete('ordered:new')
+        finally:
+            self.server._keys_chunk = 10000
+
+    def test_invalid_lengths_close_the_connection(self):
+        for request in (b'*1\r\n$-12\r\n', b'*-5\r\n', b'*1\r\n$536870913\r\n'):
+            sock = socket.create_connection(('127.0.0.1', 8086), timeout=5)
+            sock.sendall(request)
+            data = b''
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+            sock.close()
+            self.assertTrue(data.startswith(b'-ERR Protocol error: invalid'), data)
+            self.assertEqual(data.count(b'\r\n'), 1)
+        self.assertTrue(self.client.ping())
+
+    def test_failed_command_in_pipeline_gets_its_own_reply(self):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set('pipedkey', 'v')
+        pipe.get(b'\xff')
+        pipe.get('pipedkey')
+        ok, error, value = pipe.execute(raise_on_error=False)
+        self.assertTrue(ok)
+        self.assertIsInstance(error, redis.exceptions.ResponseError)
+        self.assertIn('invalid UTF-8', str(error))
+        self.assertEqual(value, b'v')
+        self.client.delete('pipedkey')
+
+
+class TestRequestParser(unittest.TestCase):
+    def test_commands_split_anywhere(self):
+        data = b'*2\r\n$3\r\nGET\r\n$1\r\nk\r\n*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$0\r\n\r\n'
+        parser = RequestParser()
+        commands = []
+        for i in range(len(data)):
+            parser.feed(data[i:i + 1])
+            commands += parser.parse()
+        self.assertEqual(commands, [[b'GET', b'k'], [b'SET', b'k', b'']])
+        self.assertEqual(len(parser), 0)
+
+    def test_invalid_lengths(self):
+        for request in (b'*1\r\n$-12\r\n', b'*1\r\n$-1\r\n', b'*-1\r\n', b'*1\r\n$536870913\r\n',
+                        b'*2147483648\r\n', b'*1\r\n$x\r\n'):
+            parser = RequestParser()
+            parser.feed(request)
+            with self.assertRaises(ProtocolError):
+                parser.parse()
+
+    def test_pending_bulk_length(self):
+        parser = RequestParser()
+        parser.feed(b'*1\r\n$100\r\nabc')
+        self.assertEqual(parser.parse(), [])
+        self.assertEqual(parser.pending, 99)
+
+    def test_partial_command_is_resumed(self):
+        parser = RequestParser()
+        parser.feed(b'*1\r\n$4\r\nPING\r\n*4\r\n$4\r\nMSET\r\n$1\r\na\r\n$1')
+        self.assertEqual(parser.parse(), [[b'PING']])
+        # The arguments already parsed are kept, not parsed again
+        self.assertEqual(parser._partial, ([b'MSET', b'a'], 4, 21))
+        parser.feed(b'\r\n1\r\n$1\r\n')
+        self.assertEqual(parser.parse(limit=1), [])
+        self.assertEqual(parser._partial, ([b'MSET', b'a', b'1'], 4, 28))
+        parser.feed(b'2\r\n')
+        self.assertEqual(parser.parse(), [[b'MSET', b'a', b'1', b'2']])
+        self.assertIsNone(parser._partial)
+        self.assertEqual(len(parser), 0)
+
+    def test_header_line_limit(self):
+        for request in (b'*' + b'1' * (MAX_HEADER_LENGTH + 1), b'*1\r\n$' + b'1' * (MAX_HEADER_LENGTH + 1)):
+            parser = RequestParser()
+            parser.feed(request[:MAX_HEADER_LENGTH])
+            self.assertEqual(parser.parse(), [])
+            parser.feed(request[MAX_HEADER_LENGTH:])
+            with self.assertRaises(ProtocolError):
+                parser.parse()
+
+
+class EchoRemoteDict(RemoteDict):
+    @command('echo', 2, ('fast',))
+    def _cmd_echo(self, args, out):
+        write_bulk(out, args[1])
+
+
+class TestRemoteDictSubclassCommands(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = EchoRemoteDict(address="127.0.0.1", port=8113)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8113, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def test_registered_command(self):
+        self.assertEqual(self.client.echo('hello'), b'hello')
+        self.assertIn('echo', self.client.command())
+        self.client.set('echokey', 'v')
+        self.assertEqual(self.client.get('echokey'), b'v')
+
+    def test_not_registered_on_base_class(self):
+        self.assertNotIn(b'ECHO', RemoteDict(port=0)._commands)
+
+
+class TestRemoteDictServerBinary(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = RemoteDict(address="127.0.0.1", port=8092, binary=True)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8092, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def test_binary_key_and_value(self):
+        key = b'bin\xff\x00key'
+        value = bytes(range(256)) * 16
+        self.client.set(key, value)
+        self.assertEqual(self.client.get(key), value)
+        self.assertEqual(self.client.exists(key), 1)
+        self.assertIn(key, self.client.keys(b'bin*'))
+        self.assertEqual(self.client.delete(key), 1)
+        self.assertIsNone(self.client.get(key))
+
+    def test_values_stored_as_bytes(self):
+        self.client.set('storedkey', 'h\u00e9llo')
+        self.assertEqual(self.server._data[b'storedkey'], 'h\u00e9llo'.encode())
+        self.assertEqual(self.client.get('storedkey').decode(), 'h\u00e9llo')
+        self.client.delete('storedkey')
+
+    def test_unknown_command(self):
+        with self.assertRaises(redis.exceptions.ResponseError):
+            self.client.execute_command('FOOBAR')
+
+
+class TestRemoteDictServerSockets(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.socket_path = os.path.join(tempfile.mkdtemp(prefix='remotedict-test-'), 'server.sock')
+        cls.server = RemoteDict(address="127.0.0.1", port=8117, unix_socket=cls.socket_path, unix_socket_perm=0o700,
+                                tcp_nodelay=False, tcp_backlog=64, rcvbuf=1 << 20, event_loop='auto')
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8117, db=0)
+        cls.unix_client = redis.Redis(unix_socket_path=cls.socket_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+        shutil.rmtree(os.path.dirname(cls.socket_path), ignore_errors=True)
+
+    def test_tcp_and_unix_socket_share_data(self):
+        self.client.set('sockkey', 'v')
+        self.assertEqual(self.unix_client.get('sockkey'), b'v')
+        self.assertEqual(stat.S_IMODE(os.stat(self.socket_path).st_mode), 0o700)
+
+    def test_info_reports_loop_and_socket(self):
+        info = self.unix_client.info('server')
+        self.assertEqual(info['unixsocket'], self.socket_path)
+        self.assertEqual(info['multiplexing_api'], 'uvloop' if importlib.util.find_spec('uvloop') else 'asyncio')
+
+    def test_unix_socket_only(self):
+        path = os.path.join(os.path.dirname(self.socket_path), 'only.sock')
+        server = RemoteDict(port=0, unix_socket=path)
+        server.start_thread()
+        try:
+            client = redis.Redis(unix_socket_path=path)
+            self.assertTrue(client.set('k', 'v'))
+            self.assertIsNone(server._server)
+        finally:
+            server.stop_thread()
+        self.assertFalse(os.path.exists(path))
+
+    def test_unknown_event_loop(self):
+        with self.assertRaises(ValueError):
+            RemoteDict(port=8118, event_loop='trio')
@@ -0,0 +1,208 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import unittest
+import time
+import redis
+from remotedict import RemoteDict, ExpiringRemoteDict
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class TestReplication(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.primary = RemoteDict(address="127.0.0.1", port=8121)
+        cls.primary.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8121, db=0)
+        cls.client.set('before', 'snapshot')
+        cls.replica = RemoteDict(address="127.0.0.1", port=8122, replicaof=('127.0.0.1', 8121))
+        cls.replica.start_thread()
+        time.sleep(1)
+        cls.replica_client = redis.Redis(host='127.0.0.1', port=8122, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.replica.stop_thread()
+        cls.primary.stop_thread()
+        time.sleep(0.1)
+
+    def test_initial_snapshot(self):
+        self.assertTrue(wait_for(lambda: self.replica_client.get('before') == b'snapshot'))
+
+    def test_write_stream(self):
+        self.client.set('streamed', '1')
+        self.client.mset({'m1': 'a', 'm2': 'b'})
+        self.client.delete('m1')
+        self.assertTrue(wait_for(lambda: self.replica_client.get('streamed') == b'1'))
+        self.assertTrue(wait_for(lambda: self.replica_client.mget('m1', 'm2') == [None, b'b']))
+        self.assertEqual(self.replica_client.exists('m2'), 1)
+        self.assertIn(b'm2', self.replica_client.keys('m*'))
+
+    def test_counters(self):
+        self.client.incrby('replicated_counter', 5)
+        self.client.incrbyfloat('replicated_counter', 0.5)
+        self.assertTrue(wait_for(lambda: self.replica_client.get('replicated_counter') == b'5.5'))
+
+    def test_replica_is_read_only(self):
+        with self.assertRaises(redis.exceptions.ReadOnlyError):
+            self.replica_client.set('nope', '1')
+        with self.assertRaises(redis.exceptions.ReadOnlyError):
+            self.replica_client.delete('before')
+
+    def test_info_and_offsets(self):
+        self.client.set('offset', '1')
+        primary = self.client.info('replication')
+        self.assertEqual(primary['role'], 'master')
+        self.assertEqual(primary['connected_slaves'], 1)
+        self.assertEqual(primary['slave0']['port'], 8122)
+        self.assertTrue(wait_for(lambda: self.replica_client.info('replication')['slave_repl_offset'] ==
+                                 self.client.info('replication')['master_repl_offset']))
+        replica = self.replica_client.info('replication')
+        self.assertEqual(replica['role'], 'slave')
+        self.assertEqual(replica['master_link_status'], 'up')
+        self.assertEqual(replica['master_replid'], primary['master_replid'])
+
+    def test_reconnects_after_link_drops(self):
+        syncs = self.replica._replica_link.full_syncs
+        replica_id = next(int(entry['id']) for entry in self.client.client_list() if entry['flags'] == 'S')
+        self.client.client_kill_filter(_id=replica_id)
+        self.client.set('after_resync', '1')
+        self.assertTrue(wait_for(lambda: self.replica._replica_link.full_syncs == syncs + 1))
+        self.assertTrue(wait_for(lambda: self.replica_client.get('after_resync') == b'1'))
+
+
+class TestBinaryPrimaryReplication(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.primary = RemoteDict(address="127.0.0.1", port=8146, binary=True)
+        cls.primary.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8146, db=0)
+        cls.replica = RemoteDict(address="127.0.0.1", port=8147, replicaof=('127.0.0.1', 8146))
+        cls.replica.start_thread()
+        time.sleep(1)
+        cls.replica_client = redis.Redis(host='127.0.0.1', port=8147, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.replica.stop_thread()
+        cls.primary.stop_thread()
+        time.sleep(0.1)
+
+    def test_non_utf8_values_keep_the_link_up(self):
+        self.client.set('raw', b'\xff\xfe')
+        self.client.set('after_raw', '1')
+        self.assertTrue(wait_for(lambda: self.replica_client.get('after_raw') == b'1'))
+        self.assertEqual(self.replica_client.get('raw'), b'\xff\xfe')
+        self.assertEqual(self.replica._replica_link.full_syncs, 1)
+
+
+class TestChainedReplication(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.primary = RemoteDict(address="127.0.0.1", port=8148)
+        cls.primary.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8148, db=0)
+        cls.replica = RemoteDict(address="127.0.0.1", port=8149, replicaof=('127.0.0.1', 8148))
+        cls.replica.start_thread()
+        time.sleep(1)
+        cls.sub_replica = RemoteDict(address="127.0.0.1", port=8151, replicaof=('127.0.0.1', 8149))
+        cls.sub_replica.start_thread()
+        time.sleep(1)
+        cls.sub_replica_client = redis.Redis(host='127.0.0.1', port=8151, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sub_replica.stop_thread()
+        cls.replica.stop_thread()
+        cls.primary.stop_thread()
+        time.sleep(0.1)
+
+    def test_writes_reach_replicas_of_replicas(self):
+        self.client.set('chained', '1')
+        self.client.set('chained', '2')
+        self.assertTrue(wait_for(lambda: self.sub_replica_client.get('chained') == b'2'))
+        self.assertEqual(self.replica._data.get('chained'), '2')
+        self.assertEqual(self.replica._replica_link.full_syncs, 1)
+
+
+class TestExpiringReplication(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.primary = ExpiringRemoteDict(address="127.0.0.1", port=8123, expiry_seconds=0)
+        cls.primary.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8123, db=0)
+        cls.client.set('ttlkey', 'v', ex=100)
+        cls.replica = ExpiringRemoteDict(address="127.0.0.1", port=8124, expiry_seconds=0,
+                                         replicaof=('127.0.0.1', 8123))
+        cls.replica.start_thread()
+        time.sleep(1)
+        cls.replica_client = redis.Redis(host='127.0.0.1', port=8124, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.replica.stop_thread()
+        cls.primary.stop_thread()
+        time.sleep(0.1)
+
+    def test_snapshot_keeps_deadlines(self):
+        self.assertTrue(wait_for(lambda: self.replica_client.exists('ttlkey') == 1))
+        self.assertTrue(90 < self.replica_client.ttl('ttlkey') <= 100)
+
+    def test_expired_keys_are_deleted(self):
+        self.client.set('shortlived', 'v', px=200)
+        self.client.set('kept', 'v')
+        self.client.expire('kept', 100)
+        self.client.persist('kept')
+        self.assertTrue(wait_for(lambda: self.replica_client.get('shortlived') == b'v', timeout=1))
+        time.sleep(0.5)
+        # Removed from memory, not just hidden by the read path
+        self.assertNotIn('shortlived', self.replica._data)
+        self.assertEqual(self.replica_client.ttl('kept'), -1)
+
+
+class TestReplicaOfCommand(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.primary = RemoteDict(address="127.0.0.1", port=8125)
+        cls.other = RemoteDict(address="127.0.0.1", port=8126)
+        cls.primary.start_thread()
+        cls.other.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8125, db=0)
+        cls.other_client = redis.Redis(host='127.0.0.1', port=8126, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.other.stop_thread()
+        cls.primary.stop_thread()
+        time.sleep(0.1)
+
+    def test_replicaof_and_promotion(self):
+        self.client.set('shared', 'primary')
+        self.other_client.set('local', 'dropped')
+        self.assertTrue(self.other_client.replicaof('127.0.0.1', 8125))
+        self.assertTrue(wait_for(lambda: self.other_client.get('shared') == b'primary'))
+        self.assertIsNone(self.other_client.get('local'))
+        self.assertTrue(self.other_client.replicaof('NO', 'ONE'))
+        self.assertEqual(self.other_client.info('replication')['role'], 'master')
+        self.assertTrue(self.other_client.set('local', 'writable'))
+        self.client.set('shared', 'changed')
+        time.sleep(0.3)
+        self.assertEqual(self.other_client.get('shared'), b'primary')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import socket
+import unittest
+import time
+import redis
+from remotedict import ExpiringRemoteDict, ShardedRemoteDict
+
+
+@unittest.skipUnless(hasattr(socket, 'SO_REUSEPORT') and hasattr(socket, 'AF_UNIX'),
+                     'sharded mode needs SO_REUSEPORT and Unix sockets')
+class TestShardedRemoteDictServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ShardedRemoteDict(address="127.0.0.1", port=8096, workers=3, dict_class=ExpiringRemoteDict)
+        cls.server.start_workers()
+        time.sleep(0.5)
+        cls.client = redis.Redis(host='127.0.0.1', port=8096, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_workers()
+        time.sleep(0.1)
+
+    def fresh_clients(self, count=8):
+        # Each new connection may land on a different worker
+        return [redis.Redis(host='127.0.0.1', port=8096, db=0, single_connection_client=True) for _ in range(count)]
+
+    def test_set_and_get_across_workers(self):
+        for i in range(50):
+            self.client.set(f'shardkey{i}', f'value{i}')
+        for client in self.fresh_clients():
+            self.assertEqual([client.get(f'shardkey{i}') for i in range(50)],
+                             [f'value{i}'.encode() for i in range(50)])
+            client.close()
+        self.client.delete(*[f'shardkey{i}' for i in range(50)])
+
+    def test_pipeline_across_workers(self):
+        pipe = self.client.pipeline(transaction=False)
+        for i in range(300):
+            pipe.set(f'shardpipe{i}', str(i))
+            pipe.get(f'shardpipe{i}')
+        results = pipe.execute()
+        self.assertEqual([r.decode() for r in results[1::2]], [str(i) for i in range(300)])
+        self.assertEqual(self.client.delete(*[f'shardpipe{i}' for i in range(300)]), 300)
+
+    def test_multi_key_commands(self):
+        keys = [f'shardmulti{i}' for i in range(20)]
+        for key in keys:
+            self.client.set(key, 'x')
+        for client in self.fresh_clients(4):
+            self.assertEqual(client.exists(*keys, 'nonexistent'), 20)
+            self.assertEqual(sorted(k.decode() for k in client.keys('shardmulti*')), sorted(keys))
+            client.close()
+        self.assertEqual(self.client.delete(*keys, 'nonexistent'), 20)
+        self.assertEqual(self.client.exists(*keys), 0)
+
+    def test_flushall(self):
+        for i in range(20):
+            self.client.set(f'shardflush{i}', 'x')
+        self.client.flushall()
+        for client in self.fresh_clients(4):
+            self.assertEqual(client.keys('*'), [])
+            client.close()
+
+    def test_mget_mset_across_workers(self):
+        mapping = {f'shardm{i}': str(i) for i in range(30)}
+        self.assertTrue(self.client.mset(mapping))
+        keys = list(mapping)[::-1] + ['nonexistent']
+        for client in self.fresh_clients(3):
+            self.assertEqual(client.mget(keys), [mapping[k].encode() for k in keys[:-1]] + [None])
+            client.close()
+        with self.assertRaises(redis.exceptions.ResponseError):
+            self.client.msetnx({'shardnx1': '1', 'shardnx2': '2', 'shardnx3': '3', 'shardnx4': '4'})
+        self.assertTrue(self.client.msetnx({'shardnx1': '1'}))
+        self.assertFalse(self.client.msetnx({'shardnx1': '1'}))
+        self.client.delete(*mapping, 'shardnx1')
+
+    def test_scan_across_workers(self):
+        keys = {f'shardscan{i}'.encode() for i in range(100)}
+        for key in keys:
+            self.client.set(key, 'x')
+        for client in self.fresh_clients(3):
+            self.assertEqual(set(client.scan_iter(match='shardscan*', count=7)), keys)
+            client.close()
+        self.client.delete(*keys)
+
+    def test_unknown_command(self):
+        with self.assertRaises(redis.exceptions.ResponseError):
+            self.client.execute_command('FOOBAR')
+
+    def test_publish_across_workers(self):
+        subscribers = [redis.Redis(host='127.0.0.1', port=8096, db=0).pubsub() for _ in range(4)]
+        for pubsub in subscribers:
+            pubsub.subscribe('shardnews')
+            self.assertEqual(pubsub.get_message(timeout=1)['type'], 'subscribe')
+        self.assertEqual(self.client.publish('shardnews', 'x'), 4)
+        for pubsub in subscribers:
+            self.assertEqual(pubsub.get_message(timeout=1)['data'], b'x')
+            pubsub.close()
+
+    def test_client_tracking_is_rejected(self):
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, 'more than one shard'):
+            self.client.execute_command('CLIENT', 'TRACKING', 'ON')
@@ -0,0 +1,94 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import unittest
+import time
+import redis
+from remotedict import RemoteDict, ExpiringRemoteDict
+
+
+class TestStatsRemoteDictServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ExpiringRemoteDict(address="127.0.0.1", port=8114, slowlog_log_slower_than=0,
+                                        slowlog_max_len=5)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8114, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def test_info_sections(self):
+        self.client.set('statskey', 'v')
+        info = self.client.info()
+        self.assertEqual(info['server_class'], 'ExpiringRemoteDict')
+        self.assertGreaterEqual(info['connected_clients'], 1)
+        self.assertGreater(info['total_commands_processed'], 0)
+        self.assertGreater(info['total_net_input_bytes'], 0)
+        self.assertIn('expired_keys', info)
+        self.assertEqual(info['db0']['keys'], 1)
+        self.assertEqual(info['db0']['expires'], 1)
+        self.assertNotIn('cmdstat_set', info)
+        self.assertEqual(set(self.client.info('keyspace')), {'db0'})
+        self.client.delete('statskey')
+
+    def test_commandstats(self):
+        for _ in range(10):
+            self.client.get('statsmissing')
+        stats = self.client.info('commandstats')
+        self.assertGreaterEqual(stats['cmdstat_get']['calls'], 10)
+        self.assertIn('latency_percentiles_usec_get', self.client.info('latencystats'))
+        with self.assertRaises(redis.exceptions.ResponseError):
+            self.client.execute_command('EXPIRE', 'statskey', 'notanumber')
+        self.assertGreaterEqual(self.client.info('commandstats')['cmdstat_expire']['failed_calls'], 1)
+
+    def test_latency_histogram(self):
+        self.client.set('histkey', 'v')
+        reply = self.client.execute_command('LATENCY', 'HISTOGRAM', 'set')
+        self.assertEqual(reply[0], b'set')
+        fields = reply[1]
+        self.assertEqual(fields[0], b'calls')
+        histogram = fields[3]
+        # Cumulative counts, ending at the number of calls
+        self.assertEqual(histogram[-1], fields[1])
+        self.client.delete('histkey')
+
+    def test_slowlog(self):
+        self.client.slowlog_reset()
+        self.client.set('slowkey', 'v')
+        entries = self.client.slowlog_get(1)
+        self.assertEqual(entries[0]['command'], b'SET slowkey v')
+        for _ in range(10):
+            self.client.get('slowkey')
+        self.assertEqual(self.client.slowlog_len(), 5)
+        self.client.slowlog_reset()
+        self.assertLessEqual(self.client.slowlog_len(), 1)
+        self.client.delete('slowkey')
+
+
+class TestStatsDisabled(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = RemoteDict(address="127.0.0.1", port=8115, stats=False)
+        cls.server.start_thread()
+        time.sleep(1)
+        cls.client = redis.Redis(host='127.0.0.1', port=8115, db=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop_thread()
+        time.sleep(0.1)
+
+    def test_info_without_counters(self):
+        self.client.set('k', 'v')
+        info = self.client.info('all')
+        self.assertEqual(info['stats_enabled'], 0)
+        self.assertNotIn('total_commands_processed', info)
+        self.assertEqual(info['db0']['keys'], 1)
+        with self.assertRaises(redis.exceptions.ResponseError):
+            self.client.slowlog_get()
+        self.client.delete('k')